@@ -0,0 +1,123 @@
+"""
+ベンチマーク用の架空の楽曲データの生成
+
+クリエイターは少数の人気の名義に偏る（Zipf 分布）ようにし、キー・コードの割合・歌詞のベクトルも実際のデータに近い分布で作る。
+同じ seed からは常に同じデータを作る。
+"""
+
+import os
+import random
+from typing import Optional
+
+from src.db.songs_database import SongsDatabase
+from src.utils.songs import Song, SongsStats
+
+VOCALS = ["初音ミク", "可不", "重音テトSV", "GUMI", "鏡音リン", "鏡音レン", "巡音ルカ", "IA", "v flower", "星界", "裏命", "知声"]
+TITLE_WORDS = [
+    "夜", "花", "未来", "ハート", "ロンリー", "アイ", "東京", "シンデレラ", "メランコリー", "ワールド", "Dream", "Night",
+    "Love", "Star", "ネオン", "少女", "ノイズ", "サイダー", "モザイク", "ルーム", "ライト", "ゴースト", "パレード", "ブルー",
+]  # fmt: skip
+MAIN_CHORDS = ["6451", "4561", "1564", "61451", "4536", "2511", ""]
+# 長調は 60〜71、短調は負の値（-57〜-68）で表す
+MAIN_KEYS = list(range(60, 72)) + [-key for key in range(57, 69)]
+# 2015-01-01 〜 2025-01-01（UTC）
+PUBLISHED_RANGE = (1420070400, 1735689600)
+LYRICS_DIMENSION = 128
+
+
+def zipf_weights(count: int, exponent: float = 1.1) -> list[float]:
+    return [1 / (rank**exponent) for rank in range(1, count + 1)]
+
+
+class CatalogGenerator:
+    def __init__(self, seed: int = 0, lyrics_dimension: int = LYRICS_DIMENSION, creators: int = 400, styles: int = 16):
+        """架空の楽曲データを作る
+
+        Args:
+            seed (int, optional): 乱数のシード. Defaults to 0.
+            lyrics_dimension (int, optional): 歌詞のベクトルの次元. Defaults to LYRICS_DIMENSION.
+            creators (int, optional): イラスト・動画のクリエイターの人数. Defaults to 400.
+            styles (int, optional): 歌詞のベクトルの傾向（クラスタ）の数. Defaults to 16.
+        """
+        self.rng = random.Random(seed)
+        self.lyrics_dimension = lyrics_dimension
+        self.illustrators = [f"イラストレーター{i}" for i in range(creators)]
+        self.movie_creators = [f"動画師{i}" for i in range(creators)]
+        self.creator_weights = zipf_weights(creators)
+        self.vocal_weights = zipf_weights(len(VOCALS), exponent=1.3)
+        self.styles = [[self.rng.gauss(0, 1) for _ in range(lyrics_dimension)] for _ in range(styles)]
+
+    def _creators(self, names: list[str]) -> list[str]:
+        # 大半は1人、まれに複数人の合作
+        count = self.rng.choices([0, 1, 2, 3], weights=[5, 80, 12, 3])[0]
+        return list(dict.fromkeys(self.rng.choices(names, weights=self.creator_weights, k=count)))
+
+    def _lyrics_vector(self, is_inst: bool) -> Optional[list[float]]:
+        if self.rng.random() < 0.05:
+            return None  # 未解析
+        if is_inst:
+            return [0.0] * self.lyrics_dimension
+        style = self.rng.choice(self.styles)
+        return [round(value + self.rng.gauss(0, 0.5), 5) for value in style]
+
+    def song(self, index: int) -> Song:
+        rng = self.rng
+        is_inst = rng.random() < 0.08
+        vocal = ["-"] if is_inst else list(dict.fromkeys(rng.choices(VOCALS, weights=self.vocal_weights, k=rng.choice([1, 1, 1, 2]))))
+        analyzed = rng.random() < 0.95
+        title = "".join(rng.sample(TITLE_WORDS, rng.choice([1, 2, 2, 3])))
+
+        return Song(
+            id=f"bench{index:07d}",
+            title=title,
+            publishedTimestamp=rng.randint(*PUBLISHED_RANGE),
+            durationSeconds=rng.randint(90, 300),
+            publishedType=rng.choices([1, 0, -1], weights=[85, 10, 5])[0],
+            vocal=vocal,
+            illustrations=self._creators(self.illustrators),
+            movie=self._creators(self.movie_creators),
+            bpm=int(rng.gauss(150, 25)) if analyzed else None,
+            mainKey=rng.choice(MAIN_KEYS) if analyzed else None,
+            chordRate6451=min(1.0, max(0.0, rng.betavariate(1.2, 6))) if analyzed else None,
+            chordRate4561=min(1.0, max(0.0, rng.betavariate(1.5, 5))) if analyzed else None,
+            mainChord=rng.choices(MAIN_CHORDS, weights=[30, 25, 15, 10, 8, 5, 7])[0] if analyzed else None,
+            pianoRate=rng.random() if analyzed else None,
+            modulationTimes=rng.choices([0, 1, 2, 3], weights=[55, 30, 10, 5])[0] if analyzed else None,
+            lyricsVector=self._lyrics_vector(is_inst),
+            comment=rng.choice([None, None, None, "ラスサビの転調が好き", "イントロのピアノ"]),
+        )
+
+    def songs(self, count: int) -> list[Song]:
+        return [self.song(i) for i in range(count)]
+
+
+def build_database(db_path: str, count: int, seed: int = 0, stats_limit: Optional[int] = None) -> SongsDatabase:
+    """架空の楽曲を登録したデータベースを作り直す
+
+    SongsStats の作成は楽曲数の2乗の時間がかかるため、stats_limit より多い場合は先頭の stats_limit 曲から作る。
+    （類似度の計算1回あたりの時間は変わらない）
+
+    Args:
+        db_path (str): データベースのパス（既存のファイルは削除する）
+        count (int): 楽曲数
+        seed (int, optional): 乱数のシード. Defaults to 0.
+        stats_limit (Optional[int], optional): SongsStats を作る楽曲数の上限（0 の場合は作らない）. Defaults to None.
+
+    Returns:
+        SongsDatabase: 楽曲を登録したデータベース
+    """
+    if os.path.exists(db_path):
+        os.remove(db_path)
+
+    # 空の状態で開くと、起動時の SongsStats の作成は行われない
+    db = SongsDatabase(db_path)
+    songs = CatalogGenerator(seed).songs(count)
+    db.add_songs_batch(songs)
+
+    calculable = [song for song in songs if song.score_can_be_calculated()]
+    if stats_limit is not None:
+        calculable = calculable[:stats_limit]
+    # SongsStats は1曲以上必要（類似度の計算ができる楽曲が無い場合は作らない）
+    if calculable:
+        db.std = SongsStats(calculable)
+    return db
@@ -0,0 +1,107 @@
+# ベンチマーク用の共通処理
+
+import json
+import platform
+import statistics
+import subprocess
+import time
+from datetime import datetime, timezone
+from typing import Callable, Optional
+
+
+def measure(func: Callable[[], object], repeat: int = 100, warmup: int = 3) -> dict[str, float]:
+    """関数の実行時間を計測し、統計値（ミリ秒）を返す
+
+    Args:
+        func (Callable[[], object]): 計測する関数
+        repeat (int, optional): 計測回数. Defaults to 100.
+        warmup (int, optional): 計測前に実行する回数. Defaults to 3.
+
+    Returns:
+        dict[str, float]: 平均・中央値・p99・最小値（ミリ秒）
+    """
+    for _ in range(warmup):
+        func()
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+
+    timings.sort()
+    return {
+        "mean_ms": statistics.fmean(timings),
+        "p50_ms": timings[len(timings) // 2],
+        "p99_ms": timings[min(len(timings) - 1, int(len(timings) * 0.99))],
+        "min_ms": timings[0],
+        "repeat": repeat,
+    }
+
+
+def print_results(title: str, results: dict[str, dict[str, float]]):
+    print(f"=== {title} ===")
+    for name, result in results.items():
+        print(f"   {name}: mean {result['mean_ms']:.3f} ms / p99 {result['p99_ms']:.3f} ms")
+
+
+def git_revision() -> Optional[str]:
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return result.stdout.strip() or None
+
+
+def save_results(path: str, results: dict[str, dict[str, float]], **metadata):
+    """計測結果を、比較に使えるようにコミット・環境の情報と一緒に JSON で保存する"""
+    data = {
+        "metadata": {
+            "revision": git_revision(),
+            "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            **metadata,
+        },
+        "results": results,
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+
+
+def load_results(path: str) -> dict:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def compare_results(
+    baseline: dict[str, dict[str, float]], current: dict[str, dict[str, float]], threshold: float = 0.2
+) -> list[str]:
+    """2つの計測結果の中央値を比較して表示し、threshold より遅くなった項目の名前を返す
+
+    Args:
+        baseline (dict[str, dict[str, float]]): 基準の計測結果
+        current (dict[str, dict[str, float]]): 比較する計測結果
+        threshold (float, optional): 遅くなったとみなす割合. Defaults to 0.2.
+
+    Returns:
+        list[str]: 遅くなった項目の名前
+    """
+    regressions = []
+    print("=== Comparison (p50) ===")
+    for name, result in current.items():
+        if name not in baseline or "p50_ms" not in result or "p50_ms" not in baseline[name]:
+            print(f"   {name}: {result.get('p50_ms', float('nan')):.3f} ms (new)")
+            continue
+
+        before = baseline[name]["p50_ms"]
+        after = result["p50_ms"]
+        ratio = after / before if before > 0 else float("inf")
+        mark = ""
+        if ratio > 1 + threshold:
+            mark = "  <-- regression"
+            regressions.append(name)
+        elif ratio < 1 - threshold:
+            mark = "  (faster)"
+        print(f"   {name}: {before:.3f} ms -> {after:.3f} ms (x{ratio:.2f}){mark}")
+    return regressions
@@ -0,0 +1,28 @@
+"""
+保存済みのベンチマークの結果の比較
+
+python -m benchmarks.compare baseline.json current.json で実行（遅くなった項目がある場合は終了コード 1）。
+"""
+
+import argparse
+import sys
+
+from benchmarks.common import compare_results, load_results
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Compare benchmark results")
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=0.2, help="遅くなったとみなす割合")
+    args = parser.parse_args(argv)
+
+    baseline = load_results(args.baseline)
+    current = load_results(args.current)
+    print(f"{baseline['metadata'].get('revision')} -> {current['metadata'].get('revision')}")
+    regressions = compare_results(baseline["results"], current["results"], args.threshold)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,43 @@
+"""
+設定の読み込みのベンチマーク
+
+検索のたびに including_video_id が行っていた ConfigStore の作成（設定ファイルの読み込みと復号）と、
+共有のスナップショットの参照を比較する。
+python -m benchmarks.config で実行。
+"""
+
+import asyncio
+from urllib import parse
+
+from benchmarks.common import measure, print_results
+from src.utils.config import ConfigStore
+from src.utils.extraction import including_video_id
+
+QUERY = "https://www.youtube.com/watch?v=dQw4w9WgXcQ"
+
+
+async def including_video_id_per_request(text: str):
+    """以前の実装と同じく、呼び出しのたびに設定を読み込む"""
+    config = await ConfigStore().get_config()
+    for url in config.production_url or []:
+        parse.urlparse(url)
+    return await including_video_id(text)
+
+
+def run(repeat: int = 200) -> dict:
+    loop = asyncio.new_event_loop()
+    try:
+        return {
+            "including_video_id (ConfigStore per call)": measure(
+                lambda: loop.run_until_complete(including_video_id_per_request(QUERY)), repeat=repeat
+            ),
+            "including_video_id (shared snapshot)": measure(
+                lambda: loop.run_until_complete(including_video_id(QUERY)), repeat=repeat
+            ),
+        }
+    finally:
+        loop.close()
+
+
+if __name__ == "__main__":
+    print_results("including_video_id", run())
@@ -0,0 +1,109 @@
+"""
+共有チャットのブロードキャストのベンチマーク
+
+送信処理だけを行う擬似的なWebSocketを大量に接続し、ConnectionManager.broadcast を呼んでから
+全てのクライアントに届くまでの時間を接続数ごとに計測する。応答の遅いクライアントが混ざった場合も計測する。
+python -m benchmarks.share_chat で実行。
+"""
+
+import asyncio
+import time
+import uuid
+from typing import Callable, Optional
+
+from benchmarks.common import measure, print_results
+from src.utils.chat import ConnectionManager
+from src.utils.user_models import User
+
+
+class FakeWebSocket:
+    """送信したメッセージの数だけを記録する擬似的なWebSocket"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.sent = 0
+        self.on_send: Optional[Callable[[str], None]] = None
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text: str):
+        if self.latency > 0:
+            await asyncio.sleep(self.latency)
+        self.sent += 1
+        if self.on_send is not None:
+            self.on_send(text)
+
+    async def close(self, code: int = 1000, reason: str = ""):
+        pass
+
+
+class FakeUsersDatabase:
+    def get_user(self, uid: str) -> User:
+        return User(id=uid, displayName=uid)
+
+
+async def connect_clients(
+    manager: ConnectionManager, count: int, admins: int = 1, latency: float = 0.0
+) -> list[FakeWebSocket]:
+    websockets = []
+    for i in range(count):
+        websocket = FakeWebSocket(latency)
+        await manager.connect(websocket)
+        await manager.authenticate(websocket, uid=str(uuid.uuid4()), is_admin=i < admins)
+        websockets.append(websocket)
+    return websockets
+
+
+async def fan_out(manager: ConnectionManager, websockets: list[FakeWebSocket]):
+    """メッセージをブロードキャストし、全てのクライアントに届くまで待つ"""
+    chat_id = str(uuid.uuid4())
+    remaining = len(websockets)
+    delivered = asyncio.Event()
+
+    def on_send(text: str):
+        nonlocal remaining
+        if chat_id not in text:
+            return
+        remaining -= 1
+        if remaining == 0:
+            delivered.set()
+
+    for websocket in websockets:
+        websocket.on_send = on_send
+    await manager.broadcast({"type": "post", "timestamp": int(time.time()), "chatID": chat_id, "content": "hello"})
+    await delivered.wait()
+
+
+def run(
+    client_counts: tuple[int, ...] = (100, 1000, 5000),
+    slow_clients: int = 10,
+    slow_latency: float = 1.0,
+    repeat: int = 20,
+) -> dict:
+    loop = asyncio.new_event_loop()
+    results = {}
+    try:
+        for count in client_counts:
+            for slow in (0, slow_clients):
+                manager = ConnectionManager(FakeUsersDatabase(), overflow="drop")
+                websockets = loop.run_until_complete(connect_clients(manager, count))
+                loop.run_until_complete(connect_clients(manager, slow, admins=0, latency=slow_latency))
+
+                name = f"fan-out to {count} clients" + (f" (+{slow} slow clients)" if slow else "")
+                results[name] = measure(
+                    lambda: loop.run_until_complete(fan_out(manager, websockets)), repeat=repeat
+                )
+
+                writers = [connection.writer for connection in manager.connections.values()]
+                for writer in writers:
+                    writer.cancel()
+                loop.run_until_complete(asyncio.gather(*writers, return_exceptions=True))
+    finally:
+        loop.close()
+
+    return results
+
+
+if __name__ == "__main__":
+    print_results("ConnectionManager.broadcast", run())
@@ -0,0 +1,179 @@
+"""
+楽曲の取得・検索・類似度の計算のベンチマーク
+
+架空の楽曲データ（benchmarks.catalog）で、楽曲数ごとに主な処理の時間を計測する。
+LyricsVecManager・SongsStats の作成は楽曲数の2乗の時間がかかるため、--quadratic-limit 以下の楽曲数でだけ計測する。
+
+python -m benchmarks.songs で実行。
+    --sizes 1000 10000 100000   計測する楽曲数
+    --output results.json        結果を JSON で保存する
+    --baseline results.json      保存済みの結果と比較する（遅くなった項目がある場合は終了コード 1）
+    --db-path PATH               作成するデータベースのパス（既定は一時ディレクトリ）
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+
+from benchmarks.catalog import build_database
+from benchmarks.common import compare_results, load_results, measure, print_results, save_results
+from src.routers.search import get_songs_sample
+from src.utils.fastapi_models import SongFilters, SongSampleParams
+from src.utils.logger import logger
+from src.utils.songs import LyricsVecManager, SongsCustomParameters, SongsStats
+
+# 検索条件の組み合わせ（キーワードのみ・絞り込みのみ・両方）
+SEARCH_CASES: dict[str, dict] = {
+    "keyword": {"q": "未来"},
+    "keyword AND": {"q": "夜 花"},
+    "keyword OR": {"q": "東京 | ネオン"},
+    "title": {"title": "ハート"},
+    "vocal": {"vocal": "初音ミク"},
+    "creators": {"illustrations": "イラストレーター1", "movie": "動画師2"},
+    "filters": {"mainKey": 60, "publishedType": 1, "order": "bpm"},
+    "date range": {"publishedAfter": 1600000000, "publishedBefore": 1650000000},
+    "keyword + filters": {"q": "Love", "mainChord": "6451", "publishedAfter": 1500000000, "asc": True},
+}
+
+# /search/ の search_songs_fuzzy に渡すキーワード（表記の揺れ・ワイルドカード・入力ミス・一致なし）
+FUZZY_CASES: dict[str, str] = {
+    "kana": "はーと",
+    "kana AND": "ねおん よる",
+    "half-width": "ﾈｵﾝ",
+    "wildcard": "しんでれら%",
+    "typo": "めらんこりい",
+    "no match": "まったく関係ない語",
+}
+
+# リポジトリ内に作らないよう、既定では一時ディレクトリに作る
+DEFAULT_DB_PATH = os.path.join(tempfile.gettempdir(), "bench_songs.db")
+
+CUSTOM_PARAMETERS = SongsCustomParameters(vocal=3, bpm=5, mainKey=2, mainChord=2, lyricsVector=4)
+
+
+def run_catalog(
+    size: int, db_path: str = DEFAULT_DB_PATH, repeat: int = 20, quadratic_limit: int = 1000, seed: int = 0
+) -> dict[str, dict[str, float]]:
+    """1つの楽曲数で計測する
+
+    Args:
+        size (int): 楽曲数
+        db_path (str, optional): 作成するデータベースのパス. Defaults to DEFAULT_DB_PATH.
+        repeat (int, optional): 軽い処理の計測回数（重い処理は楽曲数に応じて減らす）. Defaults to 20.
+        quadratic_limit (int, optional): 2乗の時間がかかる処理を計測する楽曲数の上限. Defaults to 1000.
+        seed (int, optional): 乱数のシード. Defaults to 0.
+
+    Returns:
+        dict[str, dict[str, float]]: "楽曲数/処理名" ごとの計測結果
+    """
+    db = build_database(db_path, size, seed=seed, stats_limit=quadratic_limit)
+    songs = db.get_all_songs()
+    calculable = [song for song in songs if song.score_can_be_calculated()]
+    # 全件を対象にする処理は、楽曲数に応じて回数を減らす
+    heavy_repeat = max(3, repeat * 1000 // size)
+    loop = asyncio.new_event_loop()
+
+    results: dict[str, dict[str, float]] = {}
+
+    def add(name: str, func, repeat: int = repeat, warmup: int = 1):
+        results[f"{size}/{name}"] = measure(func, repeat=repeat, warmup=warmup)
+
+    try:
+        add("get_all_songs", db.get_all_songs, repeat=heavy_repeat)
+
+        for backend in ("sqlite", "index"):
+            db.search_backend = backend
+            for name, query in SEARCH_CASES.items():
+                add(f"search_songs[{backend}] {name}", lambda: db.search_songs(**query))
+            for name, keyword in FUZZY_CASES.items():
+                add(f"search_songs_fuzzy[{backend}] {name}", lambda: db.search_songs_fuzzy(keyword))
+        db.search_backend = "sqlite"
+
+        # 類似度を使う処理は、SongsStats が無い場合（類似度の計算ができる楽曲が無い・--quadratic-limit 0）は計測しない
+        if getattr(db, "std", None) is not None:
+            target = calculable[0].id
+            add("find_nearest_song default", lambda: db.find_nearest_song(target, songs=songs), repeat=heavy_repeat)
+            add(
+                "find_nearest_song custom weights",
+                lambda: db.find_nearest_song(target, songs=songs, parameters=CUSTOM_PARAMETERS),
+                repeat=heavy_repeat,
+            )
+            add("search_nearest_songs default", lambda: db.search_nearest_songs(target))
+            add(
+                "search_nearest_songs custom weights",
+                lambda: db.search_nearest_songs(target, parameters=CUSTOM_PARAMETERS),
+            )
+
+            sample_params = SongSampleParams(limit=10)
+            filtered_sample_params = SongSampleParams(limit=10, filter=SongFilters(vocal="初音ミク"))
+            add(
+                "songs_sample",
+                lambda: loop.run_until_complete(get_songs_sample(sample_params, db)),
+                repeat=heavy_repeat,
+            )
+            add(
+                "songs_sample filtered",
+                lambda: loop.run_until_complete(get_songs_sample(filtered_sample_params, db)),
+                repeat=heavy_repeat,
+            )
+        else:
+            print(f"   {size}: find_nearest_song / search_nearest_songs / songs_sample skipped (no SongsStats)")
+
+        if not calculable:
+            print(f"   {size}: LyricsVecManager / SongsStats skipped (no calculable songs)")
+        elif size <= quadratic_limit:
+            # 1回で数十秒かかるため、1回だけ計測する
+            add("LyricsVecManager", lambda: LyricsVecManager(calculable), repeat=1, warmup=0)
+            add("SongsStats", lambda: SongsStats(calculable), repeat=1, warmup=0)
+        else:
+            print(f"   {size}: LyricsVecManager / SongsStats skipped (over --quadratic-limit {quadratic_limit})")
+    finally:
+        loop.close()
+
+    return results
+
+
+def run(sizes: tuple[int, ...] = (1000, 10000), **kwargs) -> dict[str, dict[str, float]]:
+    results = {}
+    for size in sizes:
+        results.update(run_catalog(size, **kwargs))
+    return results
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Songs benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--quadratic-limit", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--db-path", default=DEFAULT_DB_PATH)
+    parser.add_argument("--output", help="結果を保存する JSON ファイル")
+    parser.add_argument("--baseline", help="比較する保存済みの JSON ファイル")
+    parser.add_argument("--threshold", type=float, default=0.2, help="遅くなったとみなす割合")
+    args = parser.parse_args(argv)
+
+    # 検索のたびに出力される SQL のデバッグログを抑える
+    logger.setLevel(logging.WARNING)
+
+    results = run(
+        tuple(args.sizes),
+        db_path=args.db_path,
+        repeat=args.repeat,
+        quadratic_limit=args.quadratic_limit,
+        seed=args.seed,
+    )
+    print_results("Songs", results)
+
+    if args.output:
+        save_results(args.output, results, sizes=args.sizes, repeat=args.repeat, seed=args.seed)
+    if args.baseline:
+        regressions = compare_results(load_results(args.baseline)["results"], results, args.threshold)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
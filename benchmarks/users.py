@@ -0,0 +1,61 @@
+"""
+ユーザー取得のベンチマーク
+
+Firebaseへの通信を一定の待ち時間に置き換え、キャッシュの有無による UsersDatabase.get_user の速度を比較する。
+python -m benchmarks.users で実行。
+"""
+
+import os
+import time
+from types import SimpleNamespace
+
+from firebase_admin import auth
+
+from benchmarks.common import measure, print_results
+from src.db.user_database import UsersDatabase
+from src.utils.auth import firebase_user_directory
+
+
+def fake_get_users(latency: float):
+    def get_users(identifiers):
+        time.sleep(latency)
+        return SimpleNamespace(
+            users=[
+                SimpleNamespace(uid=identifier.uid, photo_url="https://example.com/icon.png", provider_data=[None])
+                for identifier in identifiers
+            ]
+        )
+
+    return get_users
+
+
+def run(db_path: str = "data/bench_users.db", firebase_latency: float = 0.05, repeat: int = 50) -> dict:
+    if os.path.exists(db_path):
+        os.remove(db_path)
+
+    original_get_users = auth.get_users
+    auth.get_users = fake_get_users(firebase_latency)
+    try:
+        db = UsersDatabase(db_path)
+        uid = "benchmark-user"
+        db.get_user(uid)
+
+        def get_user_cold():
+            # Firebaseのキャッシュが無い状態（以前の実装と同じく毎回通信する）
+            firebase_user_directory.invalidate(uid)
+            ttl, db.firebase_ttl = db.firebase_ttl, -1
+            db.get_user(uid)
+            db.firebase_ttl = ttl
+
+        results = {
+            "get_user (firebase round trip)": measure(get_user_cold, repeat=repeat),
+            "get_user (cached)": measure(lambda: db.get_user(uid), repeat=repeat),
+        }
+    finally:
+        auth.get_users = original_get_users
+
+    return results
+
+
+if __name__ == "__main__":
+    print_results("UsersDatabase.get_user", run())
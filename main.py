@@ -3,19 +3,24 @@ from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
 
-from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 
+from src.db.chat_database import ChatDatabase
 from src.db.comment_database import CommentsDatabase
+from src.db.playlist_database import PlaylistsDatabase
 from src.db.user_database import UsersDatabase
+from src.db.search_query import cache_stats
 from src.db.songs_database import SongsDatabase
 from src.db.update_youtube_data import regist_scheduler
 from src.discordbot.bot import BackendDiscordClient, default_intents
-from src.utils.config import ConfigStore, docs_description
-from src.utils.auth import auth_initialize
+from src.utils.config import docs_description, shared_config_store
+from src.utils.cors import ReloadableCORSMiddleware
+from src.utils.auth import auth_initialize, token_cache
+from src.utils.chat import ChatHistory, ConnectionManager, InProcessBroker, SQLiteBroker
 from src.utils.youtube.api import OAuthClient
 from src.utils.youtube.playlists import PlaylistManager
 from src.utils.logger import logger, discord_handler
+from src.utils.metrics import CHAT_CONNECTIONS, MetricsMiddleware, register_cache
 from src.routers import admin, general, songs, youtube, search_old, search, interaction
 
 
@@ -25,18 +30,30 @@ scheduler = None
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     global scheduler
-    app.state.db = SongsDatabase("data/songs.db")
+    app.state.db = SongsDatabase("data/songs.db", search_backend=config.search_backend)
     app.state.users_db = UsersDatabase("data/songs.db")
     app.state.comments_db = CommentsDatabase("data/songs.db")
+    app.state.playlists_db = PlaylistsDatabase("data/songs.db")
+    chat_broker = SQLiteBroker("data/songs.db") if config.chat_broker == "sqlite" else InProcessBroker()
+    app.state.chat_manager = ConnectionManager(
+        app.state.users_db, ChatHistory(ChatDatabase("data/songs.db")), chat_broker
+    )
+    await app.state.chat_manager.start()
     scheduler = regist_scheduler(app.state.db)
+    register_metrics(app)
 
-    auth_initialize()
+    auth_initialize(config.token_revocation_check_interval)
+    # リンク非表示のルールが変わった場合などに、保存済みのコメントの表示用の内容を作り直す
+    # Firebaseへの問い合わせを含むため、起動を待たせないようバックグラウンドで実行する
+    app.state.resanitize_task = asyncio.create_task(resanitize_comments(app.state.comments_db))
 
-    app.state.config_store = ConfigStore()
+    app.state.config_store = config_store
+    config_store.start_watching()
 
     youtube_oauth_client = OAuthClient()
     await youtube_oauth_client.start()
-    app.state.playlist_manager = PlaylistManager(youtube_oauth_client)
+    app.state.playlist_manager = PlaylistManager(youtube_oauth_client, app.state.playlists_db)
+    await app.state.playlist_manager.start()
 
     app.state.discord_client = BackendDiscordClient(intents=default_intents, command_prefix="!")
     discord_handler.init_bot(bot=app.state.discord_client)
@@ -49,7 +66,37 @@ async def lifespan(app: FastAPI):
     if scheduler:
         scheduler.shutdown()
 
+    app.state.resanitize_task.cancel()
+    await app.state.playlist_manager.stop()
+    await app.state.chat_manager.stop()
+    await config_store.stop_watching()
+
     await app.state.discord_client.close()
+    app.state.db.close()
+
+
+def register_metrics(app: FastAPI):
+    """起動時に作るオブジェクトの件数・キャッシュの統計を /metrics に公開する"""
+    chat_manager = app.state.chat_manager
+    CHAT_CONNECTIONS.set_function(lambda: len(chat_manager.connections), "connected")
+    CHAT_CONNECTIONS.set_function(lambda: len(chat_manager.authenticated), "authenticated")
+
+    db = app.state.db
+    register_cache("auth_token", lambda: (token_cache.hits, token_cache.misses))
+    register_cache("search_facets", lambda: (db.facets_cache_hits, db.facets_cache_misses))
+    register_cache("search_parse_keyword", lambda: cache_stats()["parse_keyword"])
+    register_cache("search_compile_sql", lambda: cache_stats()["compile_search"])
+
+
+async def resanitize_comments(comments_db: CommentsDatabase):
+    """保存済みのコメントの表示用の内容を作り直す（失敗しても起動は止めず、ログに残す）"""
+    try:
+        updated = await asyncio.to_thread(comments_db.resanitize_comments)
+    except Exception as e:
+        logger.error(f"Error in re-sanitizing comments: {e}")
+        return
+    if updated > 0:
+        logger.info(f"Re-sanitized {updated} comments")
 
 
 tags_metadata = [
@@ -94,31 +141,21 @@ app = FastAPI(
     lifespan=lifespan,
 )
 
-# ConfigStoreは同期的に読み込む
-config_store = ConfigStore()
-# 内部の _config は __init__ で既に読み込まれている
-config = config_store._config
-
-if config is None:
+# 設定は起動時に1回だけ読み込み、以降はファイルの変更を監視して読み込み直す
+config_store = shared_config_store()
+if not config_store.is_loaded():
     raise RuntimeError("Config not initialized.")
-
-origins = (
-    config.production_url
-    if config.production_url
-    else []
-    + [
-        "http://localhost:3000",
-        "http://localhost:8787",
-    ]
-)
+config = config_store.snapshot.config
 
 app.add_middleware(
-    CORSMiddleware,
-    allow_origins=origins,
+    ReloadableCORSMiddleware,
+    config_store=config_store,
     allow_credentials=False,  # サーバー間通信を許可する
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# CORS の処理も含めた時間を記録するため、最後に追加する（外側で実行される）
+app.add_middleware(MetricsMiddleware)
 
 app.include_router(admin.router)
 app.include_router(general.router)
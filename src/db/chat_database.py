@@ -0,0 +1,76 @@
+import json
+import sqlite3
+import time
+from typing import Optional
+
+
+class ChatDatabase:
+    def __init__(self, db_path: str = "data/songs.db"):
+        """
+        SQLite3を使用した共有チャットの履歴データベース
+
+        メッセージは追記のみで、削除は deleted_at を記録する（トゥームストーン）。
+
+        Args:
+            db_path: データベースファイルのパス
+        """
+        self.db_path = db_path
+        self.init_database()
+
+    def init_database(self):
+        """データベースとテーブルを初期化"""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS chat_messages (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    chatID TEXT NOT NULL UNIQUE,
+                    message TEXT NOT NULL,
+                    created_at INTEGER NOT NULL,
+                    deleted_at INTEGER
+                );
+            """
+            )
+            conn.commit()
+
+    def add_message(self, message: dict) -> None:
+        """メッセージを追加"""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO chat_messages (chatID, message, created_at) VALUES (?, ?, ?)",
+                (message["chatID"], json.dumps(message, ensure_ascii=False), message.get("timestamp", int(time.time()))),
+            )
+            conn.commit()
+
+    def delete_message(self, chat_id: str) -> bool:
+        """メッセージを削除済みにする
+
+        Returns:
+            bool: 削除済みでないメッセージがあった場合True
+        """
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.execute(
+                "UPDATE chat_messages SET deleted_at = ? WHERE chatID = ? AND deleted_at IS NULL",
+                (int(time.time()), chat_id),
+            )
+            conn.commit()
+            return cursor.rowcount > 0
+
+    def get_messages(self, before: Optional[str] = None, limit: int = 20) -> list[dict]:
+        """削除されていないメッセージを新しい順に limit 件取得し、古い順に並べて返す
+
+        Args:
+            before: 指定した場合、このチャットIDより前のメッセージのみ取得
+            limit: 取得する最大件数
+        """
+        query = "SELECT message FROM chat_messages WHERE deleted_at IS NULL"
+        params: list = []
+        if before is not None:
+            query += " AND seq < (SELECT seq FROM chat_messages WHERE chatID = ?)"
+            params.append(before)
+        query += " ORDER BY seq DESC LIMIT ?"
+        params.append(limit)
+
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.execute(query, params)
+            return [json.loads(row[0]) for row in reversed(cursor.fetchall())]
@@ -1,10 +1,14 @@
+import json
 import sqlite3
 import time
 import uuid
+from typing import Optional
 
 from pydantic import BaseModel, Field
 
 from src.db.user_database import UsersDatabase
+from src.utils.extraction import SANITIZE_RULES_VERSION, render_comment, sanitize_links
+from src.utils.metrics import DB_QUERY_SECONDS, timed_methods
 from src.utils.user_models import User
 
 
@@ -17,6 +21,42 @@ class Comment(BaseModel):
     updatedAt: int = Field(..., default_factory=lambda: int(time.time()))
 
 
+class SongCommentStats(BaseModel):
+    songID: str
+    commentCount: int = Field(0, description="表示中のコメント数")
+    lastCommentAt: Optional[int] = Field(None, description="最新のコメントの投稿時刻")
+    lastActivityAt: Optional[int] = Field(None, description="コメントの投稿・編集・削除が最後にあった時刻")
+
+
+# ユーザー情報を結合してコメントを取得するクエリ
+COMMENT_SELECT = """
+    SELECT comments.id, comments.songID, comments.content, comments.rendered_content,
+        comments.created_at, comments.updated_at,
+        users.id, users.displayName, users.useProvidedIcon, firebase_users.IconURL, firebase_users.fetched_at
+    FROM comments
+    JOIN users ON users.id = comments.userID
+    LEFT JOIN firebase_users ON firebase_users.firebaseUID = users.firebaseUID
+"""
+
+# before に指定したコメントより古いコメントに絞り込む条件
+BEFORE_CURSOR = """
+    AND (comments.created_at, comments.id) < (SELECT created_at, id FROM comments WHERE id = ?)
+"""
+
+
+@timed_methods(
+    DB_QUERY_SECONDS,
+    "init_database",
+    "add_comment",
+    "get_comment",
+    "get_comments_by_song",
+    "get_comments_by_user",
+    "get_recent_comments",
+    "update_comment",
+    "delete_comment",
+    "get_comment_stats",
+    "resanitize_comments",
+)
 class CommentsDatabase:
     def __init__(self, db_path: str = "data/songs.db"):
         """
@@ -42,128 +82,367 @@ class CommentsDatabase:
                     created_at INTEGER NOT NULL,
                     updated_at INTEGER NOT NULL,
                     visible INTEGER NOT NULL DEFAULT 1,
+                    rendered_content TEXT,
+                    author_is_guest INTEGER,
+                    sanitize_version INTEGER NOT NULL DEFAULT 0,
                     FOREIGN KEY (songID) REFERENCES songs(id) ON DELETE CASCADE
                     FOREIGN KEY (userID) REFERENCES users(id) ON DELETE CASCADE
                 );
             """
             )
+            # 表示用の内容（ゲストのリンクを非表示にしたもの）を保存する列を追加
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(comments);")}
+            if "rendered_content" not in columns:
+                conn.execute("ALTER TABLE comments ADD COLUMN rendered_content TEXT;")
+                conn.execute("ALTER TABLE comments ADD COLUMN author_is_guest INTEGER;")
+                conn.execute("ALTER TABLE comments ADD COLUMN sanitize_version INTEGER NOT NULL DEFAULT 0;")
+
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_comments_song ON comments (songID, visible, created_at, id);"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_comments_user ON comments (userID, visible, created_at, id);"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_comments_recent ON comments (visible, created_at, id);")
+
+            # 曲ごとのコメント数などの集計（コメントの追加・編集・削除と同じトランザクションで更新）
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS comment_stats (
+                    songID TEXT PRIMARY KEY,
+                    commentCount INTEGER NOT NULL DEFAULT 0,
+                    lastCommentAt INTEGER,
+                    lastActivityAt INTEGER
+                );
+            """
+            )
+            if conn.execute("SELECT COUNT(*) FROM comment_stats").fetchone()[0] == 0:
+                conn.execute(
+                    """
+                    INSERT INTO comment_stats (songID, commentCount, lastCommentAt, lastActivityAt)
+                    SELECT songID, SUM(visible), MAX(CASE WHEN visible = 1 THEN created_at END), MAX(updated_at)
+                    FROM comments
+                    GROUP BY songID
+                """
+                )
+
+            # 外部キー制約は接続ごとの設定で、曲を削除する SongsDatabase の接続では有効にならないため、
+            # 曲の削除と同じトランザクションでコメントと集計をトリガーで削除する
+            has_songs = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'songs'"
+            ).fetchone()
+            if has_songs:
+                conn.execute(
+                    """
+                    CREATE TRIGGER IF NOT EXISTS songs_delete_comments AFTER DELETE ON songs
+                    BEGIN
+                        DELETE FROM comments WHERE songID = OLD.id;
+                        DELETE FROM comment_stats WHERE songID = OLD.id;
+                    END;
+                """
+                )
+            # トリガーの追加前に削除された曲の集計を取り除く
+            conn.execute("DELETE FROM comment_stats WHERE songID NOT IN (SELECT songID FROM comments)")
+
             conn.execute("PRAGMA foreign_keys = ON;")  # 外部キー制約を有効化
             conn.commit()
 
-    def add_comment(self, comment: Comment) -> None:
-        """コメントを追加"""
+    def add_comment(self, comment: Comment, is_guest: bool = True) -> None:
+        """コメントを追加
+
+        Args:
+            comment: 追加するコメント
+            is_guest: 投稿者がゲストユーザーかどうか（ゲストの場合は表示用の内容からリンクを除く）
+        """
         with sqlite3.connect(self.db_path) as conn:
             conn.execute(
                 """
-                INSERT INTO comments (id, songID, userID, content, created_at, updated_at)
-                VALUES (?, ?, ?, ?, ?, ?)
+                INSERT INTO comments (
+                    id, songID, userID, content, created_at, updated_at,
+                    rendered_content, author_is_guest, sanitize_version
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
             """,
-                (comment.id, comment.songID, comment.user.id, comment.content, comment.createdAt, comment.updatedAt),
+                (
+                    comment.id,
+                    comment.songID,
+                    comment.user.id,
+                    comment.content,
+                    comment.createdAt,
+                    comment.updatedAt,
+                    render_comment(comment.content, is_guest),
+                    int(is_guest),
+                    SANITIZE_RULES_VERSION,
+                ),
+            )
+            conn.execute(
+                """
+                INSERT INTO comment_stats (songID, commentCount, lastCommentAt, lastActivityAt)
+                VALUES (?, 1, ?, ?)
+                ON CONFLICT (songID) DO UPDATE SET
+                    commentCount = commentCount + 1,
+                    lastCommentAt = MAX(COALESCE(lastCommentAt, 0), excluded.lastCommentAt),
+                    lastActivityAt = MAX(COALESCE(lastActivityAt, 0), excluded.lastActivityAt)
+            """,
+                (comment.songID, comment.createdAt, comment.updatedAt),
             )
             conn.commit()
 
-    def get_comment(self, comment_id: str):
+    def get_comment(self, comment_id: str) -> Optional[Comment]:
         """コメントIDに紐づくコメントを取得"""
         with sqlite3.connect(self.db_path) as conn:
             cursor = conn.execute(
-                """
-                SELECT id, songID, userID, content, created_at, updated_at, visible
-                FROM comments
-                WHERE id = ? AND visible = 1
-            """,
+                COMMENT_SELECT + "WHERE comments.id = ? AND comments.visible = 1",
                 (comment_id,),
             )
-            raw_comment = cursor.fetchone()
-            if not raw_comment:
-                return None
-
-            user = self.user_db.get_users_by_ids([raw_comment[2]]).get(raw_comment[2])
-
-            return Comment(
-                id=raw_comment[0],
-                songID=raw_comment[1],
-                user=user,
-                content=raw_comment[3],
-                createdAt=raw_comment[4],
-                updatedAt=raw_comment[5],
-            )
+            comments = self._comments_from_rows(cursor.fetchall(), rendered=False)
 
-    def get_comments_by_song(self, song_id: str) -> list[Comment]:
-        """曲IDに紐づくコメントを取得"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.execute(
-                """
-                SELECT id, songID, userID, content, created_at, updated_at, visible
-                FROM comments
-                WHERE songID = ? AND visible = 1
-                ORDER BY created_at DESC
-            """,
-                (song_id,),
-            )
-            rows = cursor.fetchall()
-            users = self.user_db.get_users_by_ids([row[2] for row in rows])
+        return comments[0] if comments else None
 
-            return [
-                Comment(
-                    id=row[0],
-                    songID=row[1],
-                    user=users.get(row[2]),
-                    content=row[3],
-                    createdAt=row[4],
-                    updatedAt=row[5],
-                )
-                for row in rows
-            ]
+    def get_comments_by_song(
+        self, song_id: str, before: Optional[str] = None, limit: Optional[int] = None
+    ) -> list[Comment]:
+        """曲IDに紐づくコメントを新しい順に取得（内容は表示用のもの）
+
+        Args:
+            song_id: 曲ID
+            before: 指定した場合、このコメントIDより古いコメントのみ取得
+            limit: 取得する最大件数
+
+        Raises:
+            ValueError: before に指定したコメントが存在しない場合
+        """
+        return self._get_comments(["comments.songID = ?"], [song_id], before, limit, rendered=True)
+
+    def get_comments_by_user(
+        self, user_id: str, before: Optional[str] = None, limit: Optional[int] = None
+    ) -> list[Comment]:
+        """ユーザーIDに紐づくコメントを新しい順に取得（内容は投稿されたもの）
+
+        Args:
+            user_id: ユーザーID
+            before: 指定した場合、このコメントIDより古いコメントのみ取得
+            limit: 取得する最大件数
+
+        Raises:
+            ValueError: before に指定したコメントが存在しない場合
+        """
+        return self._get_comments(["comments.userID = ?"], [user_id], before, limit, rendered=False)
+
+    def get_recent_comments(
+        self, before: Optional[str] = None, since: Optional[int] = None, limit: Optional[int] = None
+    ) -> list[Comment]:
+        """全ての曲のコメントを新しい順に取得（内容は表示用のもの）
+
+        Args:
+            before: 指定した場合、このコメントIDより古いコメントのみ取得
+            since: 指定した場合、この時刻より後に投稿されたコメントのみ取得
+            limit: 取得する最大件数
+
+        Raises:
+            ValueError: before に指定したコメントが存在しない場合
+        """
+        conditions, params = [], []
+        if since is not None:
+            conditions.append("comments.created_at > ?")
+            params.append(since)
+        return self._get_comments(conditions, params, before, limit, rendered=True)
+
+    def _get_comments(
+        self, conditions: list[str], params: list, before: Optional[str], limit: Optional[int], rendered: bool
+    ) -> list[Comment]:
+        query = COMMENT_SELECT + "WHERE " + " AND ".join(["comments.visible = 1", *conditions])
+        params = list(params)
+        if before is not None:
+            query += BEFORE_CURSOR
+            params.append(before)
+
+        query += " ORDER BY comments.created_at DESC, comments.id DESC LIMIT ?"
+        params.append(limit if limit is not None else -1)
 
-    def get_comments_by_user(self, user_id: str) -> list[Comment]:
-        """ユーザーIDに紐づくコメントを取得"""
         with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.execute(
-                """
-                SELECT id, songID, userID, content, created_at, updated_at, visible
-                FROM comments
-                WHERE userID = ? AND visible = 1
-                ORDER BY created_at DESC
-            """,
-                (user_id,),
-            )
-            rows = cursor.fetchall()
-            users = self.user_db.get_users_by_ids([row[2] for row in rows])
+            # 存在しないコメントIDを before に指定した場合は、空のページと区別できるようエラーにする
+            if before is not None and conn.execute("SELECT 1 FROM comments WHERE id = ?", (before,)).fetchone() is None:
+                raise ValueError(f"Comment with id {before} not found in database.")
+            cursor = conn.execute(query, params)
+            return self._comments_from_rows(cursor.fetchall(), rendered)
+
+    def _comments_from_rows(self, rows: list[tuple], rendered: bool) -> list[Comment]:
+        # Firebaseのユーザー情報がまだキャッシュされていない投稿者のみ別途取得
+        uncached_user_ids = {row[6] for row in rows if bool(row[8]) and row[10] is None}
+        uncached_users = self.user_db.get_users_by_ids(uncached_user_ids) if uncached_user_ids else {}
 
-            return [
+        comments = []
+        for row in rows:
+            comment_id, song_id, content, rendered_content, created_at, updated_at = row[:6]
+            user_id, display_name, use_provided_icon, icon_url, _ = row[6:]
+            if rendered:
+                # 移行前のコメントは、安全のためゲストとして扱う
+                content = rendered_content if rendered_content is not None else sanitize_links(content)
+
+            user = uncached_users.get(user_id) or User(
+                id=user_id,
+                displayName=display_name,
+                IconURL=icon_url if bool(use_provided_icon) else None,
+                useProvidedIcon=bool(use_provided_icon),
+            )
+            comments.append(
                 Comment(
-                    id=row[0],
-                    songID=row[1],
-                    user=users.get(row[2]),
-                    content=row[3],
-                    createdAt=row[4],
-                    updatedAt=row[5],
+                    id=comment_id,
+                    songID=song_id,
+                    user=user,
+                    content=content,
+                    createdAt=created_at,
+                    updatedAt=updated_at,
                 )
-                for row in rows
-            ]
+            )
 
-    def update_comment(self, comment_id: str, new_content: str):
-        """コメント内容を更新"""
+        return comments
+
+    def update_comment(self, comment_id: str, new_content: str, is_guest: Optional[bool] = None):
+        """コメント内容を更新
+
+        Args:
+            comment_id: コメントID
+            new_content: 更新後の内容
+            is_guest: 投稿者がゲストユーザーかどうか。Noneの場合は投稿時の値を使う
+        """
+        now = int(time.time())
         with sqlite3.connect(self.db_path) as conn:
+            if is_guest is None:
+                row = conn.execute("SELECT author_is_guest FROM comments WHERE id = ?", (comment_id,)).fetchone()
+                is_guest = row is None or row[0] is None or bool(row[0])
+
             conn.execute(
                 """
                 UPDATE comments
-                SET content = ?, updated_at = ?
+                SET content = ?, updated_at = ?, rendered_content = ?, author_is_guest = ?, sanitize_version = ?
                 WHERE id = ?
             """,
-                (new_content, int(time.time()), comment_id),
+                (
+                    new_content,
+                    now,
+                    render_comment(new_content, is_guest),
+                    int(is_guest),
+                    SANITIZE_RULES_VERSION,
+                    comment_id,
+                ),
+            )
+            conn.execute(
+                """
+                UPDATE comment_stats
+                SET lastActivityAt = ?
+                WHERE songID = (SELECT songID FROM comments WHERE id = ?)
+            """,
+                (now, comment_id),
             )
             conn.commit()
 
     def delete_comment(self, comment_id: str):
         """コメントを削除（visibleをFalseにする）"""
+        now = int(time.time())
         with sqlite3.connect(self.db_path) as conn:
-            conn.execute(
+            cursor = conn.execute(
                 """
                 UPDATE comments
                 SET visible = 0, updated_at = ?
-                WHERE id = ?
+                WHERE id = ? AND visible = 1
             """,
-                (int(time.time()), comment_id),
+                (now, comment_id),
             )
+            if cursor.rowcount > 0:
+                conn.execute(
+                    """
+                    UPDATE comment_stats
+                    SET commentCount = commentCount - 1,
+                        lastCommentAt = (
+                            SELECT MAX(created_at) FROM comments WHERE songID = comment_stats.songID AND visible = 1
+                        ),
+                        lastActivityAt = ?
+                    WHERE songID = (SELECT songID FROM comments WHERE id = ?)
+                """,
+                    (now, comment_id),
+                )
             conn.commit()
+
+    def get_comment_stats(self, song_ids: Optional[list[str]] = None) -> list[SongCommentStats]:
+        """曲ごとのコメント数と最新のコメントの時刻を取得
+
+        Args:
+            song_ids: 取得する曲IDのリスト。Noneの場合はコメントのある全ての曲
+
+        Returns:
+            list[SongCommentStats]: 集計のリスト。song_idsを指定した場合はその順番で、コメントの無い曲も含む
+        """
+        with sqlite3.connect(self.db_path) as conn:
+            if song_ids is None:
+                cursor = conn.execute(
+                    """
+                    SELECT songID, commentCount, lastCommentAt, lastActivityAt
+                    FROM comment_stats
+                    WHERE commentCount > 0
+                """
+                )
+            else:
+                cursor = conn.execute(
+                    """
+                    SELECT songID, commentCount, lastCommentAt, lastActivityAt
+                    FROM comment_stats
+                    WHERE songID IN (SELECT value FROM json_each(?))
+                """,
+                    (json.dumps(song_ids),),
+                )
+            stats = {
+                row[0]: SongCommentStats(songID=row[0], commentCount=row[1], lastCommentAt=row[2], lastActivityAt=row[3])
+                for row in cursor.fetchall()
+            }
+
+        if song_ids is None:
+            return list(stats.values())
+        return [stats.get(song_id, SongCommentStats(songID=song_id)) for song_id in song_ids]
+
+    def resanitize_comments(self, batch_size: int = 500) -> int:
+        """表示用の内容が古いルールで作成されたコメントを作り直す
+
+        リンクの非表示のルールを変更した場合は SANITIZE_RULES_VERSION を上げる。
+        投稿者がゲストかどうか不明な（移行前の）コメントは、Firebaseのユーザー情報から判定する。
+
+        Returns:
+            int: 更新したコメント数
+        """
+        updated = 0
+        while True:
+            with sqlite3.connect(self.db_path) as conn:
+                rows = conn.execute(
+                    """
+                    SELECT id, userID, content, author_is_guest
+                    FROM comments
+                    WHERE sanitize_version < ?
+                    LIMIT ?
+                """,
+                    (SANITIZE_RULES_VERSION, batch_size),
+                ).fetchall()
+
+            if not rows:
+                return updated
+
+            unknown_user_ids = {row[1] for row in rows if row[3] is None}
+            guest_flags = self.user_db.get_guest_flags(unknown_user_ids) if unknown_user_ids else {}
+
+            values = []
+            for comment_id, user_id, content, author_is_guest in rows:
+                is_guest = bool(author_is_guest) if author_is_guest is not None else guest_flags.get(user_id, True)
+                values.append((render_comment(content, is_guest), int(is_guest), SANITIZE_RULES_VERSION, comment_id))
+
+            with sqlite3.connect(self.db_path) as conn:
+                conn.executemany(
+                    """
+                    UPDATE comments
+                    SET rendered_content = ?, author_is_guest = ?, sanitize_version = ?
+                    WHERE id = ?
+                """,
+                    values,
+                )
+                conn.commit()
+
+            updated += len(values)
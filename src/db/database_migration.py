@@ -1,5 +1,6 @@
 # データベース移行用のスクリプト
 
+from src.db.comment_database import CommentsDatabase
 from src.db.songs_database import SongsDatabase
 import json
 
@@ -70,3 +71,10 @@ def load_songs_into_v3(database_path: str = "data/songs.db", input_path: str = "
         songs = json.load(f)
 
     db.add_songs_batch([Song(**song) for song in songs])
+
+
+def resanitize_comments(database_path: str = "data/songs.db") -> None:
+    db = CommentsDatabase(database_path)
+    updated = db.resanitize_comments()
+
+    print(f"Re-sanitized {updated} comments")
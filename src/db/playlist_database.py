@@ -0,0 +1,333 @@
+import json
+import sqlite3
+import time
+import uuid
+from datetime import datetime
+from typing import Literal, Optional
+
+from pydantic import BaseModel, Field
+
+PlaylistJobStatus = Literal["pending", "running", "completed", "failed"]
+
+
+class YoutubePlaylist(BaseModel):
+    id: str
+    title: str
+    description: str
+    createdAt: datetime
+    videoIDs: list[str]
+
+
+class PlaylistJob(BaseModel):
+    id: str = Field(..., default_factory=lambda: str(uuid.uuid4()))
+    title: str
+    description: str
+    videoIDs: list[str]
+    status: PlaylistJobStatus = "pending"
+    playlistID: Optional[str] = None
+    position: int = Field(0, description="追加が完了した動画の数")
+    attempts: int = Field(0, description="リトライした回数")
+    error: Optional[str] = None
+    createdAt: int = Field(..., default_factory=lambda: int(time.time()))
+    updatedAt: int = Field(..., default_factory=lambda: int(time.time()))
+    submittedBy: Optional[str] = Field(None, exclude=True, description="ジョブを登録したユーザーのFirebaseのUID")
+
+
+class PlaylistsDatabase:
+    def __init__(self, db_path: str = "data/songs.db"):
+        """
+        SQLite3を使用したプレイリスト作成ジョブ・作成済みプレイリストのキャッシュのデータベース
+
+        Args:
+            db_path: データベースファイルのパス
+        """
+        self.db_path = db_path
+        self.init_database()
+
+    def init_database(self):
+        """データベースとテーブルを初期化"""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS playlist_jobs (
+                    id TEXT PRIMARY KEY,
+                    title TEXT NOT NULL,
+                    description TEXT NOT NULL,
+                    videoIDs TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    playlistID TEXT,
+                    position INTEGER NOT NULL DEFAULT 0,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    leased_until INTEGER NOT NULL DEFAULT 0,
+                    created_at INTEGER NOT NULL,
+                    updated_at INTEGER NOT NULL
+                );
+            """
+            )
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(playlist_jobs);")}
+            if "cacheKey" not in columns:
+                conn.execute("ALTER TABLE playlist_jobs ADD COLUMN cacheKey TEXT;")
+            if "submittedBy" not in columns:
+                conn.execute("ALTER TABLE playlist_jobs ADD COLUMN submittedBy TEXT;")
+
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_playlist_jobs_status ON playlist_jobs (status, created_at);"
+            )
+            # 同じユーザーの同じ動画の組み合わせのジョブは、同時に1つまでしか処理しない
+            # （ジョブは登録したユーザーしか取得できないため、他のユーザーのジョブにはまとめない）
+            conn.execute("DROP INDEX IF EXISTS idx_playlist_jobs_active_key;")
+            conn.execute(
+                """
+                CREATE UNIQUE INDEX IF NOT EXISTS idx_playlist_jobs_active_user_key
+                ON playlist_jobs (cacheKey, submittedBy) WHERE status IN ('pending', 'running');
+            """
+            )
+
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS playlist_cache (
+                    cacheKey TEXT PRIMARY KEY,
+                    playlistID TEXT NOT NULL,
+                    title TEXT NOT NULL,
+                    description TEXT NOT NULL,
+                    videoIDs TEXT NOT NULL,
+                    created_at INTEGER NOT NULL,
+                    last_used_at INTEGER NOT NULL
+                );
+            """
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_playlist_cache_last_used ON playlist_cache (last_used_at);"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_playlist_cache_created ON playlist_cache (created_at);")
+            conn.commit()
+
+    def add_job(self, job: PlaylistJob, cache_key: Optional[str] = None) -> Optional[PlaylistJob]:
+        """ジョブを追加
+
+        同じユーザーの同じcache_keyのジョブが処理待ち・処理中の場合は追加せず、既存のジョブを返す。
+
+        Returns:
+            Optional[PlaylistJob]: 追加したジョブ、または既存のジョブ。既存のジョブが直前に完了した場合はNone
+        """
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.execute(
+                """
+                INSERT OR IGNORE INTO playlist_jobs (
+                    id, title, description, videoIDs, status, playlistID,
+                    position, attempts, error, created_at, updated_at, cacheKey, submittedBy
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+                (
+                    job.id,
+                    job.title,
+                    job.description,
+                    json.dumps(job.videoIDs),
+                    job.status,
+                    job.playlistID,
+                    job.position,
+                    job.attempts,
+                    job.error,
+                    job.createdAt,
+                    job.updatedAt,
+                    cache_key,
+                    job.submittedBy,
+                ),
+            )
+            conn.commit()
+            if cursor.rowcount > 0:
+                return job
+
+            cursor = conn.execute(
+                """
+                SELECT id FROM playlist_jobs
+                WHERE cacheKey = ? AND submittedBy IS ? AND status IN ('pending', 'running')
+            """,
+                (cache_key, job.submittedBy),
+            )
+            row = cursor.fetchone()
+
+        if row is None:
+            return None
+        return self.get_job(row[0])
+
+    def get_job(self, job_id: str) -> Optional[PlaylistJob]:
+        """ジョブIDに紐づくジョブを取得"""
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.execute(
+                """
+                SELECT id, title, description, videoIDs, status, playlistID,
+                    position, attempts, error, created_at, updated_at, submittedBy
+                FROM playlist_jobs
+                WHERE id = ?
+            """,
+                (job_id,),
+            )
+            row = cursor.fetchone()
+            if not row:
+                return None
+
+            return PlaylistJob(
+                id=row[0],
+                title=row[1],
+                description=row[2],
+                videoIDs=json.loads(row[3]),
+                status=row[4],
+                playlistID=row[5],
+                position=row[6],
+                attempts=row[7],
+                error=row[8],
+                createdAt=row[9],
+                updatedAt=row[10],
+                submittedBy=row[11],
+            )
+
+    def get_resumable_job_ids(self) -> list[str]:
+        """未完了のまま処理が止まっているジョブのIDを古い順に取得"""
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.execute(
+                """
+                SELECT id FROM playlist_jobs
+                WHERE status = 'pending' OR (status = 'running' AND leased_until < ?)
+                ORDER BY created_at
+            """,
+                (int(time.time()),),
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def claim_job(self, job_id: str, lease_seconds: int) -> bool:
+        """ジョブの処理権を取得する
+
+        複数のプロセスが同じジョブを処理しないよう、一定時間のリースを設定する。
+
+        Returns:
+            bool: 処理権を取得できた場合True
+        """
+        now = int(time.time())
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.execute(
+                """
+                UPDATE playlist_jobs
+                SET status = 'running', leased_until = ?, updated_at = ?
+                WHERE id = ? AND (status = 'pending' OR (status = 'running' AND leased_until < ?))
+            """,
+                (now + lease_seconds, now, job_id, now),
+            )
+            conn.commit()
+            return cursor.rowcount > 0
+
+    def update_progress(self, job_id: str, playlist_id: str, position: int, lease_seconds: int) -> None:
+        """作成済みのプレイリストIDと追加済みの位置を保存し、リースを延長"""
+        now = int(time.time())
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute(
+                """
+                UPDATE playlist_jobs
+                SET playlistID = ?, position = ?, leased_until = ?, updated_at = ?
+                WHERE id = ?
+            """,
+                (playlist_id, position, now + lease_seconds, now, job_id),
+            )
+            conn.commit()
+
+    def record_retry(self, job_id: str, error: str, lease_seconds: int) -> None:
+        """リトライ回数と直近のエラーを記録し、リースを延長"""
+        now = int(time.time())
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute(
+                """
+                UPDATE playlist_jobs
+                SET attempts = attempts + 1, error = ?, leased_until = ?, updated_at = ?
+                WHERE id = ?
+            """,
+                (error, now + lease_seconds, now, job_id),
+            )
+            conn.commit()
+
+    def finish_job(self, job_id: str, status: PlaylistJobStatus, error: Optional[str] = None) -> None:
+        """ジョブを完了または失敗の状態にする"""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute(
+                """
+                UPDATE playlist_jobs
+                SET status = ?, error = ?, leased_until = 0, updated_at = ?
+                WHERE id = ?
+            """,
+                (status, error, int(time.time()), job_id),
+            )
+            conn.commit()
+
+    def get_cached_playlist(self, cache_key: str, ttl_seconds: int) -> Optional[YoutubePlaylist]:
+        """有効期限内のキャッシュされたプレイリストを取得し、最終利用時刻を更新"""
+        now = int(time.time())
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.execute(
+                """
+                SELECT playlistID, title, description, videoIDs, created_at
+                FROM playlist_cache
+                WHERE cacheKey = ? AND created_at > ?
+            """,
+                (cache_key, now - ttl_seconds),
+            )
+            row = cursor.fetchone()
+            if not row:
+                return None
+
+            conn.execute("UPDATE playlist_cache SET last_used_at = ? WHERE cacheKey = ?", (now, cache_key))
+            conn.commit()
+
+        return YoutubePlaylist(
+            id=row[0],
+            title=row[1],
+            description=row[2],
+            videoIDs=json.loads(row[3]),
+            createdAt=datetime.fromtimestamp(row[4]),
+        )
+
+    def put_cached_playlist(self, cache_key: str, playlist: YoutubePlaylist, max_entries: int) -> None:
+        """プレイリストをキャッシュに保存し、上限を超えた分を最終利用時刻の古い順に削除"""
+        now = int(time.time())
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute(
+                """
+                INSERT OR REPLACE INTO playlist_cache (
+                    cacheKey, playlistID, title, description, videoIDs, created_at, last_used_at
+                ) VALUES (?, ?, ?, ?, ?, ?, ?)
+            """,
+                (
+                    cache_key,
+                    playlist.id,
+                    playlist.title,
+                    playlist.description,
+                    json.dumps(playlist.videoIDs),
+                    int(playlist.createdAt.timestamp()),
+                    now,
+                ),
+            )
+            conn.execute(
+                """
+                DELETE FROM playlist_cache
+                WHERE cacheKey IN (
+                    SELECT cacheKey FROM playlist_cache
+                    ORDER BY last_used_at DESC
+                    LIMIT -1 OFFSET ?
+                )
+            """,
+                (max_entries,),
+            )
+            conn.commit()
+
+    def delete_expired_playlists(self, ttl_seconds: int) -> int:
+        """有効期限切れのキャッシュを削除
+
+        Returns:
+            int: 削除した件数
+        """
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.execute(
+                "DELETE FROM playlist_cache WHERE created_at <= ?",
+                (int(time.time()) - ttl_seconds,),
+            )
+            conn.commit()
+            return cursor.rowcount
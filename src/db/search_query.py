@@ -0,0 +1,362 @@
+# 楽曲検索のキーワードをSQLに変換するモジュール
+# キーワードの構文: スペースでAND、| (または OR) でOR、"..." で空白を含む語
+
+from functools import lru_cache
+from typing import Any, NamedTuple
+
+# 全角の記号・空白を半角に揃える
+_FULL_WIDTH_TABLE = str.maketrans({"　": " ", "｜": "|", "＂": '"', "“": '"', "”": '"'})
+
+# ORDER BY に指定できる列（パラメータ化できないため、列名はここに含まれるものに限る）
+SORTABLE_COLUMNS = frozenset(
+    {
+        "id",
+        "title",
+        "publishedTimestamp",
+        "durationSeconds",
+        "bpm",
+        "mainKey",
+        "chordRate6451",
+        "chordRate4561",
+        "pianoRate",
+        "modulationTimes",
+    }
+)
+DEFAULT_ORDER = "publishedTimestamp"
+
+
+def _json_contains(column: str) -> str:
+    return f"EXISTS (SELECT 1 FROM json_each({column}) WHERE json_each.value = ?)"
+
+
+# キーワード検索の対象の列ごとの、1語あたりの条件とパラメータのテンプレート
+KEYWORD_FIELDS: dict[str, tuple[str, tuple[str, ...]]] = {
+    "q": (
+        f"title LIKE ? OR comment LIKE ? OR {_json_contains('vocal')} OR {_json_contains('illustrations')} OR {_json_contains('movie')}",
+        ("%{}%", "%{}%", "{}", "{}", "{}"),
+    ),
+    "title": ("title LIKE ?", ("%{}%",)),
+    "comment": ("comment LIKE ?", ("%{}%",)),
+    "vocal": (_json_contains("vocal"), ("{}",)),
+    "illustrations": (_json_contains("illustrations"), ("{}",)),
+    "movie": (_json_contains("movie"), ("{}",)),
+}
+
+# 値をそのまま1つのパラメータとして渡す条件
+SCALAR_FIELDS: dict[str, str] = {
+    "id": "id = ?",
+    "mainChord": "mainChord = ?",
+    "mainKey": "mainKey = ?",
+    "publishedType": "publishedType = ?",
+    "publishedAfter": "publishedTimestamp >= ?",
+    "publishedBefore": "publishedTimestamp <= ?",
+}
+
+
+class OrTerm(NamedTuple):
+    """いずれかの語に一致すればよい条件（AND で結合される1項）"""
+
+    words: tuple[str, ...]
+
+
+KeywordQuery = tuple[OrTerm, ...]
+
+
+def normalize_keyword(keyword: str) -> str:
+    """全角の空白・記号を半角に揃え、前後の空白を取り除く"""
+    return keyword.translate(_FULL_WIDTH_TABLE).strip()
+
+
+def _tokenize(keyword: str, quotes: str = "\"'") -> list[str | None]:
+    """キーワードを語と OR 演算子（None）の列に分ける"""
+    tokens: list[str | None] = []
+    buffer: list[str] = []
+    in_word = False
+    quote = None
+
+    def end_word():
+        nonlocal in_word
+        if in_word:
+            tokens.append("".join(buffer))
+            buffer.clear()
+            in_word = False
+
+    for char in keyword:
+        if quote is not None:
+            if char == quote:
+                quote = None
+            else:
+                buffer.append(char)
+        elif char in quotes:
+            quote = char
+            in_word = True
+        elif char == "|":
+            end_word()
+            tokens.append(None)
+        elif char.isspace():
+            end_word()
+        else:
+            buffer.append(char)
+            in_word = True
+    if quote is not None:
+        # 閉じられていない引用符（Don't など）がある場合は、引用符を普通の文字として扱う
+        return _tokenize(keyword, quotes="")
+    end_word()
+
+    # 単独の OR は演算子として扱う（"OR" のように引用符で囲めば語になる）
+    return [None if token == "OR" else token for token in tokens]
+
+
+def parse_keyword(keyword: str) -> KeywordQuery:
+    """検索キーワードを構文木（OR の項を AND で結合したもの）に変換する
+
+    Args:
+        keyword (str): 検索キーワード。スペースでAND、|でORを表す
+
+    Returns:
+        KeywordQuery: AND で結合する OrTerm のタプル。空の語は取り除かれる
+    """
+    # 全角・半角の違いだけのキーワードは同じキャッシュを使う
+    return _parse_normalized(normalize_keyword(keyword))
+
+
+@lru_cache(maxsize=1024)
+def _parse_normalized(keyword: str) -> KeywordQuery:
+    terms: list[OrTerm] = []
+    words: list[str] = []
+    continues_or = False
+
+    for token in _tokenize(keyword):
+        if token is None:
+            continues_or = True
+            continue
+
+        if words and not continues_or:
+            terms.append(OrTerm(tuple(words)))
+            words = []
+        if token:
+            words.append(token)
+        continues_or = False
+
+    if words:
+        terms.append(OrTerm(tuple(words)))
+    return tuple(terms)
+
+
+def _keyword_conditions(single_query: str, query: KeywordQuery) -> list[str]:
+    return [f"({' OR '.join([single_query] * len(term.words))})" for term in query]
+
+
+def keyword_to_query(keyword: str, single_query: str, params_template: str = "{}") -> tuple[list[str], list[str]]:
+    """検索キーワードをSQLのWHERE句とパラメータのリストに変換する
+
+    Args:
+        keyword (str): 検索キーワード。スペースでAND、|でORを表す
+
+    Returns:
+        tuple[list[str], list[str]]: SQLのWHERE句とパラメータのリスト
+    """
+    query = parse_keyword(keyword)
+    params = [params_template.format(word) for term in query for word in term.words]
+    return _keyword_conditions(single_query, query), params
+
+
+def search_fingerprint(**kwargs: Any) -> tuple:
+    """検索条件を正規化したキー（全角・半角や引数の順序が違うだけの条件は同じキーになる）"""
+    items = []
+    for key in sorted(kwargs):
+        value = kwargs[key]
+        if value is None:
+            continue
+        if key in KEYWORD_FIELDS:
+            items.append((key, parse_keyword(value)))
+        elif key in SCALAR_FIELDS:
+            items.append((key, value))
+    return tuple(items)
+
+
+class CompiledSearch(NamedTuple):
+    """検索条件の形ごとにコンパイルしたSQL"""
+
+    sql: str
+    # (列名, パラメータのテンプレート) のタプル。キーワードの列は語ごとにテンプレートを適用する
+    bindings: tuple[tuple[str, tuple[str, ...] | None], ...]
+
+
+# 検索条件の形: (列名, キーワードの場合は OR の項ごとの語数) のタプル
+SearchShape = tuple[tuple[str, tuple[int, ...] | None], ...]
+
+
+@lru_cache(maxsize=256)
+def compile_search(shape: SearchShape, order: str, asc: bool) -> CompiledSearch:
+    """検索条件の形から SQL を組み立てる
+
+    同じ形の検索には同じ SQL の文字列を返すため、sqlite3 のステートメントキャッシュが効く。
+
+    Args:
+        shape (SearchShape): 検索条件の形
+        order (str): 並び替えに使う列
+        asc (bool): 昇順の場合True
+
+    Returns:
+        CompiledSearch: SQL とパラメータの組み立て方
+    """
+    conditions = []
+    bindings = []
+    for key, term_sizes in shape:
+        if term_sizes is None:
+            conditions.append(SCALAR_FIELDS[key])
+            bindings.append((key, None))
+        else:
+            single_query, templates = KEYWORD_FIELDS[key]
+            conditions.extend(f"({' OR '.join([single_query] * size)})" for size in term_sizes)
+            bindings.append((key, templates))
+
+    filter = ("WHERE " + " AND ".join(conditions)) if conditions else ""
+    sql = f"SELECT * FROM songs {filter} ORDER BY {order} {'ASC' if asc else 'DESC'}"
+    return CompiledSearch(sql, tuple(bindings))
+
+
+def build_search(**kwargs: Any) -> tuple[str, list[Any]]:
+    """search_songs の引数から、SQL とパラメータのリストを作る
+
+    Args:
+        **kwargs: 検索条件（q, title, vocal, mainChord, order, asc等）
+
+    Returns:
+        tuple[str, list[Any]]: SQL とパラメータのリスト
+    """
+    shape = []
+    values: dict[str, Any] = {}
+    # 引数の順序が違っても同じ SQL になるよう、列名の順に並べる
+    for key in sorted(kwargs):
+        value = kwargs[key]
+        if value is None:
+            continue
+
+        if key in KEYWORD_FIELDS:
+            query = parse_keyword(value)
+            if not query:
+                continue
+            shape.append((key, tuple(len(term.words) for term in query)))
+            values[key] = query
+        elif key in SCALAR_FIELDS:
+            shape.append((key, None))
+            values[key] = value
+
+    order = kwargs.get("order")
+    # kwargsにNoneが入る可能性はある。類似度などの列に無い項目では既定の並び順にする
+    if order not in SORTABLE_COLUMNS:
+        order = DEFAULT_ORDER
+
+    compiled = compile_search(tuple(shape), order, bool(kwargs.get("asc")))
+
+    params = []
+    for key, templates in compiled.bindings:
+        if templates is None:
+            params.append(values[key])
+            continue
+        for term in values[key]:
+            for word in term.words:
+                params.extend(template.format(word) for template in templates)
+
+    return compiled.sql, params
+
+
+def _normalized_word_condition(word: str, ngram: int) -> tuple[str, list[Any]]:
+    """正規化した1語に一致する条件（song_search_text を search として参照する）"""
+    conditions = []
+    params: list[Any] = []
+    if "%" in word or "_" in word:
+        # ワイルドカードを含む語は n-gram で絞り込めないため、正規化した文字列に LIKE を使う
+        for field in ("title", "comment"):
+            conditions.append(f"search.{field} LIKE ?")
+            params.append(f"%{word}%")
+    elif len(word) < ngram:
+        # n-gram より短い語は、正規化した文字列から直接探す
+        for field in ("title", "comment"):
+            conditions.append(f"instr(search.{field}, ?) > 0")
+            params.append(word)
+    else:
+        grams = sorted({word[start : start + ngram] for start in range(len(word) - ngram + 1)})
+        placeholders = ", ".join("?" * len(grams))
+        for field in ("title", "comment"):
+            # n-gram がすべて含まれる楽曲に絞り込み、連続して含まれているかを確認する
+            conditions.append(
+                f"""(search.songID IN (
+                    SELECT songID FROM song_search_terms WHERE field = '{field}' AND term IN ({placeholders})
+                    GROUP BY songID HAVING COUNT(*) = ?
+                ) AND instr(search.{field}, ?) > 0)"""
+            )
+            params.extend([*grams, len(grams), word])
+    conditions.append("search.songID IN (SELECT songID FROM song_search_terms WHERE field = 'name' AND term = ?)")
+    params.append(word)
+    return "(" + " OR ".join(conditions) + ")", params
+
+
+def build_normalized_search(query: KeywordQuery, ngram: int = 2) -> tuple[str, list[Any]]:
+    """正規化したキーワードの構文木から、表記の揺れを吸収した検索の SQL とパラメータのリストを作る
+
+    書き込み時に正規化して保存した song_search_text・song_search_terms を使い、楽曲ごとの正規化は行わない。
+
+    Args:
+        query (KeywordQuery): 語を正規化した構文木
+        ngram (int, optional): song_search_terms に保存した n-gram の文字数. Defaults to 2.
+
+    Returns:
+        tuple[str, list[Any]]: SQL とパラメータのリスト（公開日時の新しい順）
+    """
+    conditions = []
+    params: list[Any] = []
+    for term in query:
+        word_conditions = []
+        for word in term.words:
+            condition, word_params = _normalized_word_condition(word, ngram)
+            word_conditions.append(condition)
+            params.extend(word_params)
+        conditions.append(f"({' OR '.join(word_conditions)})")
+
+    filter = ("WHERE " + " AND ".join(conditions)) if conditions else ""
+    sql = f"""
+        SELECT songs.* FROM song_search_text AS search
+        JOIN songs ON songs.id = search.songID
+        {filter}
+        ORDER BY songs.{DEFAULT_ORDER} DESC
+    """
+    return sql, params
+
+
+def build_similar_search(grams: list[str], minimum: float, limit: int) -> tuple[str, list[Any]]:
+    """タイトル・クリエイター名に、キーワードの n-gram を多く含む楽曲を検索する SQL とパラメータのリストを作る
+
+    Args:
+        grams (list[str]): 正規化したキーワードの n-gram
+        minimum (float): 含まれている n-gram の数の下限
+        limit (int): 楽曲の最大数
+
+    Returns:
+        tuple[str, list[Any]]: SQL とパラメータのリスト（含まれている n-gram の多い順）
+    """
+    placeholders = ", ".join("?" * len(grams))
+    sql = f"""
+        SELECT songs.* FROM (
+            SELECT songID, COUNT(DISTINCT term) AS hits FROM song_search_terms
+            WHERE field IN ('title', 'creators') AND term IN ({placeholders})
+            GROUP BY songID
+        ) AS matched
+        JOIN songs ON songs.id = matched.songID
+        WHERE matched.hits >= ?
+        ORDER BY matched.hits DESC, songs.{DEFAULT_ORDER} DESC
+        LIMIT ?
+    """
+    return sql, [*grams, minimum, limit]
+
+
+def cache_stats() -> dict[str, tuple[int, int]]:
+    """キーワードの解析と SQL の組み立てのキャッシュの (ヒット数, ミス数)"""
+    parse_info = _parse_normalized.cache_info()
+    compile_info = compile_search.cache_info()
+    return {
+        "parse_keyword": (parse_info.hits, parse_info.misses),
+        "compile_search": (compile_info.hits, compile_info.misses),
+    }
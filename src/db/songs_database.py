@@ -1,9 +1,12 @@
 import sqlite3
 import heapq
-from typing import Optional
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, Literal, Optional
 import json
+import logging
 from src.utils.logger import logger
-import shlex
+from src.utils.metrics import DB_QUERY_SECONDS, SCORING_SECONDS, timed_methods
 
 from src.utils.songs import (
     Song,
@@ -12,56 +15,82 @@ from src.utils.songs import (
     SongInQueue,
     SongsStats,
     SongsCustomParameters,
+    SongsSearchIndex,
+    TypeaheadIndex,
 )
 from src.utils.fastapi_models import SongWithScore
+from src.utils.songs.normalize import NORMALIZE_RULES_VERSION, normalize_text
+from src.utils.songs.search_index import keyword_grams
+from src.db.search_query import (
+    OrTerm,
+    build_normalized_search,
+    build_search,
+    build_similar_search,
+    parse_keyword,
+    search_fingerprint,
+)
 
 # sqliteでlist型を扱う
 # 参考: https://qiita.com/t4t5u0/items/2e789dfc5edd0d01b8da
 sqlite3.register_adapter(list, lambda l: json.dumps(l, ensure_ascii=False))
 sqlite3.register_converter("LIST", lambda s: json.loads(s))
 
-
-def keyword_to_query(keyword: str, single_query: str, params_template: str = "{}") -> tuple[str, list[str]]:
-    """検索キーワードをSQLのWHERE句とパラメータのリストに変換する
-
-    Args:
-        keyword (str): 検索キーワード。スペースでAND、|でORを表す
-
-    Returns:
-        tuple[str, list[str]]: SQLのWHERE句とパラメータのリスト
-    """
-    conditions = []
-    params = []
-
-    table = {"　": " ", "｜": "|", " | ": "|", " |": "|", "| ": "|", " OR ": "|"}
-    keyword = keyword.strip()
-    for old, new in table.items():
-        keyword = keyword.replace(old, new)
-
-    try:
-        split_keyword = shlex.split(keyword)
-    except ValueError:
-        split_keyword = keyword.split()
-
-    for and_word in split_keyword:
-        or_conditions = []
-        for word in and_word.split("|"):
-            or_conditions.append(single_query)
-            params.append(params_template.format(word))
-        conditions.append(f"({' OR '.join(or_conditions)})")
-
-    return conditions, params
-
-
+# search_songs・search_songs_fuzzy の検索方法（"index" はメモリ上の転置インデックス）
+SearchBackend = Literal["sqlite", "index"]
+
+_SEARCH_QUERY_SECONDS = DB_QUERY_SECONDS.labels("SongsDatabase", "search_songs")
+_FUZZY_QUERY_SECONDS = DB_QUERY_SECONDS.labels("SongsDatabase", "search_songs_fuzzy")
+
+# 表記の揺れを吸収した検索で、保存する n-gram の文字数（SongsSearchIndex と同じ）
+_SEARCH_NGRAM = 2
+
+
+# search_songs は SQL で検索する場合のみ、メソッドの中で計測する
+@timed_methods(
+    DB_QUERY_SECONDS,
+    "init_database",
+    "add_song",
+    "get_song_by_id",
+    "get_all_songs",
+    "update_song",
+    "update_songs_video_data_batch",
+    "update_songs_lyrics_data_batch",
+    "delete_song",
+    "get_songs_count",
+    "add_songs_batch",
+    "clear_all_songs",
+)
 class SongsDatabase:
-    def __init__(self, db_path: str = "data/songs.db"):
+    def __init__(self, db_path: str = "data/songs.db", search_backend: SearchBackend = "sqlite"):
         """
         SQLite3を使用したSongsデータベースクラス
 
         Args:
             db_path: データベースファイルのパス
+            search_backend: search_songs・search_songs_fuzzy の検索方法。"index" の場合はメモリ上の転置インデックスで検索する
         """
         self.db_path = db_path
+        self.search_backend = search_backend
+        # 検索用の読み取り専用の接続（スレッドごと）。同じSQLの再利用でステートメントキャッシュが効く
+        self._local = threading.local()
+        # close() で閉じるため、作成した検索用の接続を全て保持する
+        self._read_connections: list[sqlite3.Connection] = []
+        self._read_connections_lock = threading.Lock()
+        # 他の接続からの書き込みを検出するための接続（版の取得のみに使う）
+        self._revision_conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._revision_lock = threading.Lock()
+        # (作成時の版, インデックス)
+        self._search_index: Optional[tuple[int, SongsSearchIndex]] = None
+        self._search_index_lock = threading.Lock()
+        # (版, 検索条件, 値の最大数) -> 集計結果
+        self._facets_cache: OrderedDict[tuple, tuple[int, dict[str, Any]]] = OrderedDict()
+        self._facets_cache_size = 256
+        # (反映済みの版, 入力補完のインデックス)
+        self._typeahead: Optional[tuple[int, TypeaheadIndex]] = None
+        self._typeahead_lock = threading.Lock()
+        self._facets_cache_lock = threading.Lock()
+        self.facets_cache_hits = 0
+        self.facets_cache_misses = 0
         self.init_database()
 
         if self.get_songs_count() > 0:
@@ -95,8 +124,106 @@ class SongsDatabase:
                 )
             """
             )
+            # 楽曲データの版。songs への書き込みのたびにトリガーで1ずつ増やす（他のプロセスからの書き込みも含む）
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS catalog_revision (id INTEGER PRIMARY KEY CHECK (id = 0), revision INTEGER NOT NULL)"
+            )
+            conn.execute("INSERT OR IGNORE INTO catalog_revision (id, revision) VALUES (0, 0)")
+            for event in ("INSERT", "UPDATE", "DELETE"):
+                conn.execute(
+                    f"""
+                    CREATE TRIGGER IF NOT EXISTS songs_revision_{event.lower()} AFTER {event} ON songs
+                    BEGIN
+                        UPDATE catalog_revision SET revision = revision + 1 WHERE id = 0;
+                    END
+                """
+                )
+
+            # 表記の揺れを吸収した検索用に、書き込み時に正規化した文字列と n-gram を保存する
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS song_search_text (
+                    songID TEXT PRIMARY KEY,
+                    title TEXT,
+                    comment TEXT,
+                    creators TEXT,
+                    version INTEGER NOT NULL
+                )
+            """
+            )
+            # field が title・comment・creators の場合は n 文字の n-gram、name の場合はクリエイター名
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS song_search_terms (
+                    field TEXT NOT NULL,
+                    term TEXT NOT NULL,
+                    songID TEXT NOT NULL,
+                    PRIMARY KEY (field, term, songID)
+                ) WITHOUT ROWID
+            """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_song_search_terms_song ON song_search_terms (songID)")
+            conn.execute(
+                """
+                CREATE TRIGGER IF NOT EXISTS songs_delete_search AFTER DELETE ON songs
+                BEGIN
+                    DELETE FROM song_search_text WHERE songID = OLD.id;
+                    DELETE FROM song_search_terms WHERE songID = OLD.id;
+                END
+            """
+            )
+            # 未作成、または正規化のルールが古い楽曲の検索用の文字列を作る
+            stale = conn.execute(
+                """
+                SELECT id FROM songs
+                WHERE id NOT IN (SELECT songID FROM song_search_text WHERE version = ?)
+            """,
+                (NORMALIZE_RULES_VERSION,),
+            ).fetchall()
+            self._index_search_text(conn, [row[0] for row in stale])
             conn.commit()
 
+    @staticmethod
+    def _index_search_text(conn: sqlite3.Connection, song_ids: list[str]):
+        """楽曲の検索用の文字列と n-gram を作り直す（書き込みと同じトランザクションで呼ぶ）
+
+        Args:
+            conn (sqlite3.Connection): 書き込み中の接続（detect_types=PARSE_DECLTYPES）
+            song_ids (list[str]): 対象の楽曲ID（存在しない楽曲の検索用の文字列は削除する）
+        """
+        if not song_ids:
+            return
+
+        ids = json.dumps(song_ids)
+        conn.execute("DELETE FROM song_search_text WHERE songID IN (SELECT value FROM json_each(?))", (ids,))
+        conn.execute("DELETE FROM song_search_terms WHERE songID IN (SELECT value FROM json_each(?))", (ids,))
+        rows = conn.execute(
+            "SELECT id, title, comment, vocal, illustrations, movie FROM songs WHERE id IN (SELECT value FROM json_each(?))",
+            (ids,),
+        ).fetchall()
+
+        texts = []
+        terms = []
+        for song_id, title, comment, *creator_lists in rows:
+            title = None if title is None else normalize_text(title)
+            comment = None if comment is None else normalize_text(comment)
+            names = sorted({normalize_text(name) for names in creator_lists for name in names or []})
+            creators = "\n".join(names)
+            texts.append((song_id, title, comment, creators, NORMALIZE_RULES_VERSION))
+
+            for field, text in (("title", title), ("comment", comment), ("creators", creators)):
+                if text:
+                    grams = {text[start : start + _SEARCH_NGRAM] for start in range(len(text) - _SEARCH_NGRAM + 1)}
+                    terms.extend((field, gram, song_id) for gram in grams)
+            terms.extend(("name", name, song_id) for name in names)
+
+        conn.executemany(
+            "INSERT INTO song_search_text (songID, title, comment, creators, version) VALUES (?, ?, ?, ?, ?)", texts
+        )
+        # 主キーの順に挿入すると、B-tree への挿入が速い
+        terms.sort()
+        conn.executemany("INSERT OR IGNORE INTO song_search_terms (field, term, songID) VALUES (?, ?, ?)", terms)
+
     def add_song(self, song: Song) -> bool:
         """
         楽曲を追加
@@ -109,6 +236,8 @@ class SongsDatabase:
         """
         try:
             with sqlite3.connect(self.db_path, detect_types=sqlite3.PARSE_DECLTYPES) as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                revision = self._revision(conn)
                 conn.execute(
                     """
                     INSERT INTO songs (
@@ -140,8 +269,12 @@ class SongsDatabase:
                         song.comment,
                     ),
                 )
+                self._index_search_text(conn, [song.id])
+                new_revision = self._revision(conn)
+                new_song = self._fetch_song(conn, song.id)
                 conn.commit()
-                return True
+            self._update_typeahead(revision, new_revision, None, new_song)
+            return True
         except sqlite3.IntegrityError as e:
             logger.warning(f"Error adding song: {e}")
             # 同じIDの楽曲が既に存在する場合
@@ -192,6 +325,9 @@ class SongsDatabase:
             bool: 更新に成功した場合True、楽曲が存在しない場合False
         """
         with sqlite3.connect(self.db_path, detect_types=sqlite3.PARSE_DECLTYPES) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            revision = self._revision(conn)
+            old_song = self._fetch_song(conn, song_id if song_id is not None else song.id)
             cursor = conn.execute(
                 """
                 UPDATE songs SET
@@ -225,8 +361,14 @@ class SongsDatabase:
                     song_id if song_id is not None else song.id,
                 ),
             )
+            if cursor.rowcount > 0:
+                self._index_search_text(conn, list({song.id, song_id if song_id is not None else song.id}))
+            new_revision = self._revision(conn)
+            new_song = self._fetch_song(conn, song.id)
             conn.commit()
-            return cursor.rowcount > 0
+        if cursor.rowcount > 0:
+            self._update_typeahead(revision, new_revision, old_song, new_song)
+        return cursor.rowcount > 0
 
     def update_songs_video_data_batch(self, songs: list[SongVideoData]) -> bool:
         """
@@ -259,6 +401,8 @@ class SongsDatabase:
                         song.id,
                     ),
                 )
+            # タイトルが変わるため、検索用の文字列も作り直す
+            self._index_search_text(conn, [song.id for song in songs])
             conn.commit()
             return cursor.rowcount > 0
 
@@ -305,9 +449,15 @@ class SongsDatabase:
             bool: 削除に成功した場合True、楽曲が存在しない場合False
         """
         with sqlite3.connect(self.db_path, detect_types=sqlite3.PARSE_DECLTYPES) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            revision = self._revision(conn)
+            old_song = self._fetch_song(conn, song_id)
             cursor = conn.execute("DELETE FROM songs WHERE id = ?", (song_id,))
+            new_revision = self._revision(conn)
             conn.commit()
-            return cursor.rowcount > 0
+        if cursor.rowcount > 0:
+            self._update_typeahead(revision, new_revision, old_song, None)
+        return cursor.rowcount > 0
 
     def search_songs(self, **kwargs: dict[str, str]) -> list[Song]:
         """
@@ -319,72 +469,196 @@ class SongsDatabase:
         Returns:
             list[Song]: 条件に一致する楽曲のリスト
         """
-        conditions = []
-        params = []
-
-        for key, value in kwargs.items():
-            if value is None:
-                continue
-
-            if key == "q":
-                current_conditions, current_params = keyword_to_query(
-                    value,
-                    f"title LIKE ? OR comment LIKE ? OR EXISTS (SELECT 1 FROM json_each(vocal) WHERE json_each.value = ?) OR EXISTS (SELECT 1 FROM json_each(illustrations) WHERE json_each.value = ?) OR EXISTS (SELECT 1 FROM json_each(movie) WHERE json_each.value = ?)",
-                    params_template="{}",
-                )
-                conditions.extend(current_conditions)
-                for param in current_params:
-                    params.extend([f"%{param}%"] * 2 + [param] * 3)
-
-            elif key in ["title", "comment"]:
-                current_conditions, current_params = keyword_to_query(value, f"{key} LIKE ?", params_template="%{}%")
-                conditions.extend(current_conditions)
-                params.extend(current_params)
-
-            elif key in ["vocal", "illustrations", "movie"]:
-                current_conditions, current_params = keyword_to_query(
-                    value, f"EXISTS (SELECT 1 FROM json_each({key}) WHERE json_each.value = ?)"
-                )
-                conditions.extend(current_conditions)
-                params.extend(current_params)
+        if self.search_backend == "index":
+            return self.search_index().search(**kwargs)
 
-            elif key in ["id", "mainChord", "mainKey", "publishedType"]:
-                conditions.append(f"{key} = ?")
-                params.append(value)
+        query, params = build_search(**kwargs)
 
-            elif key == "publishedAfter":
-                conditions.append("publishedTimestamp >= ?")
-                params.append(value)
-            elif key == "publishedBefore":
-                conditions.append("publishedTimestamp <= ?")
-                params.append(value)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Executing query: %s", query)
+            logger.debug("With parameters: %s", params)
 
-        if conditions:
-            filter = "WHERE " + " AND ".join(conditions)
-        else:
-            filter = ""
-
-        order = kwargs.get("order")
-        # kwargsにNoneが入る可能性はある
-        if order is None:
-            order = "publishedTimestamp"
+        with _SEARCH_QUERY_SECONDS.time():
+            cursor = self._read_connection().execute(query, params)
+            rows = cursor.fetchall()
+        return [Song(**row) for row in rows]
+
+    def _read_connection(self) -> sqlite3.Connection:
+        """検索用の接続を取得（スレッドごとに使い回す）"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # 使うのは作成したスレッドのみだが、close() で他のスレッドから閉じられるようにする
+            conn = sqlite3.connect(self.db_path, detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+            with self._read_connections_lock:
+                self._read_connections.append(conn)
+        return conn
+
+    def close(self):
+        """検索用・版の取得用に保持している接続を閉じる（終了時に呼ぶ）"""
+        with self._read_connections_lock:
+            connections, self._read_connections = self._read_connections, []
+            self._local = threading.local()
+        for conn in connections:
+            conn.close()
+        with self._revision_lock:
+            self._revision_conn.close()
+
+    def catalog_revision(self) -> int:
+        """楽曲データの版。どの接続・プロセスからでも、songs に書き込まれるたびに増える"""
+        with self._revision_lock:
+            return self._revision(self._revision_conn)
+
+    @staticmethod
+    def _revision(conn: sqlite3.Connection) -> int:
+        return conn.execute("SELECT revision FROM catalog_revision WHERE id = 0").fetchone()[0]
+
+    @staticmethod
+    def _fetch_song(conn: sqlite3.Connection, song_id: str) -> Optional[Song]:
+        """書き込み中のトランザクションから楽曲を取得"""
+        cursor = conn.execute("SELECT * FROM songs WHERE id = ?", (song_id,))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        return Song(**dict(zip([column[0] for column in cursor.description], row)))
+
+    def search_index(self) -> SongsSearchIndex:
+        """メモリ上の検索用インデックスを取得（楽曲データが変更されていれば作り直す）"""
+        return self._current_search_index()[1]
+
+    def _current_search_index(self) -> tuple[int, SongsSearchIndex]:
+        revision = self.catalog_revision()
+        current = self._search_index
+        if current is None or current[0] != revision:
+            with self._search_index_lock:
+                current = self._search_index
+                if current is None or current[0] != revision:
+                    # 作成中の書き込みは次回の取得時に反映されるよう、版は作成前に取得したものを使う
+                    current = self._search_index = (revision, SongsSearchIndex(self.get_all_songs()))
+        return current
+
+    def typeahead(self) -> TypeaheadIndex:
+        """入力補完のインデックスを取得（このインスタンス以外から楽曲データが変更されていれば作り直す）"""
+        revision = self.catalog_revision()
+        current = self._typeahead
+        if current is None or current[0] != revision:
+            with self._typeahead_lock:
+                current = self._typeahead
+                if current is None or current[0] != revision:
+                    current = self._typeahead = (revision, TypeaheadIndex(self.get_all_songs()))
+        return current[1]
+
+    def _update_typeahead(
+        self, revision: int, new_revision: int, old_song: Optional[Song], new_song: Optional[Song]
+    ):
+        """このインスタンスでの楽曲の追加・更新・削除を、入力補完のインデックスに反映する
+
+        版は書き込みと同じトランザクションの中で取得したもので、その間に他からの書き込みは無い。
+        インデックスが書き込み前の版まで反映済みの場合のみ差分を反映し、それ以外は作り直す。
 
-        is_asc = kwargs.get("asc", False)
-        if is_asc is None:
-            is_asc = False
+        Args:
+            revision (int): 書き込み前の版
+            new_revision (int): 書き込み後の版
+            old_song (Optional[Song]): 変更前の楽曲（追加の場合は None）
+            new_song (Optional[Song]): 変更後の楽曲（削除の場合は None）
+        """
+        with self._typeahead_lock:
+            current = self._typeahead
+            if current is None:
+                return
+            if current[0] != revision:
+                # 反映していない他からの書き込み（別のプロセス・同時に行われた書き込み）がある
+                self._typeahead = None
+                return
+
+            if old_song is not None:
+                current[1].remove_song(old_song)
+            if new_song is not None:
+                current[1].add_song(new_song)
+            self._typeahead = (new_revision, current[1])
+
+    def search_songs_fuzzy(self, keyword: str, limit: int = 20) -> list[Song]:
+        """表記の揺れや入力ミスを許容したキーワード検索
+
+        ひらがな・カタカナなどの違いを吸収して検索し、一致する楽曲が無い場合は n-gram の類似度で似た楽曲を探す。
 
-        # orderとascはパラメータ化できない
-        query = f"SELECT * FROM songs {filter} ORDER BY {order} {'ASC' if is_asc else 'DESC'}"
+        Args:
+            keyword (str): 検索キーワード。スペースでAND、|でORを表す
+            limit (int, optional): 似た楽曲を探す場合の最大数。デフォルトは20。
 
-        logger.debug(f"Executing query: {query}")
-        logger.debug(f"With parameters: {params}")
+        Returns:
+            list[Song]: 条件に一致する楽曲のリスト
+        """
+        if self.search_backend == "index":
+            index = self.search_index()
+            positions = index.search_normalized(keyword)
+            if not positions:
+                positions = index.search_similar(keyword, limit)
+            return [index.songs[position] for position in positions]
+
+        with _FUZZY_QUERY_SECONDS.time():
+            songs = self._search_normalized(keyword)
+            if not songs:
+                songs = self._search_similar(keyword, limit)
+        return songs
+
+    def _search_normalized(self, keyword: str) -> list[Song]:
+        """SongsSearchIndex.search_normalized と同じ検索を、保存済みの検索用の文字列で行う"""
+        terms = []
+        for term in parse_keyword(keyword):
+            words = tuple(word for word in map(normalize_text, term.words) if word)
+            if not words:
+                # 正規化すると空になる語だけの項には、どの楽曲も一致しない
+                return []
+            terms.append(OrTerm(words))
+
+        query, params = build_normalized_search(tuple(terms), _SEARCH_NGRAM)
+        rows = self._read_connection().execute(query, params).fetchall()
+        return [Song(**row) for row in rows]
+
+    def _search_similar(self, keyword: str, limit: int, threshold: float = 0.5) -> list[Song]:
+        """SongsSearchIndex.search_similar と同じ検索を、保存済みの n-gram で行う"""
+        grams = keyword_grams(keyword, _SEARCH_NGRAM)
+        # 短すぎるキーワードでは、似ている度合いを判断できない
+        if len(grams) < 2:
+            return []
+
+        query, params = build_similar_search(sorted(grams), threshold * len(grams), limit)
+        rows = self._read_connection().execute(query, params).fetchall()
+        return [Song(**row) for row in rows]
+
+    def search_facets(self, top: int = 10, **kwargs) -> tuple[int, dict[str, list[tuple[Hashable, int]]]]:
+        """条件に一致する楽曲について、ボーカル・公開年などの項目ごとに件数の多い値を集計
+
+        結果は検索条件と楽曲データの版ごとにキャッシュする。
 
-        with sqlite3.connect(self.db_path, detect_types=sqlite3.PARSE_DECLTYPES) as conn:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.execute(query, params)
-            rows = cursor.fetchall()
+        Args:
+            top (int, optional): 項目ごとの値の最大数。デフォルトは10。
+            **kwargs: 絞り込みの条件（search_songs と同じ）
 
-            return [Song(**row) for row in rows]
+        Returns:
+            tuple[int, dict[str, list[tuple[Hashable, int]]]]: 一致した楽曲数と、項目名 -> (値, 件数) のリスト
+        """
+        revision, index = self._current_search_index()
+        key = (revision, search_fingerprint(**kwargs), top)
+
+        with self._facets_cache_lock:
+            cached = self._facets_cache.get(key)
+            if cached is not None:
+                self._facets_cache.move_to_end(key)
+                self.facets_cache_hits += 1
+                return cached
+
+        mask = index.filter_mask(**kwargs)
+        result = (int(mask.sum()), index.columns.facet_counts(mask, top))
+
+        with self._facets_cache_lock:
+            self.facets_cache_misses += 1
+            self._facets_cache[key] = result
+            while len(self._facets_cache) > self._facets_cache_size:
+                self._facets_cache.popitem(last=False)
+        return result
 
     def get_songs_count(self) -> int:
         """
@@ -407,7 +681,7 @@ class SongsDatabase:
         Returns:
             int: 追加に成功した楽曲数
         """
-        success_count = 0
+        added_ids = []
         with sqlite3.connect(self.db_path, detect_types=sqlite3.PARSE_DECLTYPES) as conn:
             for song in songs:
                 try:
@@ -442,12 +716,13 @@ class SongsDatabase:
                             song.comment,
                         ),
                     )
-                    success_count += 1
+                    added_ids.append(song.id)
                 except sqlite3.IntegrityError:
                     # 既に存在する楽曲はスキップ
                     continue
+            self._index_search_text(conn, added_ids)
             conn.commit()
-        return success_count
+        return len(added_ids)
 
     def clear_all_songs(self):
         """全楽曲を削除（デバッグ用）"""
@@ -487,18 +762,59 @@ class SongsDatabase:
             songs = self.get_all_songs()
 
         queue: list[SongInQueue] = []
-        for song in songs:
-            if song == target:
-                continue
+        with SCORING_SECONDS.labels("find_nearest_song").time():
+            for song in songs:
+                if song == target:
+                    continue
 
-            if not song.score_can_be_calculated():
-                continue
+                if not song.score_can_be_calculated():
+                    continue
 
-            score = SongsMatchScore(song, target, self.std, parameters)
-            heapq.heappush(queue, SongInQueue(song, score, is_reversed))
+                score = SongsMatchScore(song, target, self.std, parameters)
+                heapq.heappush(queue, SongInQueue(song, score, is_reversed))
 
-        nearest_songs = [heapq.heappop(queue) for _ in range(min(limit, len(queue)))]
+            nearest_songs = [heapq.heappop(queue) for _ in range(min(limit, len(queue)))]
         return [
             SongWithScore(id=song_in_queue.song.id, song=song_in_queue.song, score=float(song_in_queue.score))
             for song_in_queue in nearest_songs
         ]
+
+    def search_nearest_songs(
+        self,
+        target: str,
+        limit: int = 10,
+        parameters: Optional[SongsCustomParameters] = None,
+        is_reversed: bool = False,
+        **kwargs,
+    ) -> list[SongWithScore]:
+        """条件で絞り込んだ楽曲のうち、曲調の似た楽曲を取得
+
+        search_songs と find_nearest_song を続けて呼ぶのと同じ結果を、メモリ上の列ごとの配列でまとめて計算する。
+
+        Args:
+            target (str): 検索対象の楽曲ID
+            limit (int, optional): 楽曲の最大数。デフォルトは10。
+            **kwargs: 絞り込みの条件（search_songs と同じ）
+
+        Raises:
+            ValueError: 曲が見つからない場合、またはスコア計算に必要なデータが不足している場合
+
+        Returns:
+            list[SongWithScore]: 曲調の似た楽曲のリスト
+        """
+        index = self.search_index()
+        columns = index.columns
+
+        position = columns.positions.get(target)
+        if position is None:
+            raise ValueError(f"Song with id {target} not found in database.")
+        if not columns.calculable[position]:
+            raise ValueError(f"Target song (ID: {target}) does not have enough data to calculate score.")
+
+        mask = index.filter_mask(**kwargs)
+        with SCORING_SECONDS.labels("search_nearest_songs").time():
+            nearest = columns.nearest(position, mask, self.std, limit, parameters, is_reversed)
+        return [
+            SongWithScore(id=index.songs[position].id, song=index.songs[position], score=score)
+            for position, score in nearest
+        ]
@@ -5,14 +5,10 @@ from src.utils.logger import logger
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 
 from src.db.songs_database import SongsDatabase
-from src.utils.config import ConfigStore
 from src.utils.songs import Song, SongVideoData
 from src.utils.youtube.api import list_videos
 
 
-config_store = ConfigStore()
-
-
 def handle_video_response(item: dict) -> SongVideoData:
     snippet = item.get("snippet", {})
     content_details = item.get("contentDetails", {})
@@ -1,18 +1,25 @@
 import sqlite3
+import time
+import uuid
 from typing import Iterable
-from src.utils.user_models import User, UserFromDB
-from src.utils.auth import get_firebase_user, get_firebase_users, firebase_users_cache
+from src.utils.user_models import User, UserFromDB, UserFromFirebase
+from src.utils.auth import get_firebase_user, firebase_user_directory
 
 
 class UsersDatabase:
-    def __init__(self, db_path: str = "data/songs.db"):
+    def __init__(self, db_path: str = "data/songs.db", firebase_ttl: int = 3600):
         """
         SQLite3を使用したユーザーデータベース
 
+        Firebaseのユーザー情報（アイコン・ゲストかどうか）は firebase_users テーブルにキャッシュし、
+        キャッシュが無い・古い場合のみFirebaseから取得する。
+
         Args:
             db_path: データベースファイルのパス
+            firebase_ttl: Firebaseのユーザー情報のキャッシュの有効期限（秒）
         """
         self.db_path = db_path
+        self.firebase_ttl = firebase_ttl
         self.init_database()
 
     def init_database(self):
@@ -26,6 +33,14 @@ class UsersDatabase:
                     useProvidedIcon INTEGER NOT NULL DEFAULT 0
                 );
             """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS firebase_users (
+                    firebaseUID TEXT PRIMARY KEY,
+                    IconURL TEXT,
+                    isGuest INTEGER NOT NULL DEFAULT 0,
+                    fetched_at INTEGER NOT NULL
+                );
+            """)
             conn.commit()
 
     def add_user(self, user: UserFromDB):
@@ -40,64 +55,123 @@ class UsersDatabase:
             )
             conn.commit()
 
-        firebase_users_cache = None
-
-    def get_user(self, firebase_uid: str) -> User:
-        """ユーザーを取得"""
-        firebase_user = get_firebase_user(firebase_uid)
+        firebase_user_directory.invalidate(user.firebaseUID)
 
+    def save_firebase_users(self, firebase_users: Iterable[UserFromFirebase]):
+        """Firebaseから取得したユーザー情報をキャッシュに保存"""
+        now = int(time.time())
         with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.execute(
+            conn.executemany(
                 """
-                SELECT id, displayName, useProvidedIcon
-                FROM users
-                WHERE firebaseUID = ?
+                INSERT OR REPLACE INTO firebase_users (firebaseUID, IconURL, isGuest, fetched_at)
+                VALUES (?, ?, ?, ?)
             """,
-                (firebase_uid,),
+                [(user.firebaseUID, user.IconURL, int(user.isGuest), now) for user in firebase_users],
             )
-            row = cursor.fetchone()
-            if row:
-                return User(
-                    id=row[0],
-                    displayName=row[1],
-                    IconURL=firebase_user.IconURL if bool(row[2]) else None,
-                    useProvidedIcon=bool(row[2]),
-                )
-            else:
-                self.add_user(UserFromDB(firebaseUID=firebase_uid))
-                return self.get_user(firebase_uid)
+            conn.commit()
+
+    def get_user(self, firebase_uid: str) -> User:
+        """ユーザーを取得（未登録の場合は追加）"""
+        row = self._select_user(firebase_uid)
+
+        if row is None or self._is_stale(row[4]):
+            firebase_user = get_firebase_user(firebase_uid)
+            self.save_firebase_users([firebase_user])
+
+            if row is None:
+                with sqlite3.connect(self.db_path) as conn:
+                    # 同時にリクエストが来た場合でも、ユーザーは1つだけ作成される
+                    conn.execute(
+                        """
+                        INSERT OR IGNORE INTO users (id, firebaseUID)
+                        VALUES (?, ?)
+                    """,
+                        (str(uuid.uuid4()), firebase_uid),
+                    )
+                    conn.commit()
+
+            row = self._select_user(firebase_uid)
+
+        user_id, display_name, use_provided_icon, icon_url, _ = row
+        return User(
+            id=user_id,
+            displayName=display_name,
+            IconURL=icon_url if bool(use_provided_icon) else None,
+            useProvidedIcon=bool(use_provided_icon),
+        )
 
     def get_users_by_ids(self, user_ids: Iterable[str]) -> dict[str, User]:
         """複数のユーザーIDに紐づくユーザー情報を取得"""
+        user_ids = list(user_ids)
         if len(user_ids) == 0:
             return {}
 
         with sqlite3.connect(self.db_path) as conn:
             cursor = conn.execute(
                 f"""
-                SELECT firebaseUID, id, displayName, useProvidedIcon
+                SELECT users.firebaseUID, users.id, users.displayName, users.useProvidedIcon,
+                    firebase_users.IconURL, firebase_users.fetched_at
                 FROM users
-                WHERE id IN ({','.join('?' for _ in user_ids)})
+                LEFT JOIN firebase_users ON firebase_users.firebaseUID = users.firebaseUID
+                WHERE users.id IN ({','.join('?' for _ in user_ids)})
             """,
                 user_ids,
             )
             rows = cursor.fetchall()
 
-        firebase_users = {user.firebaseUID: user for user in get_firebase_users()}
+        # アイコンを表示するユーザーのうち、キャッシュが無い・古いものだけFirebaseから取得
+        stale_uids = [row[0] for row in rows if bool(row[3]) and self._is_stale(row[5])]
+        firebase_users = firebase_user_directory.get_many(stale_uids) if stale_uids else {}
+        if firebase_users:
+            self.save_firebase_users(firebase_users.values())
 
         users = {}
         for row in rows:
-            firebase_uid, user_id, display_name, use_provided_icon = row
-            firebase_user = firebase_users.get(firebase_uid)
+            firebase_uid, user_id, display_name, use_provided_icon, icon_url, _ = row
+            if firebase_uid in firebase_users:
+                icon_url = firebase_users[firebase_uid].IconURL
             users[user_id] = User(
                 id=user_id,
                 displayName=display_name,
-                IconURL=firebase_user.IconURL if bool(use_provided_icon) else None,
+                IconURL=icon_url if bool(use_provided_icon) else None,
                 useProvidedIcon=bool(use_provided_icon),
             )
 
         return users
 
+    def get_guest_flags(self, user_ids: Iterable[str]) -> dict[str, bool]:
+        """複数のユーザーIDについて、ゲストユーザーかどうかを取得（Firebaseに存在しない場合はTrue）"""
+        user_ids = list(user_ids)
+        if len(user_ids) == 0:
+            return {}
+
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.execute(
+                f"""
+                SELECT users.firebaseUID, users.id, firebase_users.isGuest, firebase_users.fetched_at
+                FROM users
+                LEFT JOIN firebase_users ON firebase_users.firebaseUID = users.firebaseUID
+                WHERE users.id IN ({','.join('?' for _ in user_ids)})
+            """,
+                user_ids,
+            )
+            rows = cursor.fetchall()
+
+        stale_uids = {row[0] for row in rows if self._is_stale(row[3])}
+        firebase_users = firebase_user_directory.get_many(stale_uids) if stale_uids else {}
+        if firebase_users:
+            self.save_firebase_users(firebase_users.values())
+
+        guest_flags = {}
+        for firebase_uid, user_id, is_guest, _ in rows:
+            if firebase_uid in stale_uids:
+                firebase_user = firebase_users.get(firebase_uid)
+                guest_flags[user_id] = firebase_user is None or firebase_user.isGuest
+            else:
+                guest_flags[user_id] = bool(is_guest)
+
+        return guest_flags
+
     def get_user_firebase_uids(self) -> dict[str, str]:
         """ユーザーIDとFirebase UIDの対応を取得"""
         with sqlite3.connect(self.db_path) as conn:
@@ -132,4 +206,22 @@ class UsersDatabase:
             """,
                 (firebase_uid,),
             )
+            conn.execute("DELETE FROM firebase_users WHERE firebaseUID = ?", (firebase_uid,))
             conn.commit()
+
+    def _select_user(self, firebase_uid: str) -> tuple | None:
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.execute(
+                """
+                SELECT users.id, users.displayName, users.useProvidedIcon,
+                    firebase_users.IconURL, firebase_users.fetched_at
+                FROM users
+                LEFT JOIN firebase_users ON firebase_users.firebaseUID = users.firebaseUID
+                WHERE users.firebaseUID = ?
+            """,
+                (firebase_uid,),
+            )
+            return cursor.fetchone()
+
+    def _is_stale(self, fetched_at: int | None) -> bool:
+        return fetched_at is None or time.time() - fetched_at > self.firebase_ttl
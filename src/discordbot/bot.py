@@ -1,20 +1,34 @@
 import discord
 from discord.ext import commands
 
-from src.utils.config import ConfigStore
-
-config = ConfigStore()._config
+from src.discordbot.notifications import NotificationDispatcher
+from src.utils.config import ConfigSnapshot, shared_config_store
 
 
 class BackendDiscordClient(commands.Bot):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.default_channel = None
+        # コメント・チャットの投稿などの通知はまとめて送信する
+        self.notifications = NotificationDispatcher(self)
+        shared_config_store().subscribe(self.on_config_change)
+
+    async def setup_hook(self):
+        self.notifications.start()
 
     async def on_ready(self):
-        self.default_channel = self.get_channel(config.discord_channel_id)
+        self.default_channel = self.get_channel(shared_config_store().snapshot.config.discord_channel_id)
         print(f"Logged on as {self.user}!")
 
+    def on_config_change(self, snapshot: ConfigSnapshot):
+        # 通知先のチャンネルが変更された場合は切り替える
+        if self.is_ready():
+            self.default_channel = self.get_channel(snapshot.config.discord_channel_id)
+
+    async def close(self):
+        await self.notifications.stop()
+        await super().close()
+
 
 default_intents = discord.Intents.default()
 default_intents.message_content = True
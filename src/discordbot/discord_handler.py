@@ -2,6 +2,11 @@
 # created by takechi in MIT License
 
 import logging
+import logging.handlers
+import queue
+import sys
+import time
+from collections import OrderedDict
 from typing import Optional, Callable
 import asyncio
 
@@ -9,8 +14,161 @@ import discord
 from discord import Embed
 from discord.ext import commands
 
+# Discordの1メッセージあたりのEmbedの上限
+MAX_EMBEDS_PER_MESSAGE = 10
 
-class DiscordHandler(logging.Handler):
+# 送信待ちのログをすぐに送信させるための合図
+_FLUSH = object()
+# キューが空のまま待ち時間が過ぎたことを表す（QueueListener の停止の合図は None のため区別する）
+_TIMEOUT = object()
+
+
+class TokenBucket:
+    def __init__(self, rate: int, per: float):
+        """per 秒あたり rate 回までの送信を許可するトークンバケット"""
+        self.capacity = rate
+        self.per = per
+        self.tokens = float(rate)
+        self.updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.capacity / self.per)
+        self.updated_at = now
+
+    def wait_time(self) -> float:
+        """次のトークンが使えるようになるまでの秒数"""
+        self._refill()
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) * self.per / self.capacity
+
+    def acquire(self) -> bool:
+        self._refill()
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class DiscordQueueListener(logging.handlers.QueueListener):
+    # 停止時にキューの空きを待つ最大時間（秒）
+    sentinel_timeout = 1.0
+
+    def __init__(self, log_queue: queue.Queue, handler: "DiscordHandler"):
+        """キューに溜まったログをまとめてDiscordに送信するリスナー（専用のスレッドで動作）
+
+        同じ内容のログは件数をまとめた1つのEmbedにし、最大10個のEmbedを1つのメッセージで送信する。
+        送信の頻度はトークンバケットで制限し、送信できない間はログを溜めておく。
+        """
+        super().__init__(log_queue)
+        self.handler = handler
+        self.bucket = TokenBucket(handler.rate_limit, handler.rate_period)
+        # (レベル, ファイル名, メッセージ) -> [最初のレコード, 件数]
+        self.pending: OrderedDict[tuple, list] = OrderedDict()
+        self.first_pending_at = 0.0
+        self.dropped = 0
+
+    def _monitor(self):
+        flush_requested = False
+        while True:
+            try:
+                item = self.queue.get(timeout=self._next_timeout(flush_requested))
+            except queue.Empty:
+                item = _TIMEOUT
+
+            if item is self._sentinel:
+                self._flush_all()
+                return
+
+            if item is _FLUSH:
+                flush_requested = True
+            elif item is not _TIMEOUT:
+                self._add(item)
+
+            while self._should_send(flush_requested) and self.bucket.acquire():
+                self._send_batch()
+            if not self.pending:
+                flush_requested = False
+
+    def _add(self, record: logging.LogRecord):
+        key = (record.levelno, record.filename, record.getMessage())
+        if key in self.pending:
+            self.pending[key][1] += 1
+            return
+
+        if len(self.pending) >= self.handler.max_pending:
+            self.dropped += 1
+            return
+
+        if not self.pending:
+            self.first_pending_at = time.monotonic()
+        self.pending[key] = [record, 1]
+
+    def _next_timeout(self, flush_requested: bool) -> Optional[float]:
+        if not self.pending or not self.handler.is_ready_to_send():
+            return None if not self.pending else self.handler.batch_interval
+
+        if flush_requested or len(self.pending) >= MAX_EMBEDS_PER_MESSAGE:
+            wait = 0.0
+        else:
+            wait = self.first_pending_at + self.handler.batch_interval - time.monotonic()
+        return max(wait, self.bucket.wait_time(), 0.01)
+
+    def _should_send(self, flush_requested: bool) -> bool:
+        if not self.pending or not self.handler.is_ready_to_send():
+            return False
+        return (
+            flush_requested
+            or len(self.pending) >= MAX_EMBEDS_PER_MESSAGE
+            or time.monotonic() - self.first_pending_at >= self.handler.batch_interval
+        )
+
+    def _send_batch(self):
+        embeds = []
+        while self.pending and len(embeds) < MAX_EMBEDS_PER_MESSAGE:
+            _, (record, count) = self.pending.popitem(last=False)
+            try:
+                embed = self.handler.build_embed(record)
+                if count > 1:
+                    embed.title = f"{embed.title} (×{count})"
+                embeds.append(embed)
+            except Exception:
+                self.handler.handleError(record)
+
+        self.first_pending_at = time.monotonic()
+        if embeds:
+            self.handler.send_embeds(embeds)
+
+    def _flush_all(self):
+        while self.pending and self.handler.is_ready_to_send():
+            self._send_batch()
+
+    def enqueue_sentinel(self):
+        # キューが満杯だと put_nowait は queue.Full になり停止できないため、
+        # 空きを少し待ち、それでも空かなければ残りのログを破棄して停止の合図を入れる
+        try:
+            self.queue.put(self._sentinel, timeout=self.sentinel_timeout)
+            return
+        except queue.Full:
+            pass
+
+        while True:
+            try:
+                while True:
+                    if isinstance(self.queue.get_nowait(), logging.LogRecord):
+                        self.dropped += 1
+            except queue.Empty:
+                pass
+            try:
+                self.queue.put_nowait(self._sentinel)
+                return
+            except queue.Full:
+                # 破棄している間に他のスレッドがログを追加した
+                continue
+
+
+class DiscordHandler(logging.handlers.QueueHandler):
     def __init__(
         self,
         send_channel: int | discord.abc.Messageable,
@@ -19,68 +177,124 @@ class DiscordHandler(logging.Handler):
         embed_factory: Optional[Callable[[logging.LogRecord], Embed]] = None,
         embed_template: Optional[Embed] = None,
         level=logging.NOTSET,
+        batch_interval: float = 2.0,
+        rate_limit: int = 5,
+        rate_period: float = 5.0,
+        queue_size: int = 10000,
+        max_pending: int = 1000,
+        send_timeout: float = 30.0,
     ):
-        super().__init__(level=level)
+        """ログをDiscordのチャンネルにEmbedとして送信するハンドラ
+
+        emit はキューにログを追加するだけで、送信は専用のスレッドがまとめて行うため、
+        どのスレッドから呼ばれてもアプリケーションの処理を止めない。
+
+        Args:
+            batch_interval (float, optional): ログをまとめる時間（秒）. Defaults to 2.0.
+            rate_limit (int, optional): rate_period 秒あたりの最大送信回数. Defaults to 5.
+            rate_period (float, optional): 送信回数を数える期間（秒）. Defaults to 5.0.
+            queue_size (int, optional): 送信スレッドに渡す前のログの最大件数。超えた分は破棄. Defaults to 10000.
+            max_pending (int, optional): 送信待ちにできる異なる内容のログの最大件数. Defaults to 1000.
+            send_timeout (float, optional): 1回の送信を待つ最大時間（秒）. Defaults to 30.0.
+        """
+        super().__init__(queue.Queue(maxsize=queue_size))
+        self.setLevel(level)
         self.send_channel = send_channel
         self.bot: Optional[commands.Bot] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+
+        self.embed_factory = embed_factory
+        self.embed_template = embed_template or default_embed()
+        self.batch_interval = batch_interval
+        self.rate_limit = rate_limit
+        self.rate_period = rate_period
+        self.max_pending = max_pending
+        self.send_timeout = send_timeout
+        self.dropped = 0
+
+        self.listener = DiscordQueueListener(self.queue, self)
+        self.listener.start()
 
         if bot is not None or token is not None:
             self.init_bot(bot=bot, token=token)
         else:
             print("DiscordHandler is waiting bot initialized; call init_bot() later.")
 
-        self.embed_factory = embed_factory
-        self.embed_template = embed_template or default_embed()
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 送信スレッドで扱えるよう、メッセージを確定させたコピーを作る（トレースバックは送信しない）
+        record = logging.makeLogRecord(record.__dict__)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        record.exc_info = None
+        record.exc_text = None
+        record.stack_info = None
+        return record
 
-        self.send_queue = asyncio.Queue()
-
-    def emit(self, record):
+    def enqueue(self, record):
         try:
-            if self.embed_factory is not None:
-                embed = self.embed_factory(record)
-            else:
-                embed = self.embed_template.copy()
-                embed.title = embed.title % record.__dict__
-                embed.description = embed.description % record.__dict__
-
-                # fieldsは読み取り専用のため、そのまま書き換えはできない
-                fields = embed.fields
-                embed.clear_fields()
-                for field in fields:
-                    embed.add_field(name=field.name, value=field.value % record.__dict__, inline=field.inline)
-
-                if embed.color is None:
-                    level = record.levelno
-                    if level >= logging.CRITICAL:
-                        embed.color = 0xB31478
-                    elif level >= logging.ERROR:
-                        embed.color = 0xCC0022
-                    elif level >= logging.WARNING:
-                        embed.color = 0xE63D00
-                    elif level >= logging.INFO:
-                        embed.color = 0x1E90FF
-                    else:
-                        embed.color = 0x808080
-
-                embed.set_footer(text=embed.footer.text % record.__dict__)
-                embed.timestamp = discord.utils.utcnow()
-
-            if self._is_ready_to_send():
-                asyncio.create_task(self.send_channel.send(embed=embed))
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # ログが送信より速く増え続けている場合は破棄する
+            self.dropped += 1
+
+    def build_embed(self, record: logging.LogRecord) -> Embed:
+        if self.embed_factory is not None:
+            return self.embed_factory(record)
+
+        embed = self.embed_template.copy()
+        embed.title = embed.title % record.__dict__
+        embed.description = embed.description % record.__dict__
+
+        # fieldsは読み取り専用のため、そのまま書き換えはできない
+        fields = embed.fields
+        embed.clear_fields()
+        for field in fields:
+            embed.add_field(name=field.name, value=field.value % record.__dict__, inline=field.inline)
+
+        if embed.color is None:
+            level = record.levelno
+            if level >= logging.CRITICAL:
+                embed.color = 0xB31478
+            elif level >= logging.ERROR:
+                embed.color = 0xCC0022
+            elif level >= logging.WARNING:
+                embed.color = 0xE63D00
+            elif level >= logging.INFO:
+                embed.color = 0x1E90FF
             else:
-                self.send_queue.put_nowait(embed)
+                embed.color = 0x808080
 
-        except Exception:
-            self.handleError(record)
+        embed.set_footer(text=embed.footer.text % record.__dict__)
+        embed.timestamp = discord.utils.utcnow()
+        return embed
 
-    async def handle_send_queue(self):
-        while True:
-            if self._is_ready_to_send():
-                while self.send_queue.qsize() > 0:
-                    embed = await self.send_queue.get()
-                    await self.send_channel.send(embed=embed)
+    def send_embeds(self, embeds: list[Embed]):
+        """Botのイベントループで送信し、完了を待つ（送信スレッドから呼ばれる）"""
+        dropped = self.dropped + self.listener.dropped
+        if dropped > 0:
+            embeds[-1].add_field(name="破棄したログ", value=f"{dropped}件", inline=False)
+            self.dropped = self.listener.dropped = 0
 
-            await asyncio.sleep(10)
+        future = asyncio.run_coroutine_threadsafe(self.send_channel.send(embeds=embeds), self.loop)
+        try:
+            future.result(timeout=self.send_timeout)
+        except Exception as e:
+            # ロガーに出力すると再びこのハンドラに戻ってくるため、標準エラーに出力する
+            future.cancel()
+            print(f"DiscordHandler failed to send logs: {e!r}", file=sys.stderr)
+
+    def flush(self):
+        """送信待ちのログをすぐに送信させる"""
+        try:
+            self.queue.put_nowait(_FLUSH)
+        except queue.Full:
+            pass
+
+    def close(self):
+        if self.listener._thread is not None:
+            self.listener.stop()
+        super().close()
 
     def init_bot(self, bot: Optional[commands.Bot] = None, token: Optional[str] = None):
         if bot is not None:
@@ -93,28 +307,32 @@ class DiscordHandler(logging.Handler):
             loop = asyncio.get_event_loop()
             loop.create_task(self.bot.start(token))
 
-        # botを渡した場合でも、キュー処理タスクを起動する
-        loop = asyncio.get_event_loop()
-        loop.create_task(self.handle_send_queue())
-
-        if isinstance(self.send_channel, int):
-            channel_id = self.send_channel  # IDを保存
-
-            @self.bot.listen("on_ready")
-            async def on_ready_handler():
+        @self.bot.listen("on_ready")
+        async def on_ready_handler():
+            self.loop = asyncio.get_running_loop()
+            # 起動を待つ間に設定が読み込み直された場合も反映されるよう、この時点の send_channel から解決する
+            if isinstance(self.send_channel, int):
+                channel_id = self.send_channel
                 self.send_channel = self.bot.get_channel(channel_id)
                 if self.send_channel is None:
                     raise ValueError(f"Channel with ID {channel_id} not found")
 
-                print("Ready to run Discord bot!")
+            # 起動前に溜まったログを送信
+            self.flush()
+            print("Ready to run Discord bot!")
 
+        if isinstance(self.send_channel, int):
             print("Discord bot is starting...")
-
         else:
             print("Discord bot initialized successfully.")
 
-    def _is_ready_to_send(self) -> bool:
-        return self.bot is not None and isinstance(self.send_channel, discord.abc.Messageable)
+    def is_ready_to_send(self) -> bool:
+        return (
+            self.bot is not None
+            and self.loop is not None
+            and self.loop.is_running()
+            and isinstance(self.send_channel, discord.abc.Messageable)
+        )
 
 
 def default_embed() -> Embed:
@@ -0,0 +1,141 @@
+import asyncio
+import time
+from collections import deque
+from typing import TYPE_CHECKING, Optional
+
+import discord
+
+from src.utils.logger import logger
+
+if TYPE_CHECKING:
+    from src.discordbot.bot import BackendDiscordClient
+
+# Discordの1メッセージあたりの文字数の上限
+MAX_MESSAGE_LENGTH = 2000
+
+# まとめて送信する際の通知同士の区切り
+SEPARATOR = "\n\n"
+
+
+class NotificationDispatcher:
+    def __init__(
+        self,
+        bot: "BackendDiscordClient",
+        interval: float = 10.0,
+        max_events: int = 20,
+        max_buffer: int = 1000,
+        max_retries: int = 3,
+    ):
+        """コメント・チャットの投稿などの通知をまとめてDiscordに送信するクラス
+
+        通知はバッファに溜め、interval 秒ごと、または max_events 件溜まった時点で1つのメッセージにまとめて送信する。
+
+        Args:
+            bot (BackendDiscordClient): 送信に使うBot
+            interval (float, optional): 通知をまとめる時間（秒）. Defaults to 10.0.
+            max_events (int, optional): この件数溜まったら interval を待たずに送信する. Defaults to 20.
+            max_buffer (int, optional): バッファの最大件数。超えた分は古い順に破棄. Defaults to 1000.
+            max_retries (int, optional): レート制限（429）時の最大リトライ回数. Defaults to 3.
+        """
+        self.bot = bot
+        self.interval = interval
+        self.max_events = max_events
+        self.max_retries = max_retries
+
+        self.buffer: deque[str] = deque(maxlen=max_buffer)
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+        self.sent_messages = 0
+        self.sent_events = 0
+        self.dropped_events = 0
+        self.failed_messages = 0
+        self.last_sent_at: Optional[float] = None
+
+    def notify(self, content: str):
+        """通知をバッファに追加（送信は待たない）"""
+        if len(self.buffer) == self.buffer.maxlen:
+            self.dropped_events += 1
+        self.buffer.append(content)
+
+        if len(self.buffer) >= self.max_events:
+            self._wakeup.set()
+
+    def stats(self) -> dict:
+        return {
+            "queued": len(self.buffer),
+            "sentMessages": self.sent_messages,
+            "sentEvents": self.sent_events,
+            "droppedEvents": self.dropped_events,
+            "failedMessages": self.failed_messages,
+            "lastSentAt": self.last_sent_at,
+        }
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """送信タスクを停止し、残っている通知を送信"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        await self.flush()
+
+    async def flush(self):
+        """バッファの通知をまとめて送信"""
+        channel = self.bot.default_channel
+        if channel is None:
+            return
+
+        while self.buffer:
+            events = [self.buffer.popleft()[: MAX_MESSAGE_LENGTH]]
+            length = len(events[0])
+            while self.buffer and len(events) < self.max_events:
+                if length + len(SEPARATOR) + len(self.buffer[0]) > MAX_MESSAGE_LENGTH:
+                    break
+                events.append(self.buffer.popleft())
+                length += len(SEPARATOR) + len(events[-1])
+
+            await self._send(channel, SEPARATOR.join(events), len(events))
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Error in sending Discord notifications: {e}")
+
+    async def _send(self, channel: discord.abc.Messageable, content: str, event_count: int):
+        for attempt in range(self.max_retries + 1):
+            try:
+                await channel.send(content)
+                self.sent_messages += 1
+                self.sent_events += event_count
+                self.last_sent_at = time.time()
+                return
+            except discord.RateLimited as e:
+                retry_after = e.retry_after
+            except discord.HTTPException as e:
+                if e.status != 429:
+                    self.failed_messages += 1
+                    logger.warning(f"Failed to send Discord notification: {e.status} {e.text}")
+                    return
+                retry_after = float(e.response.headers.get("Retry-After", 1.0))
+
+            if attempt < self.max_retries:
+                await asyncio.sleep(retry_after)
+
+        self.failed_messages += 1
+        logger.warning("Failed to send Discord notification: rate limited")
@@ -1,11 +1,10 @@
 from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
 
+from src.discordbot.bot import BackendDiscordClient
 from src.utils.auth import get_current_user
 from src.utils.config import ConfigStore
-from src.utils.dependencies import get_playlist_manager, get_config_store
-from src.utils.youtube.playlists import PlaylistManager
-from src.utils.youtube.api import OAuthClient
+from src.utils.dependencies import get_discord_client, get_config_store
 
 
 router = APIRouter(tags=["Admin"])
@@ -19,16 +18,24 @@ class UpdateRefreshTokenRequest(BaseModel):
 async def update_refresh_token(
     request: UpdateRefreshTokenRequest,
     cred: dict = Depends(get_current_user),
-    playlist_manager: PlaylistManager = Depends(get_playlist_manager),
     config_store: ConfigStore = Depends(get_config_store),
 ):
     """YouTube OAuthのリフレッシュトークンを更新するエンドポイント"""
     if not cred.get("admin", False):
         raise HTTPException(status_code=403, detail="Not authorized to perform this action")
 
+    # OAuthClient は設定の変更を受け取り、新しいトークンでアクセストークンを取得し直す
     await config_store.update_config(youtube_oauth_refresh_token=request.token)
-
-    oauth_client: OAuthClient = playlist_manager.oauth_client
-    oauth_client.refresh_token = request.token
-    await oauth_client.refresh_access_token()
     return {"status": "success"}
+
+
+@router.get("/admin/notifications/stats/")
+async def get_notification_stats(
+    cred: dict = Depends(get_current_user),
+    bot: BackendDiscordClient = Depends(get_discord_client),
+):
+    """Discordへの通知の送信待ちの件数などを取得するエンドポイント"""
+    if not cred.get("admin", False):
+        raise HTTPException(status_code=403, detail="Not authorized to perform this action")
+
+    return bot.notifications.stats()
@@ -1,5 +1,14 @@
-from fastapi import APIRouter
+import secrets
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import Response
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+
+from src.utils.config import ConfigStore
+from src.utils.dependencies import get_config_store
 from src.utils.fastapi_models import APIInfo
+from src.utils.metrics import CONTENT_TYPE, REGISTRY
 
 
 router = APIRouter(tags=["General"])
@@ -9,3 +18,22 @@ router = APIRouter(tags=["General"])
 async def api_info():
     """APIの基本情報を取得します。"""
     return APIInfo()
+
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics(
+    cred: Optional[HTTPAuthorizationCredentials] = Depends(HTTPBearer(auto_error=False)),
+    config_store: ConfigStore = Depends(get_config_store),
+):
+    """Prometheus 形式のメトリクスを取得します。
+
+    設定の metrics_token が指定されている場合は、そのトークンを Bearer で送る必要がある。
+    指定されていない場合は認証なしで公開するため、外部から届かない場所でのみ使うこと。"""
+    token = config_store.snapshot.config.metrics_token
+    if token is not None and (cred is None or not secrets.compare_digest(cred.credentials, token)):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid authentication credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
@@ -3,9 +3,17 @@ from fastapi import APIRouter, Depends, HTTPException
 from fastapi.params import Query
 from src.db.songs_database import SongsDatabase
 from src.utils.dependencies import get_db
-from src.utils.fastapi_models import SongSampleParams, SongSearchParams, SongWithScore
+from src.utils.fastapi_models import (
+    FacetCount,
+    SearchSuggestion,
+    SongFacets,
+    SongSampleParams,
+    SongSearchParams,
+    SongWithScore,
+)
 from src.utils.songs import Song, SongsMatchScore
 from src.utils.extraction import including_video_id
+from src.utils.metrics import SCORING_SECONDS
 
 import random
 
@@ -17,7 +25,9 @@ async def search(
     q: Optional[str] = Query(None, description="検索キーワード", example="初音ミク"),
     db: SongsDatabase = Depends(get_db),
 ):
-    """キーワードがタイトル・クリエイター・歌詞などに含まれる曲を検索します。"""
+    """キーワードがタイトル・クリエイター・歌詞などに含まれる曲を検索します。
+
+    ひらがな・カタカナ・半角カナや長音記号の違いは区別せず、一致する曲が無い場合は似た曲名・クリエイター名の曲を返します。"""
 
     songs = []
     video_id = await including_video_id(q)
@@ -25,10 +35,23 @@ async def search(
         songs = db.search_songs(id=video_id)
 
     if len(songs) == 0:
-        songs = db.search_songs(q=q)
+        songs = db.search_songs(q=q) if q is None else db.search_songs_fuzzy(q)
     return songs
 
 
+@router.get("/suggest/", response_model=list[SearchSuggestion])
+async def suggest(
+    q: str = Query(..., max_length=100, description="入力途中のキーワード", example="はなた"),
+    limit: int = Query(10, ge=1, le=50, description="候補の最大数"),
+    db: SongsDatabase = Depends(get_db),
+):
+    """入力途中のキーワードから、曲名・クリエイター名の候補を取得します（ひらがな・カタカナ・ローマ字の違いは区別しません）。"""
+    return [
+        SearchSuggestion(text=suggestion.text, kind=suggestion.kind, count=suggestion.count)
+        for suggestion in db.typeahead().suggest(q, limit)
+    ]
+
+
 @router.get("/nearest-search/", response_model=list[SongWithScore])
 async def get_nearest_songs(target_song_id: str, limit: int = Query(10, ge=1), db: SongsDatabase = Depends(get_db)):
     """指定した条件に基づいて、最も近い曲を検索します。"""
@@ -68,20 +91,19 @@ async def advanced_search(params: SongSearchParams, db: SongsDatabase = Depends(
     if params.filter:
         search_query |= params.filter.model_dump(exclude_none=True)
 
-    songs = db.search_songs(**search_query, order=params.order, asc=params.asc)
-
     if params.nearest is None:
+        songs = db.search_songs(**search_query, order=params.order, asc=params.asc)
         songs = [SongWithScore(id=song.id, song=song) for song in songs]
         return songs[: params.limit] if params.limit else songs
 
-    print(len(songs))
+    # 絞り込みと類似度の計算をまとめて行い、途中の楽曲の一覧は作らない
     try:
-        songs = db.find_nearest_song(
-            target=params.nearest.targetSongID if params.nearest else None,
-            songs=songs,
+        songs = db.search_nearest_songs(
+            target=params.nearest.targetSongID,
             limit=params.limit if params.limit else 10,
             parameters=params.nearest.parameters if params.nearest.parameters else None,
             is_reversed=params.asc,
+            **search_query,
         )
     except ValueError:
         raise HTTPException(status_code=404, detail="Target song not found")
@@ -92,6 +114,33 @@ async def advanced_search(params: SongSearchParams, db: SongsDatabase = Depends(
     return songs
 
 
+@router.post("/advanced-search/facets/", response_model=SongFacets)
+async def advanced_search_facets(
+    params: SongSearchParams,
+    top: int = Query(10, ge=1, le=100, description="項目ごとに返す値の最大数"),
+    db: SongsDatabase = Depends(get_db),
+):
+    """高度な検索と同じ条件に一致する曲について、ボーカル・公開年などの項目ごとの曲の数を取得します。
+
+    nearest・limit・order は集計に影響しません。"""
+    search_query = {"q": params.q if params.q else None}
+
+    video_id = await including_video_id(params.q)
+    if video_id is not None and db.search_songs(id=video_id):
+        search_query = {"id": video_id}
+    elif params.filter:
+        search_query |= params.filter.model_dump(exclude_none=True)
+
+    total, facets = db.search_facets(top=top, **search_query)
+    return SongFacets(
+        total=total,
+        **{
+            field: [FacetCount(value=value, count=count) for value, count in counts]
+            for field, counts in facets.items()
+        },
+    )
+
+
 @router.post("/songs-sample/", response_model=list[Song])
 async def get_songs_sample(params: SongSampleParams, db: SongsDatabase = Depends(get_db)):
     """最大分散サンプリングを用いて、おすすめ曲診断用のサンプルを取得します。"""
@@ -124,15 +173,16 @@ async def get_songs_sample(params: SongSampleParams, db: SongsDatabase = Depends
         return all_songs
 
     samples = [random.choice(all_songs)]
-    while len(samples) < params.limit:
-        next_song = min(
-            all_songs,
-            key=lambda song: (
-                max(get_similarity(song, sample) for sample in samples) + noise * random.random()
-                if song not in samples
-                else INF
-            ),
-        )
-        samples.append(next_song)
+    with SCORING_SECONDS.labels("songs_sample").time():
+        while len(samples) < params.limit:
+            next_song = min(
+                all_songs,
+                key=lambda song: (
+                    max(get_similarity(song, sample) for sample in samples) + noise * random.random()
+                    if song not in samples
+                    else INF
+                ),
+            )
+            samples.append(next_song)
 
     return samples
@@ -1,5 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException
 
+from src.db.playlist_database import PlaylistJob
 from src.utils.auth import get_current_user
 from src.utils.dependencies import get_playlist_manager
 from src.utils.fastapi_models import CreatePlaylistRequest
@@ -9,17 +10,29 @@ from src.utils.logger import logger
 router = APIRouter(tags=["YouTube"])
 
 
-@router.post("/playlists/create/")
+@router.post("/playlists/create/", response_model=PlaylistJob, status_code=202)
 async def create_youtube_playlist(
     query: CreatePlaylistRequest,
     cred: dict = Depends(get_current_user),
     playlist_manager: PlaylistManager = Depends(get_playlist_manager),
 ):
-    """YouTubeのプレイリストを作成し、指定した動画を追加します。"""
-    try:
-        logger.info(f"Creating YouTube playlist: {query.title} with {len(query.video_ids)} videos")
-        logger.debug(f"User ID: {cred.get('uid', 'unknown')} email: {cred.get('email', 'unknown')}")
-        playlist = await playlist_manager.create_playlist(query.title, query.description, query.video_ids)
-        return playlist
-    except HTTPException as e:
-        raise e
+    """YouTubeのプレイリスト作成を予約します。進捗は /playlists/jobs/{job_id}/ で確認できます。"""
+    logger.info(f"Creating YouTube playlist: {query.title} with {len(query.video_ids)} videos")
+    logger.debug(f"User ID: {cred.get('uid', 'unknown')} email: {cred.get('email', 'unknown')}")
+    return playlist_manager.submit_playlist(
+        query.title, query.description, query.video_ids, submitted_by=cred.get("uid", "")
+    )
+
+
+@router.get("/playlists/jobs/{job_id}/", response_model=PlaylistJob)
+async def get_playlist_job(
+    job_id: str,
+    cred: dict = Depends(get_current_user),
+    playlist_manager: PlaylistManager = Depends(get_playlist_manager),
+):
+    """プレイリスト作成ジョブの進捗を取得します。ジョブを登録したユーザーと管理者のみ取得できます。"""
+    job = playlist_manager.get_job(job_id)
+    # 他のユーザーのジョブは、存在を知られないよう見つからない場合と同じにする
+    if job is None or (job.submittedBy != cred.get("uid", "") and not cred.get("admin", False)):
+        raise HTTPException(status_code=404, detail="Playlist job not found")
+    return job
@@ -1,13 +1,121 @@
+import hashlib
+import threading
 import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Iterable, Optional
 
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 import firebase_admin
 from firebase_admin import auth, credentials
 
+from src.utils.logger import logger
 from src.utils.user_models import UserFromFirebase
 
 
+class VerifiedTokenCache:
+    def __init__(self, max_size: int = 1024, revocation_check_interval: Optional[float] = None):
+        """検証済みのIDトークンのクレームを保持するキャッシュ
+
+        トークンはハッシュ値をキーとして、トークンの有効期限（exp）まで保持する。
+        上限を超えた場合は、最後に使われた時刻の古い順に削除する。
+
+        Args:
+            max_size (int, optional): 保持するトークンの最大数. Defaults to 1024.
+            revocation_check_interval (Optional[float], optional): 失効の確認間隔（秒）。
+                指定した場合、キャッシュ内のユーザーをまとめて確認し、失効したトークンを削除する. Defaults to None.
+        """
+        self.max_size = max_size
+        self.revocation_check_interval = revocation_check_interval
+        self.hits = 0
+        self.misses = 0
+
+        self._claims: OrderedDict[bytes, dict] = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_revocation_check = time.time()
+        # 失効の確認は Firebase への通信を伴うため、リクエストの処理とは別のスレッドで行う
+        self._revocation_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="token-revocation")
+        self._revocation_task: Optional[Future] = None
+
+    def verify(self, token: str) -> dict:
+        """IDトークンを検証してクレームを返す。無効なトークンの場合は firebase_admin の例外を送出"""
+        key = hashlib.sha256(token.encode("utf-8")).digest()
+
+        with self._lock:
+            claims = self._claims.get(key)
+            if claims is not None and claims.get("exp", 0) <= time.time():
+                del self._claims[key]
+                claims = None
+
+            if claims is not None:
+                self._claims.move_to_end(key)
+                self.hits += 1
+
+        if claims is not None:
+            self._check_revoked_if_due()
+            return claims
+
+        claims = auth.verify_id_token(token)
+
+        with self._lock:
+            self.misses += 1
+            self._claims[key] = claims
+            while len(self._claims) > self.max_size:
+                self._claims.popitem(last=False)
+
+        return claims
+
+    def clear(self):
+        with self._lock:
+            self._claims.clear()
+
+    def _check_revoked_if_due(self):
+        if self.revocation_check_interval is None:
+            return
+
+        with self._lock:
+            if time.time() - self._last_revocation_check < self.revocation_check_interval:
+                return
+            if self._revocation_task is not None and not self._revocation_task.done():
+                return
+
+            self._last_revocation_check = time.time()
+            self._revocation_task = self._revocation_executor.submit(self._remove_revoked)
+
+    def _remove_revoked(self):
+        """キャッシュ内のユーザーを100件ずつまとめて取得し、失効・無効化されたトークンを削除"""
+        with self._lock:
+            checked_uids = {claims.get("uid") for claims in self._claims.values()}
+        uids = list(checked_uids)
+        valid_after: dict[str, float] = {}
+
+        try:
+            for i in range(0, len(uids), 100):
+                result = auth.get_users([auth.UidIdentifier(uid) for uid in uids[i : i + 100]])
+                for user in result.users:
+                    if user.disabled:
+                        continue
+                    valid_after[user.uid] = (user.tokens_valid_after_timestamp or 0) / 1000
+        except Exception as e:
+            logger.warning(f"Failed to check revoked tokens: {e}")
+            return
+
+        with self._lock:
+            for key, claims in list(self._claims.items()):
+                uid = claims.get("uid")
+                if uid in checked_uids and (uid not in valid_after or claims.get("iat", 0) < valid_after[uid]):
+                    del self._claims[key]
+
+
+token_cache = VerifiedTokenCache()
+
+
+def verify_id_token(token: str) -> dict:
+    """キャッシュを使ってIDトークンを検証する"""
+    return token_cache.verify(token)
+
+
 def get_current_user(cred: HTTPAuthorizationCredentials = Depends(HTTPBearer())):
     if not cred:
         raise HTTPException(
@@ -16,7 +124,7 @@ def get_current_user(cred: HTTPAuthorizationCredentials = Depends(HTTPBearer()))
             headers={"WWW-Authenticate": "Bearer"},
         )
     try:
-        cred = auth.verify_id_token(cred.credentials)
+        cred = verify_id_token(cred.credentials)
     except:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -26,44 +134,133 @@ def get_current_user(cred: HTTPAuthorizationCredentials = Depends(HTTPBearer()))
     return cred
 
 
-def auth_initialize():
+def auth_initialize(revocation_check_interval: Optional[float] = None):
+    """Firebase Admin を初期化する
+
+    Args:
+        revocation_check_interval (Optional[float], optional): キャッシュ済みのトークンの失効の確認間隔（秒）。
+            None の場合は確認せず、トークンの有効期限まで使う. Defaults to None.
+    """
     cred = credentials.Certificate("./serviceAccountKey.json")
     firebase_admin.initialize_app(cred)
+    token_cache.revocation_check_interval = revocation_check_interval
 
 
 def add_admin_user(uid: str):
     auth.set_custom_user_claims(uid, {"admin": True})
 
 
-def get_firebase_user(uid: str):
-    try:
-        user = auth.get_user(uid)
-    except auth.UserNotFoundError:
-        raise HTTPException(status_code=404, detail="User not found")
+class FirebaseUserDirectory:
+    def __init__(self, ttl: float = 300, batch_size: int = 100, max_size: int = 10000):
+        """Firebase UIDをキーとしたユーザー情報のキャッシュ
+
+        キャッシュに無いユーザーは auth.get_users でまとめて取得する。
+        有効期限の切れたユーザーはキャッシュの値を返しつつ、バックグラウンドで再取得する。
+        上限を超えた場合は、最後に使われた時刻の古い順に削除する。
+
+        Args:
+            ttl (float, optional): 各ユーザー情報の有効期限（秒）. Defaults to 300.
+            batch_size (int, optional): 1回のリクエストで取得するユーザー数（最大100）. Defaults to 100.
+            max_size (int, optional): 保持するユーザーの最大数（存在しないUIDを含む）. Defaults to 10000.
+        """
+        self.ttl = ttl
+        self.batch_size = batch_size
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+
+        # Firebaseに存在しないUIDは None として保持する
+        self._entries: OrderedDict[str, tuple[Optional[UserFromFirebase], float]] = OrderedDict()
+        self._refreshing: set[str] = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="firebase-users")
+
+    def get(self, uid: str) -> Optional[UserFromFirebase]:
+        return self.get_many([uid]).get(uid)
+
+    def get_many(self, uids: Iterable[str]) -> dict[str, UserFromFirebase]:
+        """複数のユーザー情報を取得する。Firebaseに存在しないUIDは結果に含まれない"""
+        now = time.time()
+        users: dict[str, UserFromFirebase] = {}
+        missing: list[str] = []
+        stale: list[str] = []
+
+        with self._lock:
+            for uid in set(uids):
+                entry = self._entries.get(uid)
+                if entry is None:
+                    missing.append(uid)
+                    continue
+
+                self._entries.move_to_end(uid)
+                user, fetched_at = entry
+                if user is not None:
+                    users[uid] = user
+                if now - fetched_at > self.ttl:
+                    stale.append(uid)
 
-    return UserFromFirebase(firebaseUID=user.uid, IconURL=user.photo_url, isGuest=bool(len(user.provider_data) == 0))
+            self.hits += len(users)
+            self.misses += len(missing)
 
+        if missing:
+            users.update(self._fetch(missing))
+        if stale:
+            self._refresh_in_background(stale)
 
-firebase_users_cache = None
-firebase_users_cache_timestamp = 0
+        return users
 
+    def invalidate(self, uid: str):
+        with self._lock:
+            self._entries.pop(uid, None)
 
-# TODO: TTL付きのキャッシュを実装
-def get_firebase_users() -> list[UserFromFirebase]:
-    global firebase_users_cache, firebase_users_cache_timestamp
+    def _fetch(self, uids: list[str]) -> dict[str, UserFromFirebase]:
+        users: dict[str, UserFromFirebase] = {}
+        for i in range(0, len(uids), self.batch_size):
+            chunk = uids[i : i + self.batch_size]
+            result = auth.get_users([auth.UidIdentifier(uid) for uid in chunk])
+            fetched_at = time.time()
 
-    if firebase_users_cache is None or time.time() - firebase_users_cache_timestamp > 300:  # 5分ごとに更新
-        users = []
-        for user in auth.list_users().iterate_all():
-            users.append(
-                UserFromFirebase(
+            for user in result.users:
+                users[user.uid] = UserFromFirebase(
                     firebaseUID=user.uid, IconURL=user.photo_url, isGuest=bool(len(user.provider_data) == 0)
                 )
-            )
-        firebase_users_cache = users
-        firebase_users_cache_timestamp = time.time()
 
-    return firebase_users_cache
+            with self._lock:
+                for uid in chunk:
+                    self._entries[uid] = (users.get(uid), fetched_at)
+                    self._entries.move_to_end(uid)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+
+        return users
+
+    def _refresh_in_background(self, uids: list[str]):
+        with self._lock:
+            uids = [uid for uid in uids if uid not in self._refreshing]
+            self._refreshing.update(uids)
+
+        if uids:
+            self._executor.submit(self._refresh, uids)
+
+    def _refresh(self, uids: list[str]):
+        try:
+            self._fetch(uids)
+        except Exception as e:
+            logger.warning(f"Failed to refresh Firebase users: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.difference_update(uids)
+
+
+firebase_user_directory = FirebaseUserDirectory()
+
+
+def get_firebase_user(uid: str) -> UserFromFirebase:
+    user = firebase_user_directory.get(uid)
+    if user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    return user
 
 
 if __name__ == "__main__":
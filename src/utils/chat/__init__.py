@@ -0,0 +1,3 @@
+from .broker import ChatBroker, InProcessBroker, SQLiteBroker
+from .history import ChatHistory
+from .manager import ChatConnection, ConnectionManager
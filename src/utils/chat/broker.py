@@ -0,0 +1,138 @@
+import asyncio
+import json
+import sqlite3
+import time
+import uuid
+from abc import ABC, abstractmethod
+from typing import Awaitable, Callable, Optional
+
+from src.utils.logger import logger
+
+EventHandler = Callable[[dict], Awaitable[None]]
+
+
+class ChatBroker(ABC):
+    """共有チャットのイベントを各ワーカーの ConnectionManager に配信するブローカーの基底クラス"""
+
+    def __init__(self):
+        self.handler: Optional[EventHandler] = None
+
+    async def start(self, handler: EventHandler):
+        """イベントの受信を開始する
+
+        Args:
+            handler (EventHandler): イベントを受け取る関数。publish したワーカー自身にも配信される
+        """
+        self.handler = handler
+
+    async def stop(self):
+        self.handler = None
+
+    @abstractmethod
+    async def publish(self, event: dict):
+        """全てのワーカーにイベントを配信する"""
+
+
+class InProcessBroker(ChatBroker):
+    """同じプロセス内の ConnectionManager にのみ配信するブローカー"""
+
+    async def publish(self, event: dict):
+        if self.handler is not None:
+            await self.handler(event)
+
+
+class SQLiteBroker(ChatBroker):
+    def __init__(self, db_path: str = "data/songs.db", poll_interval: float = 0.1, retention_seconds: int = 60):
+        """SQLiteのテーブルを介して、同じマシン上の複数のワーカーにイベントを配信するブローカー
+
+        publish したイベントはテーブルに追記され、各ワーカーは poll_interval ごとに新しいイベントを読み取る。
+        publish したワーカー自身には、テーブルを介さずにすぐ配信する。
+
+        Args:
+            db_path (str, optional): データベースファイルのパス. Defaults to "data/songs.db".
+            poll_interval (float, optional): 新しいイベントを確認する間隔（秒）. Defaults to 0.1.
+            retention_seconds (int, optional): 配信済みのイベントを残す期間（秒）. Defaults to 60.
+        """
+        super().__init__()
+        self.db_path = db_path
+        self.poll_interval = poll_interval
+        self.retention_seconds = retention_seconds
+        self.origin = str(uuid.uuid4())  # このワーカーの識別子
+        self.last_seq = 0
+        self._poll_task: Optional[asyncio.Task] = None
+        self.init_database()
+
+    def init_database(self):
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS chat_events (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    origin TEXT NOT NULL,
+                    event TEXT NOT NULL,
+                    created_at INTEGER NOT NULL
+                );
+            """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_chat_events_created ON chat_events (created_at);")
+            conn.commit()
+
+    async def start(self, handler: EventHandler):
+        await super().start(handler)
+        if self._poll_task is not None:
+            return
+
+        # 起動前のイベントは履歴としてデータベースから読み込まれるため、配信しない
+        with sqlite3.connect(self.db_path) as conn:
+            self.last_seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM chat_events").fetchone()[0]
+        self._poll_task = asyncio.create_task(self._poll())
+
+    async def stop(self):
+        if self._poll_task is not None:
+            self._poll_task.cancel()
+            try:
+                await self._poll_task
+            except asyncio.CancelledError:
+                pass
+            self._poll_task = None
+        await super().stop()
+
+    async def publish(self, event: dict):
+        now = int(time.time())
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute(
+                "INSERT INTO chat_events (origin, event, created_at) VALUES (?, ?, ?)",
+                (self.origin, json.dumps(event, ensure_ascii=False), now),
+            )
+            conn.execute("DELETE FROM chat_events WHERE created_at < ?", (now - self.retention_seconds,))
+            conn.commit()
+
+        if self.handler is not None:
+            await self.handler(event)
+
+    def _fetch_events(self) -> list[tuple[int, str, str]]:
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.execute(
+                "SELECT seq, origin, event FROM chat_events WHERE seq > ? ORDER BY seq",
+                (self.last_seq,),
+            )
+            return cursor.fetchall()
+
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                rows = self._fetch_events()
+            except sqlite3.Error as e:
+                logger.warning(f"Failed to read chat events: {e}")
+                continue
+
+            for seq, origin, event in rows:
+                self.last_seq = seq
+                if origin == self.origin or self.handler is None:
+                    continue
+
+                try:
+                    await self.handler(json.loads(event))
+                except Exception as e:
+                    logger.error(f"Error in handling chat event: {e}")
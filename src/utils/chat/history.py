@@ -0,0 +1,67 @@
+from collections import OrderedDict
+from itertools import islice
+from typing import Optional
+
+from src.db.chat_database import ChatDatabase
+
+
+class ChatHistory:
+    def __init__(self, chat_db: Optional[ChatDatabase] = None, capacity: int = 200):
+        """共有チャットの履歴
+
+        新しいメッセージから最大 capacity 件をメモリ上に保持し、それより古いメッセージはデータベースから取得する。
+        メッセージはチャットIDをキーにした順序付き辞書で管理するため、追加・削除は定数時間で行える。
+
+        Args:
+            chat_db (Optional[ChatDatabase], optional): 履歴を保存するデータベース。Noneの場合はメモリ上のみ. Defaults to None.
+            capacity (int, optional): メモリ上に保持するメッセージの最大数. Defaults to 200.
+        """
+        self.chat_db = chat_db
+        self.capacity = capacity
+        self._messages: OrderedDict[str, dict] = OrderedDict()
+
+        if chat_db is not None:
+            # 再起動前の履歴を読み込む
+            for message in chat_db.get_messages(limit=capacity):
+                self._messages[message["chatID"]] = message
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+    def append(self, message: dict):
+        """メッセージをデータベースに保存し、メモリ上の履歴に追加"""
+        if self.chat_db is not None:
+            self.chat_db.add_message(message)
+        self.remember(message)
+
+    def delete(self, chat_id: str):
+        """メッセージをデータベース上で削除済みにし、メモリ上の履歴から削除"""
+        if self.chat_db is not None:
+            self.chat_db.delete_message(chat_id)
+        self.forget(chat_id)
+
+    def remember(self, message: dict):
+        """メモリ上の履歴にのみ追加（他のワーカーが保存したメッセージ用）"""
+        self._messages[message["chatID"]] = message
+        if len(self._messages) > self.capacity:
+            self._messages.popitem(last=False)
+
+    def forget(self, chat_id: str):
+        """メモリ上の履歴からのみ削除（他のワーカーが削除したメッセージ用）"""
+        self._messages.pop(chat_id, None)
+
+    def recent(self, limit: int = 20) -> list[dict]:
+        """新しいメッセージを limit 件、古い順に取得"""
+        return list(islice(reversed(self._messages.values()), limit))[::-1]
+
+    def page(self, before: str, limit: int = 20) -> list[dict]:
+        """指定したチャットIDより前のメッセージを limit 件、古い順に取得"""
+        if before in self._messages:
+            keys = list(self._messages)
+            index = keys.index(before)
+            if index >= limit or self.chat_db is None:
+                return [self._messages[key] for key in keys[max(0, index - limit) : index]]
+
+        if self.chat_db is None:
+            return []
+        return self.chat_db.get_messages(before=before, limit=limit)
@@ -0,0 +1,238 @@
+import asyncio
+import json
+import time
+from typing import Any, Literal, Optional
+
+from fastapi import WebSocket
+
+from src.db.user_database import UsersDatabase
+from src.utils.chat.broker import ChatBroker, InProcessBroker
+from src.utils.chat.history import ChatHistory
+from src.utils.logger import logger
+from src.utils.metrics import CHAT_BROADCAST_SECONDS
+from src.utils.user_models import User
+
+# 送信待ちのメッセージが上限を超えたときの動作
+#   drop: 新しいメッセージを破棄する
+#   disconnect: 接続を切断する
+OverflowPolicy = Literal["drop", "disconnect"]
+
+
+def encode_message(message: Any) -> str:
+    """メッセージをJSONに変換（WebSocket.send_json と同じ形式）"""
+    return json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+
+
+class ChatConnection:
+    """WebSocket接続1件分の状態"""
+
+    __slots__ = ("websocket", "user", "is_admin", "queue", "writer", "sending_since", "dropped")
+
+    def __init__(self, websocket: WebSocket, queue_size: int):
+        self.websocket = websocket
+        self.user: Optional[User] = None  # 認証が完了するまでは None
+        self.is_admin = False
+        self.queue: asyncio.Queue[str] = asyncio.Queue(maxsize=queue_size)
+        self.writer: Optional[asyncio.Task] = None
+        self.sending_since = 0.0  # 送信中のメッセージの送信開始時刻（送信中でなければ 0）
+        self.dropped = 0
+
+    @property
+    def authenticated(self) -> bool:
+        return self.user is not None
+
+
+class ConnectionManager:
+    def __init__(
+        self,
+        users_db: UsersDatabase,
+        history: Optional[ChatHistory] = None,
+        broker: Optional[ChatBroker] = None,
+        queue_size: int = 256,
+        overflow: OverflowPolicy = "disconnect",
+        send_timeout: float = 10.0,
+    ):
+        """共有チャットのWebSocket接続の管理クラス
+
+        接続はWebSocketをキーにした辞書で管理し、認証済み・管理者の接続は別の集合でも保持する。
+        送信は接続ごとの上限付きキューに入れ、接続ごとの書き込みタスクが順に送信するため、
+        通信の遅いクライアントが他のクライアントへの配信を遅らせることはない。
+
+        Args:
+            users_db (UsersDatabase): 認証時にユーザー情報を取得するデータベース
+            history (Optional[ChatHistory], optional): チャットの履歴。Noneの場合はメモリ上のみに保持. Defaults to None.
+            broker (Optional[ChatBroker], optional): 他のワーカーとイベントを共有するブローカー。Noneの場合はプロセス内のみ. Defaults to None.
+            queue_size (int, optional): 接続ごとの送信待ちメッセージの上限. Defaults to 256.
+            overflow (OverflowPolicy, optional): 送信待ちが上限を超えたときの動作. Defaults to "disconnect".
+            send_timeout (float, optional): 1件の送信にかけられる最大時間（秒）。超えた場合は送信待ちが上限を超えたときと同じ扱い. Defaults to 10.0.
+        """
+        self.users_db = users_db
+        self.queue_size = queue_size
+        self.overflow = overflow
+        self.send_timeout = send_timeout
+        self.connections: dict[WebSocket, ChatConnection] = {}
+        self.authenticated: set[ChatConnection] = set()
+        self.admins: set[ChatConnection] = set()
+        self.history = history if history is not None else ChatHistory()
+        self.broker = broker if broker is not None else InProcessBroker()
+        self._closing: set[asyncio.Task] = set()
+
+    async def start(self):
+        """ブローカーからのイベントの受信を開始"""
+        await self.broker.start(self._handle_event)
+
+    async def stop(self):
+        await self.broker.stop()
+
+    def get(self, websocket: WebSocket) -> Optional[ChatConnection]:
+        return self.connections.get(websocket)
+
+    async def connect(self, websocket: WebSocket):
+        await websocket.accept()
+        connection = ChatConnection(websocket, self.queue_size)  # ユーザーデータは認証時に取得する
+        connection.writer = asyncio.create_task(self._writer(connection))
+        self.connections[websocket] = connection
+        self._enqueue(connection, encode_message({"type": "history", "messages": self.history.recent(20)}))
+        logger.info("WebSocket connection established")
+
+    async def authenticate(self, websocket: WebSocket, uid: str = "", is_admin: bool = False):
+        connection = self.connections.get(websocket)
+        if connection is None or connection.authenticated:
+            return
+
+        user = self.users_db.get_user(uid)
+        connection.user = user
+        connection.is_admin = is_admin
+        self.authenticated.add(connection)
+        if is_admin:
+            self.admins.add(connection)
+
+        await self.publish_info(user, "connected")
+        logger.info(f"WebSocket authenticated: {user.displayName or 'No Display Name'} (Admin: {is_admin})")
+
+    async def disconnect(self, websocket: WebSocket):
+        connection = self.connections.pop(websocket, None)
+        if connection is None:
+            return
+
+        self._detach(connection)
+        if connection.writer is not None:
+            connection.writer.cancel()
+
+        if connection.authenticated:
+            user = connection.user
+            await self.publish_info(user, "disconnected")
+            logger.info(
+                f"WebSocket disconnected: {user.displayName or 'No Display Name'} (Admin: {connection.is_admin})"
+            )
+        else:
+            logger.warning("WebSocket disconnected before authentication")
+
+    async def post(self, message: dict):
+        """チャットメッセージを履歴に保存し、全てのワーカーの認証済みの接続に配信"""
+        self.history.append(message)
+        await self.broker.publish({"type": "post", "message": message})
+
+    async def delete(self, chat_id: str):
+        """チャットメッセージを履歴から削除し、全てのワーカーの認証済みの接続に通知"""
+        self.history.delete(chat_id)
+        await self.broker.publish({"type": "delete", "chatID": chat_id})
+
+    async def publish_info(self, user: User, content: str):
+        """全てのワーカーの管理者の接続に、ユーザーの接続・切断を通知"""
+        message = {
+            "type": "info",
+            "timestamp": int(time.time()),
+            "author": user.model_dump(),
+            "content": content,
+        }
+        await self.broker.publish({"type": "info", "message": message})
+
+    async def _handle_event(self, event: dict):
+        """ブローカーから受け取ったイベントを、このワーカーの接続に配信"""
+        event_type = event.get("type")
+        if event_type == "post":
+            message = event["message"]
+            self.history.remember(message)
+            await self.broadcast(message)
+        elif event_type == "delete":
+            self.history.forget(event["chatID"])
+            await self.broadcast({"type": "delete", "chatID": event["chatID"]})
+        elif event_type == "info":
+            text = encode_message(event["message"])
+            for connection in list(self.admins):
+                self._enqueue(connection, text)
+
+    async def send_personal_message(self, message: Any, websocket: WebSocket):
+        connection = self.connections.get(websocket)
+        if connection is None or not connection.authenticated:
+            logger.warning("Attempted to send message to unauthenticated WebSocket connection")
+            return
+
+        self._enqueue(connection, encode_message(message))
+
+    async def send_history(self, websocket: WebSocket, before: str, limit: int = 20):
+        """指定したチャットIDより前の履歴を送信"""
+        connection = self.connections.get(websocket)
+        if connection is None:
+            return
+
+        messages = self.history.page(before, limit)
+        self._enqueue(connection, encode_message({"type": "history", "before": before, "messages": messages}))
+
+    async def broadcast(self, message: Any):
+        """このワーカーの認証済みの全ての接続にメッセージを送信（送信の完了は待たない）"""
+        with CHAT_BROADCAST_SECONDS.time():
+            text = encode_message(message)  # JSONへの変換は1回だけ行う
+            for connection in list(self.authenticated):
+                self._enqueue(connection, text)
+
+    def _enqueue(self, connection: ChatConnection, text: str):
+        # 1件の送信が終わらないまま一定時間経過した接続は、キューに空きがあっても遅いクライアントとして扱う
+        stalled = connection.sending_since and time.monotonic() - connection.sending_since > self.send_timeout
+        if not stalled:
+            try:
+                connection.queue.put_nowait(text)
+                return
+            except asyncio.QueueFull:
+                pass
+
+        if self.overflow == "drop":
+            connection.dropped += 1
+            if connection.dropped == 1 or connection.dropped % 100 == 0:
+                logger.warning(f"Dropped {connection.dropped} chat messages for a slow WebSocket client")
+            return
+
+        logger.warning("Disconnecting slow WebSocket client")
+        self._detach(connection)
+        if connection.writer is not None:
+            connection.writer.cancel()
+        task = asyncio.create_task(self._close(connection.websocket, 1008, "Client is too slow"))
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    async def _writer(self, connection: ChatConnection):
+        """接続ごとの書き込みタスク。キューのメッセージを順に送信する"""
+        websocket = connection.websocket
+        try:
+            while True:
+                text = await connection.queue.get()
+                connection.sending_since = time.monotonic()
+                await websocket.send_text(text)
+                connection.sending_since = 0.0
+        except Exception as e:
+            # 切断済みなど。受信側のループが終了した時点で disconnect される
+            logger.warning(f"Error in sending chat message: {type(e).__name__}")
+            self._detach(connection)
+            await self._close(websocket, 1011, "Failed to send message")
+
+    async def _close(self, websocket: WebSocket, code: int, reason: str):
+        try:
+            await asyncio.wait_for(websocket.close(code=code, reason=reason), timeout=1.0)
+        except Exception:
+            pass
+
+    def _detach(self, connection: ChatConnection):
+        """接続を配信の対象から外す（切断時の通知のため、接続自体の情報は残す）"""
+        self.authenticated.discard(connection)
+        self.admins.discard(connection)
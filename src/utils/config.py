@@ -4,14 +4,20 @@
 import os
 import json
 import asyncio
-from typing import Literal
+import inspect
+import logging
+from typing import Awaitable, Callable, Literal
+from urllib import parse
 from cryptography.fernet import Fernet
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 
 with open("assets/docs_description.md", "r", encoding="utf-8") as f:
     docs_description = f.read()
 
 
+# src.utils.logger はこのモジュールを読み込むため、ロガーは名前で取得する
+logger = logging.getLogger("songs_introduction")
+
 privileged_user_keywords = {"admin", "editor", "管理者", "編集者", "公式", "運営", "スタッフ"}
 
 
@@ -28,17 +34,134 @@ class Config(BaseModel):
     discord_token: str
 
     port: int = 8000
+    # 共有チャットのイベントの共有方法（複数ワーカーで起動する場合は "sqlite"）
+    chat_broker: Literal["memory", "sqlite"] = "memory"
+    # 楽曲検索の方法（"sqlite" は毎回SQLで検索、"index" はメモリ上の転置インデックスを使う）
+    search_backend: Literal["sqlite", "index"] = "sqlite"
+    # キャッシュ済みのIDトークンの失効を確認する間隔（秒）。None の場合は確認しない
+    token_revocation_check_interval: float | None = 300
+    # /metrics の取得に必要なトークン（Authorization: Bearer）。None の場合は認証なしで公開する
+    metrics_token: str | None = None
 
     user_roles: dict[str, Literal["admin", "editor", "user"]]
 
 
+class ConfigSnapshot(BaseModel):
+    """ある時点の設定と、設定から計算した値（読み取り専用）"""
+
+    model_config = ConfigDict(frozen=True)
+
+    config: Config
+    production_hostnames: frozenset[str] = frozenset()
+
+    @classmethod
+    def from_config(cls, config: Config) -> "ConfigSnapshot":
+        hostnames = set()
+        for url in config.production_url or []:
+            hostname = parse.urlparse(url).hostname
+            if hostname:
+                hostnames.add(hostname)
+
+        return cls(config=config, production_hostnames=frozenset(hostnames))
+
+
 class ConfigStore:
     def __init__(self, path="config", key_path="secret.key"):
         self.path = path
         self.key_path = key_path
-        self.lock = asyncio.Lock()
+        self.lock = asyncio.Lock()  # 書き込み用（読み取りは snapshot をロックなしで参照する）
         self.crypto = self._load_crypto()
+        self._file_state = self._stat()
         self._config: Config | dict | None = self._load_config()
+        self._snapshot: ConfigSnapshot | None = self._make_snapshot()
+
+        self._subscribers: list[Callable[[ConfigSnapshot], Awaitable[None] | None]] = []
+        self._watch_task: asyncio.Task | None = None
+
+    @property
+    def snapshot(self) -> ConfigSnapshot:
+        """現在の設定のスナップショット。更新時は新しいオブジェクトに差し替えられる"""
+        if self._snapshot is None:
+            raise ValueError("Config not initialized properly")
+        return self._snapshot
+
+    def is_loaded(self) -> bool:
+        """設定を読み込めている場合True（snapshot を参照できる）"""
+        return self._snapshot is not None
+
+    def _make_snapshot(self) -> ConfigSnapshot | None:
+        if not isinstance(self._config, Config):
+            return None
+        return ConfigSnapshot.from_config(self._config)
+
+    def subscribe(self, callback: Callable[[ConfigSnapshot], Awaitable[None] | None]):
+        """設定が変更されたときに、新しいスナップショットを受け取る関数を登録"""
+        self._subscribers.append(callback)
+
+    async def _notify(self, snapshot: ConfigSnapshot):
+        for callback in self._subscribers:
+            try:
+                result = callback(snapshot)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                logger.error(f"Error in config change subscriber {getattr(callback, '__qualname__', callback)}: {e}")
+
+    def _stat(self) -> tuple[int, int] | None:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    async def reload(self) -> bool:
+        """設定ファイルが変更されていれば読み込み直す
+
+        Returns:
+            bool: 設定が変更された場合True
+        """
+        async with self.lock:
+            file_state = self._stat()
+            if file_state == self._file_state:
+                return False
+
+            self._file_state = file_state
+            config = self._load_config()
+            if not isinstance(config, Config):
+                # 書き込み途中や破損したファイルは無視し、現在の設定を使い続ける
+                logger.warning("Config file changed but could not be loaded; keeping the current config.")
+                return False
+            if config == self._config:
+                return False
+
+            self._config = config
+            self._snapshot = snapshot = self._make_snapshot()
+
+        logger.info("Config reloaded from file.")
+        await self._notify(snapshot)
+        return True
+
+    def start_watching(self, interval: float = 5.0):
+        """設定ファイルの変更の監視を開始"""
+        if self._watch_task is None:
+            self._watch_task = asyncio.create_task(self._watch(interval))
+
+    async def stop_watching(self):
+        if self._watch_task is not None:
+            self._watch_task.cancel()
+            try:
+                await self._watch_task
+            except asyncio.CancelledError:
+                pass
+            self._watch_task = None
+
+    async def _watch(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.reload()
+            except Exception as e:
+                logger.error(f"Error in reloading config: {e}")
 
     def _load_crypto(self):
         # 暗号鍵の読み込み or 生成
@@ -80,15 +203,22 @@ class ConfigStore:
 
         data = json.dumps(self._config.model_dump(), ensure_ascii=False).encode("utf-8")
         encrypted = self.crypto.encrypt(data)
-        with open(self.path, "wb") as f:
+        # 監視中のプロセスが書き込み途中のファイルを読まないよう、一時ファイルから置き換える
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "wb") as f:
             f.write(encrypted)
+        os.replace(tmp_path, self.path)
+        self._file_state = self._stat()
 
     async def set_config(self, config: Config):
         """設定全体を保存"""
         async with self.lock:
             self._config = config
+            self._snapshot = snapshot = self._make_snapshot()
             self._save()
 
+        await self._notify(snapshot)
+
     async def get_config(self) -> Config:
         """設定全体を取得"""
         async with self.lock:
@@ -106,8 +236,25 @@ class ConfigStore:
             current_data = self._config.model_dump()
             current_data.update(kwargs)
             self._config = Config(**current_data)
+            self._snapshot = snapshot = self._make_snapshot()
             self._save()
 
+        await self._notify(snapshot)
+
+
+_shared_config_store: ConfigStore | None = None
+
+
+def shared_config_store() -> ConfigStore:
+    """プロセス全体で共有する ConfigStore を取得（設定ファイルの読み込みと復号は最初の1回のみ）
+
+    設定の変更を受け取る場合は、モジュールごとに ConfigStore を作らずにこの関数の戻り値に subscribe する。
+    """
+    global _shared_config_store
+    if _shared_config_store is None:
+        _shared_config_store = ConfigStore()
+    return _shared_config_store
+
 
 if __name__ == "__main__":
     import asyncio
@@ -0,0 +1,46 @@
+from typing import Callable, Sequence
+
+from starlette.middleware.cors import CORSMiddleware
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from src.utils.config import Config, ConfigSnapshot, ConfigStore
+
+
+def cors_origins(config: Config) -> list[str]:
+    """設定から許可するオリジンを決める（本番環境のURLが無い場合はローカルの開発用サーバー）"""
+    if config.production_url:
+        return list(config.production_url)
+    return ["http://localhost:3000", "http://localhost:8787"]
+
+
+class ReloadableCORSMiddleware:
+    def __init__(
+        self,
+        app: ASGIApp,
+        config_store: ConfigStore,
+        origins: Callable[[Config], Sequence[str]] = cors_origins,
+        **options,
+    ):
+        """設定の変更に合わせて、許可するオリジンを再起動なしで切り替える CORSMiddleware
+
+        Args:
+            app (ASGIApp): 次のアプリケーション
+            config_store (ConfigStore): 変更を受け取る設定
+            origins (Callable[[Config], Sequence[str]], optional): 設定から許可するオリジンを決める関数. Defaults to cors_origins.
+            **options: CORSMiddleware に渡す allow_origins 以外の引数
+        """
+        self.app = app
+        self.origins = origins
+        self.options = options
+        self.middleware = self._build(config_store.snapshot)
+        config_store.subscribe(self.on_config_change)
+
+    def _build(self, snapshot: ConfigSnapshot) -> CORSMiddleware:
+        return CORSMiddleware(self.app, allow_origins=self.origins(snapshot.config), **self.options)
+
+    def on_config_change(self, snapshot: ConfigSnapshot):
+        # 処理中のリクエストに影響しないよう、新しい CORSMiddleware を作って差し替える
+        self.middleware = self._build(snapshot)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        await self.middleware(scope, receive, send)
@@ -1,5 +1,6 @@
 from starlette.requests import HTTPConnection
 
+from src.utils.chat import ConnectionManager
 from src.db.comment_database import CommentsDatabase
 from src.db.user_database import UsersDatabase
 from src.discordbot.bot import BackendDiscordClient
@@ -20,6 +21,10 @@ def get_comments_db(connection: HTTPConnection) -> CommentsDatabase:
     return connection.app.state.comments_db
 
 
+def get_chat_manager(connection: HTTPConnection) -> ConnectionManager:
+    return connection.app.state.chat_manager
+
+
 def get_playlist_manager(connection: HTTPConnection) -> PlaylistManager:
     return connection.app.state.playlist_manager
 
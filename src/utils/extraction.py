@@ -1,7 +1,10 @@
 from urllib import parse
 import re
 
-from src.utils.config import ConfigStore
+from src.utils.config import shared_config_store
+
+# sanitize_links のルールを変更した場合は値を上げる（保存済みのコメントが作り直される）
+SANITIZE_RULES_VERSION = 1
 
 url_pattern = re.compile(r"https?://[A-Za-z0-9_!?/+\-_~;.,*&@#$%()'[\]]+")
 markdown_link_pattern = re.compile(r"(\[([^\]]+)\]\(https?://[A-Za-z0-9_!?/+\-_~;.,*&@#$%()'[\]]+\))")
@@ -12,14 +15,7 @@ async def including_video_id(text: str | None) -> str | None:
     if text is None or text.strip() == "":
         return None
 
-    config = await ConfigStore().get_config()
-    production_hostname = None
-    if config.production_url:
-        try:
-            parsed_url = parse.urlparse(config.production_url)
-            production_hostname = parsed_url.hostname
-        except Exception:
-            pass
+    production_hostnames = shared_config_store().snapshot.production_hostnames
 
     try:
         parsed_url = parse.urlparse(text)
@@ -34,7 +30,7 @@ async def including_video_id(text: str | None) -> str | None:
         elif parsed_url.hostname == "youtu.be":
             # 短縮URL
             return parsed_url.path[1:].split("/")[0]  # Remove the leading '/'
-        elif parsed_url.hostname == production_hostname and parsed_url.path.startswith("/songs/"):
+        elif parsed_url.hostname in production_hostnames and parsed_url.path.startswith("/songs/"):
             # MIMIさん全曲紹介のURL
             return parsed_url.path.split("/songs/")[1]
     except Exception:
@@ -59,3 +55,8 @@ def sanitize_links(text: str, replaced_message: str = "[リンク非表示]") ->
         text = text.replace(url, replaced_message)
 
     return text
+
+
+def render_comment(content: str, is_guest: bool) -> str:
+    """Returns the content to display. Links are hidden for guest users."""
+    return sanitize_links(content) if is_guest else content
@@ -151,6 +151,28 @@ class SongSearchParams(BaseModel):
     asc: Optional[bool] = Field(default=False, description="昇順・降順の指定", examples=[False, True])
 
 
+class FacetCount(BaseModel):
+    value: str | int = Field(..., description="値", examples=["初音ミク", 2024])
+    count: int = Field(..., description="値に一致する曲の数", examples=[12])
+
+
+class SongFacets(BaseModel):
+    total: int = Field(..., description="条件に一致する曲の数")
+    vocal: list[FacetCount] = Field(default_factory=list, description="ボーカルごとの曲の数")
+    illustrations: list[FacetCount] = Field(default_factory=list, description="イラストレーターごとの曲の数")
+    movie: list[FacetCount] = Field(default_factory=list, description="動画制作者ごとの曲の数")
+    mainKey: list[FacetCount] = Field(default_factory=list, description="主なキーごとの曲の数")
+    mainChord: list[FacetCount] = Field(default_factory=list, description="主なコードごとの曲の数")
+    publishedType: list[FacetCount] = Field(default_factory=list, description="公開タイプごとの曲の数")
+    year: list[FacetCount] = Field(default_factory=list, description="公開年（日本時間）ごとの曲の数")
+
+
+class SearchSuggestion(BaseModel):
+    text: str = Field(..., description="候補の曲名・クリエイター名", examples=["ハナタバ", "初音ミク"])
+    kind: Literal["title", "vocal", "illustrations", "movie"] = Field(..., description="候補の種類")
+    count: int = Field(..., description="その名前を含む曲の数", examples=[12])
+
+
 class SongSampleParams(BaseModel):
     filter: Optional[SongFilters] = Field(default=None, description="曲の絞り込み条件")
     limit: Optional[int] = Field(default=10, ge=1, description="取得する曲の最大数", examples=[10])
@@ -1,9 +1,10 @@
 import logging
 
 from src.discordbot.discord_handler import DiscordHandler, default_embed
-from src.utils.config import ConfigStore
+from src.utils.config import ConfigSnapshot, shared_config_store
 
-config = ConfigStore()._config
+config_store = shared_config_store()
+config = config_store.snapshot.config
 
 
 logger = logging.getLogger("songs_introduction")
@@ -26,4 +27,16 @@ if not logger.handlers:  # 重複を防ぐ
     discord_handler.setLevel(logging.WARNING)
     logger.addHandler(discord_handler)
 
+    def update_discord_channel(snapshot: ConfigSnapshot):
+        """設定のチャンネルIDが変更されたら、ログの送信先を切り替える"""
+        if discord_handler.bot is None or not discord_handler.bot.is_ready():
+            discord_handler.send_channel = snapshot.config.discord_channel_id
+            return
+
+        channel = discord_handler.bot.get_channel(snapshot.config.discord_channel_id)
+        if channel is not None:
+            discord_handler.send_channel = channel
+
+    config_store.subscribe(update_discord_channel)
+
     logger.setLevel(logging.DEBUG)
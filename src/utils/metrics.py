@@ -0,0 +1,346 @@
+# Prometheus のテキスト形式で出力する、プロセス内のメトリクス
+# 計測のたびに行うのはロックを取って数値を足すことだけで、文字列への変換は /metrics の取得時にだけ行う
+
+import functools
+import inspect
+import math
+import threading
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# 処理時間（秒）のヒストグラムの既定のバケット
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{escaped}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class _Metric(ABC):
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = (), registry: Optional["Registry"] = None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: dict[tuple[str, ...], object] = {}
+        self._functions: dict[tuple[str, ...], Callable[[], float]] = {}
+        self._lock = threading.Lock()
+        (registry or REGISTRY).register(self)
+
+    @abstractmethod
+    def _new_child(self):
+        """ラベルの値ごとの系列を作る"""
+
+    def labels(self, *values: str):
+        """ラベルの値ごとの系列を取得する（同じ値には同じ系列を返す）"""
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def set_function(self, func: Callable[[], float], *values: str):
+        """取得時に func を呼んで値を求める系列を登録する（既存の件数などをそのまま公開する場合）"""
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        with self._lock:
+            self._functions[values] = func
+
+    def _samples(self) -> Iterator[tuple[str, tuple[str, ...], tuple[str, ...], float]]:
+        """(名前の接尾辞, ラベル名, ラベルの値, 値) の列"""
+        for values, child in list(self._children.items()):
+            yield "", self.labelnames, values, child.value  # type: ignore[attr-defined]
+        for values, func in list(self._functions.items()):
+            try:
+                value = float(func())
+            except Exception:
+                continue
+            yield "", self.labelnames, values, value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        for suffix, names, values, value in self._samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(names, values)} {_format_value(value)}")
+        return lines
+
+
+class _Value:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+    def set(self, value: float):
+        with self._lock:
+            self.value = value
+
+    def dec(self, amount: float = 1.0):
+        self.inc(-amount)
+
+
+class Counter(_Metric):
+    """増えるだけの値（件数など）"""
+
+    type_name = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+
+class Gauge(_Metric):
+    """増減する値（接続数など）"""
+
+    type_name = "gauge"
+
+    def _new_child(self):
+        return _Value()
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+
+class _HistogramValue:
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        # 最後の要素は +Inf のバケット
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self):
+        """with ブロックの処理時間を記録する"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+
+class Histogram(_Metric):
+    """値の分布（処理時間など）"""
+
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+        registry: Optional["Registry"] = None,
+    ):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def set_function(self, func, *values):
+        raise TypeError("Histogram does not support set_function")
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+    def _samples(self):
+        names = self.labelnames + ("le",)
+        for values, child in list(self._children.items()):
+            with child._lock:
+                counts = list(child.counts)
+                total = child.sum
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                yield "_bucket", names, values + (_format_value(bound),), cumulative
+            yield "_sum", self.labelnames, values, total
+            yield "_count", self.labelnames, values, cumulative
+
+
+class Registry:
+    def __init__(self):
+        """メトリクスの登録先"""
+        self._metrics: dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Duplicated metric: {metric.name}")
+            self._metrics[metric.name] = metric
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        """Prometheus のテキスト形式に変換する"""
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "HTTPリクエストの処理時間", ("method", "route", "status")
+)
+DB_QUERY_SECONDS = Histogram("db_query_duration_seconds", "データベースのメソッドの処理時間", ("database", "method"))
+SCORING_SECONDS = Histogram("song_scoring_duration_seconds", "類似度の計算にかかった時間", ("operation",))
+YOUTUBE_API_SECONDS = Histogram(
+    "youtube_api_request_duration_seconds",
+    "YouTube API へのリクエストの応答時間",
+    ("endpoint",),
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+YOUTUBE_API_ERRORS = Counter("youtube_api_errors_total", "YouTube API のエラーの件数", ("endpoint", "status"))
+CHAT_CONNECTIONS = Gauge("chat_websocket_connections", "チャットの WebSocket の接続数", ("state",))
+CHAT_BROADCAST_SECONDS = Histogram("chat_broadcast_duration_seconds", "チャットのメッセージの配信にかかった時間")
+CACHE_HITS = Counter("cache_hits_total", "キャッシュのヒット数", ("cache",))
+CACHE_MISSES = Counter("cache_misses_total", "キャッシュのミス数", ("cache",))
+CACHE_HIT_RATIO = Gauge("cache_hit_ratio", "キャッシュのヒット率（起動からの累計）", ("cache",))
+
+
+def register_cache(name: str, stats: Callable[[], tuple[int, int]]):
+    """既存のキャッシュのヒット数・ミス数を公開する
+
+    Args:
+        name (str): cache ラベルの値
+        stats (Callable[[], tuple[int, int]]): (ヒット数, ミス数) を返す関数
+    """
+
+    def ratio() -> float:
+        hits, misses = stats()
+        return hits / (hits + misses) if hits + misses else 0.0
+
+    CACHE_HITS.set_function(lambda: stats()[0], name)
+    CACHE_MISSES.set_function(lambda: stats()[1], name)
+    CACHE_HIT_RATIO.set_function(ratio, name)
+
+
+def timed(histogram: Histogram, *values: str):
+    """関数の処理時間を記録するデコレータ（同期・非同期の両方に使える）"""
+
+    def decorator(func):
+        child = histogram.labels(*values)
+
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    child.observe(time.perf_counter() - start)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                child.observe(time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
+
+
+def timed_methods(histogram: Histogram, *methods: str, label: Optional[str] = None):
+    """クラスの指定したメソッドの処理時間を、(クラス名, メソッド名) のラベルで記録する
+
+    他の計測対象のメソッドを呼ぶメソッドを含めると二重に記録されるため、計測する処理を直接行うメソッドだけを指定する。
+
+    Args:
+        histogram (Histogram): 記録先
+        *methods (str): 計測するメソッドの名前
+        label (Optional[str], optional): 1つ目のラベルの値. Defaults to クラス名.
+    """
+
+    def decorator(cls):
+        name = label or cls.__name__
+        for attr in methods:
+            value = vars(cls).get(attr)
+            if not inspect.isfunction(value):
+                raise AttributeError(f"{cls.__name__}.{attr} is not a method")
+            setattr(cls, attr, timed(histogram, name, attr)(value))
+        return cls
+
+    return decorator
+
+
+class MetricsMiddleware:
+    def __init__(self, app: ASGIApp, histogram: Histogram = HTTP_REQUEST_SECONDS):
+        """HTTPリクエストの処理時間を、メソッド・ルート・ステータスごとに記録する
+
+        ルートはパスのテンプレート（/songs/{video_id} など）で記録し、どのルートにも一致しない場合は "unmatched" とする。
+
+        Args:
+            app (ASGIApp): 次のアプリケーション
+            histogram (Histogram, optional): 記録先. Defaults to HTTP_REQUEST_SECONDS.
+        """
+        self.app = app
+        self.histogram = histogram
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_wrapper(message: Message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # FastAPI はルートが決まった時点で scope["route"] を設定する
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            self.histogram.labels(scope["method"], path, str(status)).observe(time.perf_counter() - start)
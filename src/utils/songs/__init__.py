@@ -7,6 +7,8 @@ from .songs import (
 
 from .models import SongVideoData, Song, NATURAL_KEYS
 from .lyrics import LyricsVecManager
+from .search_index import SongsSearchIndex
+from .typeahead import Suggestion, TypeaheadIndex
 
 __all__ = [
     "NATURAL_KEYS",
@@ -17,4 +19,7 @@ __all__ = [
     "SongsMatchScore",
     "SongsCustomParameters",
     "LyricsVecManager",
+    "SongsSearchIndex",
+    "Suggestion",
+    "TypeaheadIndex",
 ]
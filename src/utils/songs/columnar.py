@@ -0,0 +1,400 @@
+from datetime import datetime, timedelta, timezone
+from typing import Any, Hashable, Optional
+
+import numpy as np
+
+from src.db.search_query import parse_keyword
+from src.utils.math import sigmoid
+from .models import Song, NATURAL_KEYS
+from .songs import SongsCustomParameters, SongsStats
+
+# 同じボーカルでも、よく使われるボーカルの組み合わせは類似度を低めにする（SongsMatchScore と同じ）
+COMMON_VOCALS = {"初音ミク", "可不", "重音テトSV"}
+
+# パラメータを指定しない場合の重み（SongsMatchScore.get_score と同じ）
+DEFAULT_WEIGHTS = {
+    "vocal": 0.8,
+    "illustrations": 1.0,
+    "movie": 0.3,
+    "bpm": 1.3,
+    "chordRateMax": 0.5,
+    "chordRateMin": 0.1,
+    "pianoRate": 0.6,
+    "mainKey": 0.6,
+    "mainChord": 0.6,
+    "modulationTimes": 0.4,
+    "lyricsVector": 0.8,
+}
+DEFAULT_A = 0.74
+
+# 公開年の集計に使うタイムゾーン
+JST = timezone(timedelta(hours=9))
+
+
+class DictionaryColumn:
+    def __init__(self, values: list[Optional[Hashable]]):
+        """値を辞書の番号に置き換えた列（None は -1）
+
+        Args:
+            values (list[Optional[Hashable]]): 楽曲の並び順での値
+        """
+        self.dictionary: list[Hashable] = []
+        self.lookup: dict[Hashable, int] = {}
+        codes = np.full(len(values), -1, dtype=np.int32)
+        for position, value in enumerate(values):
+            if value is None:
+                continue
+            code = self.lookup.get(value)
+            if code is None:
+                code = self.lookup[value] = len(self.dictionary)
+                self.dictionary.append(value)
+            codes[position] = code
+        self.codes = codes
+
+    def equals(self, value: Hashable) -> np.ndarray:
+        code = self.lookup.get(value)
+        if code is None:
+            return np.zeros(len(self.codes), dtype=bool)
+        return self.codes == code
+
+    def counts(self, mask: np.ndarray) -> np.ndarray:
+        """マスクで絞り込んだ楽曲での、辞書の値ごとの件数"""
+        codes = self.codes[mask]
+        return np.bincount(codes[codes >= 0], minlength=len(self.dictionary))
+
+
+class ListColumn:
+    def __init__(self, values: list[Optional[list[str]]]):
+        """クリエイター名のリストの列
+
+        Args:
+            values (list[Optional[list[str]]]): 楽曲の並び順での値
+        """
+        self.size = len(values)
+        # リスト全体の一致の判定用
+        self.combinations = DictionaryColumn([None if names is None else tuple(names) for names in values])
+
+        members: dict[str, list[int]] = {}
+        for position, names in enumerate(values):
+            # 同じ曲に同じ名前が重複している場合は1件として扱う
+            for name in dict.fromkeys(names or []):
+                members.setdefault(name, []).append(position)
+        self.members = {name: np.array(positions, dtype=np.intp) for name, positions in members.items()}
+
+        # 集計用に、(楽曲の位置, 名前の番号) の組を平らに並べる
+        self.dictionary = list(self.members)
+        self.item_positions = np.concatenate([np.zeros(0, dtype=np.intp), *self.members.values()])
+        self.item_codes = np.repeat(
+            np.arange(len(self.dictionary), dtype=np.int32), [len(positions) for positions in self.members.values()]
+        )
+
+    def contains(self, name: str) -> np.ndarray:
+        mask = np.zeros(self.size, dtype=bool)
+        positions = self.members.get(name)
+        if positions is not None:
+            mask[positions] = True
+        return mask
+
+    def counts(self, mask: np.ndarray) -> np.ndarray:
+        """マスクで絞り込んだ楽曲での、名前ごとの件数"""
+        return np.bincount(self.item_codes[mask[self.item_positions]], minlength=len(self.dictionary))
+
+
+class SongsColumns:
+    def __init__(self, songs: list[Song]):
+        """楽曲の一覧を列ごとの NumPy 配列にしたもの
+
+        絞り込みの条件をブール配列（マスク）で求め、そのまま類似度の計算に使う。
+        楽曲の位置は、元の一覧での位置と同じ。
+
+        Args:
+            songs (list[Song]): 全楽曲
+        """
+        self.size = len(songs)
+        self.positions = {song.id: position for position, song in enumerate(songs)}
+        self.calculable = np.array([song.score_can_be_calculated() for song in songs], dtype=bool)
+
+        def numeric(field: str) -> np.ndarray:
+            return np.array(
+                [np.nan if getattr(song, field) is None else getattr(song, field) for song in songs], dtype=np.float64
+            )
+
+        self.publishedTimestamp = np.array([song.publishedTimestamp for song in songs], dtype=np.int64)
+        self.publishedType = np.array([song.publishedType for song in songs], dtype=np.int64)
+        self.mainKey = numeric("mainKey")
+        self.bpm = numeric("bpm")
+        self.chordRate6451 = numeric("chordRate6451")
+        self.chordRate4561 = numeric("chordRate4561")
+        self.pianoRate = numeric("pianoRate")
+        self.modulationTimes = numeric("modulationTimes")
+        self.natural_key = np.isin(self.mainKey, list(NATURAL_KEYS))
+
+        self.mainChord = DictionaryColumn([song.mainChord for song in songs])
+        self.mainChordHead = DictionaryColumn([song.mainChord[0] if song.mainChord else None for song in songs])
+
+        self.vocal = ListColumn([song.vocal for song in songs])
+        self.illustrations = ListColumn([song.illustrations for song in songs])
+        self.movie = ListColumn([song.movie for song in songs])
+        self.common_vocals = np.array(
+            [song.vocal is not None and all(v in COMMON_VOCALS for v in song.vocal) for song in songs], dtype=bool
+        )
+
+        dimension = max((len(song.lyricsVector) for song in songs if song.lyricsVector is not None), default=0)
+        self.lyrics = np.zeros((self.size, dimension), dtype=np.float64)
+        self.has_lyrics_vector = np.zeros(self.size, dtype=bool)
+        for position, song in enumerate(songs):
+            if song.lyricsVector is not None:
+                self.lyrics[position, : len(song.lyricsVector)] = song.lyricsVector
+                self.has_lyrics_vector[position] = True
+        self.lyrics_norm = np.linalg.norm(self.lyrics, axis=1)
+        self.has_lyrics = self.has_lyrics_vector & (self.lyrics != 0).any(axis=1)
+
+        # 絞り込み結果の件数の集計に使う列
+        self.facets: dict[str, DictionaryColumn | ListColumn] = {
+            "vocal": self.vocal,
+            "illustrations": self.illustrations,
+            "movie": self.movie,
+            "mainKey": DictionaryColumn([song.mainKey for song in songs]),
+            "mainChord": self.mainChord,
+            "publishedType": DictionaryColumn([song.publishedType for song in songs]),
+            "year": DictionaryColumn([datetime.fromtimestamp(song.publishedTimestamp, JST).year for song in songs]),
+        }
+
+    def filter_mask(self, **kwargs: Any) -> np.ndarray:
+        """SongFilters の条件（タイトル・コメント以外）に一致する楽曲のマスク
+
+        Args:
+            **kwargs: 検索条件（vocal, mainKey, publishedAfter等）。対応していない条件は無視する
+
+        Returns:
+            np.ndarray: 一致する楽曲が True のブール配列
+        """
+        mask = np.ones(self.size, dtype=bool)
+        for key, value in kwargs.items():
+            if value is None:
+                continue
+
+            if key in ("vocal", "illustrations", "movie"):
+                column: ListColumn = getattr(self, key)
+                for term in parse_keyword(value):
+                    term_mask = np.zeros(self.size, dtype=bool)
+                    for word in term.words:
+                        term_mask |= column.contains(word)
+                    mask &= term_mask
+            elif key == "id":
+                mask &= self._id_mask(str(value))
+            elif key == "mainChord":
+                mask &= self.mainChord.equals(str(value))
+            elif key in ("mainKey", "publishedType", "publishedAfter", "publishedBefore"):
+                try:
+                    value = int(value)
+                except (TypeError, ValueError):
+                    return np.zeros(self.size, dtype=bool)
+
+                if key == "mainKey":
+                    mask &= self.mainKey == value
+                elif key == "publishedType":
+                    mask &= self.publishedType == value
+                elif key == "publishedAfter":
+                    mask &= self.publishedTimestamp >= value
+                else:
+                    mask &= self.publishedTimestamp <= value
+        return mask
+
+    def facet_counts(self, mask: np.ndarray, top: int = 10) -> dict[str, list[tuple[Hashable, int]]]:
+        """マスクで絞り込んだ楽曲について、項目ごとに件数の多い値を求める
+
+        Args:
+            mask (np.ndarray): 集計する楽曲のマスク
+            top (int, optional): 項目ごとの値の最大数. Defaults to 10.
+
+        Returns:
+            dict[str, list[tuple[Hashable, int]]]: 項目名 -> (値, 件数) の件数の多い順のリスト
+        """
+        result = {}
+        for field, column in self.facets.items():
+            counts = column.counts(mask)
+            # 件数が同じ値は、辞書の順（新しい曲に先に出てきた順）にする
+            order = np.argsort(-counts, kind="stable")[:top]
+            result[field] = [(column.dictionary[code], int(counts[code])) for code in order if counts[code] > 0]
+        return result
+
+    def _id_mask(self, song_id: str) -> np.ndarray:
+        mask = np.zeros(self.size, dtype=bool)
+        position = self.positions.get(song_id)
+        if position is not None:
+            mask[position] = True
+        return mask
+
+    def match_scores(
+        self,
+        target: int,
+        candidates: np.ndarray,
+        songs_stats: SongsStats,
+        parameters: Optional[SongsCustomParameters] = None,
+    ) -> np.ndarray:
+        """SongsMatchScore と同じ類似度を、候補の楽曲についてまとめて計算する
+
+        Args:
+            target (int): 基準となる楽曲の位置
+            candidates (np.ndarray): 候補の楽曲の位置の配列（スコアを計算できる楽曲のみ）
+            songs_stats (SongsStats): 標準偏差などの統計
+            parameters (Optional[SongsCustomParameters], optional): 類似度の重み. Defaults to None.
+
+        Returns:
+            np.ndarray: candidates と同じ順の類似度
+        """
+        t = target
+        c = candidates
+
+        def same(column: DictionaryColumn) -> np.ndarray:
+            return column.codes[c] == column.codes[t]
+
+        vocal = np.where(same(self.vocal.combinations), 0.3 if self.common_vocals[t] else 1.0, 0.0)
+        illustrations = same(self.illustrations.combinations).astype(np.float64)
+        movie = same(self.movie.combinations).astype(np.float64)
+
+        bpm1, bpm2 = self.bpm[c], self.bpm[t]
+        bpm_raw = 1.0 - np.abs(bpm1 - bpm2) / songs_stats.bpm
+        bpm_doubled = 1.0 - np.abs(np.maximum(bpm1, bpm2) - 2 * np.minimum(bpm1, bpm2)) / songs_stats.bpm
+        bpm = np.maximum(bpm_raw, bpm_doubled * 0.5)
+
+        chord_rate_6451 = 1.0 - np.abs(self.chordRate6451[c] - self.chordRate6451[t]) / songs_stats.chordRate6451
+        chord_rate_4561 = 1.0 - np.abs(self.chordRate4561[c] - self.chordRate4561[t]) / songs_stats.chordRate4561
+        piano_rate = 1.0 - np.abs(self.pianoRate[c] - self.pianoRate[t]) / songs_stats.pianoRate
+
+        key1, key2 = self.mainKey[c], self.mainKey[t]
+        natural1, natural2 = self.natural_key[c], self.natural_key[t]
+        key_diff = np.abs(key1 - key2)
+        main_key = np.select(
+            [
+                key1 == key2,
+                key_diff == 1,
+                key1 * key2 < 0,
+                natural1 == natural2,
+                (key_diff <= 2) & ~natural1 & ~natural2,
+            ],
+            [1.0, 0.4, -1.0, 0.3, 0.7],
+            default=0.0,
+        )
+
+        # 空文字列のコードは比較しない
+        empty_chord = self.mainChord.lookup.get("", -2)
+        main_chord = np.full(len(c), -1.0)
+        if self.mainChord.codes[t] != empty_chord:
+            comparable = self.mainChord.codes[c] != empty_chord
+            main_chord[comparable & same(self.mainChordHead)] = 0.7
+            main_chord[comparable & same(self.mainChord)] = 1.0
+
+        modulation_times = 1.0 - np.abs(
+            np.minimum(3, self.modulationTimes[c]) - np.minimum(3, self.modulationTimes[t])
+        ) * 0.6
+
+        lyrics_vector = self._lyrics_similarity(t, c, songs_stats)
+
+        def moderate(values: np.ndarray) -> np.ndarray:
+            return np.clip(np.round(values, 4), -1, 1)
+
+        vocal, illustrations, movie = moderate(vocal), moderate(illustrations), moderate(movie)
+        bpm, piano_rate = moderate(bpm), moderate(piano_rate)
+        chord_rate_6451, chord_rate_4561 = moderate(chord_rate_6451), moderate(chord_rate_4561)
+        main_key, main_chord = moderate(main_key), moderate(main_chord)
+        modulation_times, lyrics_vector = moderate(modulation_times), moderate(lyrics_vector)
+
+        if parameters is not None:
+            p = parameters
+            total = (
+                vocal * p.vocal
+                + illustrations * p.illustrations
+                + movie * p.movie
+                + bpm * p.bpm
+                + chord_rate_6451 * p.chordRate6451
+                + chord_rate_4561 * p.chordRate4561
+                + piano_rate * p.pianoRate
+                + main_key * p.mainKey
+                + main_chord * p.mainChord
+                + modulation_times * p.modulationTimes
+                + lyrics_vector * p.lyricsVector
+            )
+            a = p.a
+        else:
+            w = DEFAULT_WEIGHTS
+            total = (
+                vocal * w["vocal"]
+                + illustrations * w["illustrations"]
+                + movie * w["movie"]
+                + bpm * w["bpm"]
+                + np.maximum(chord_rate_6451, chord_rate_4561) * w["chordRateMax"]
+                + np.minimum(chord_rate_6451, chord_rate_4561) * w["chordRateMin"]
+                + piano_rate * w["pianoRate"]
+                + main_key * w["mainKey"]
+                + main_chord * w["mainChord"]
+                + modulation_times * w["modulationTimes"]
+                + lyrics_vector * w["lyricsVector"]
+            )
+            a = DEFAULT_A
+
+        return sigmoid(total, a=a)
+
+    def _lyrics_similarity(self, t: int, c: np.ndarray, songs_stats: SongsStats) -> np.ndarray:
+        """LyricsVecManager.lyrics_similarity と同じ値をまとめて計算する"""
+        manager = songs_stats.lyrics_vec_manager
+        result = np.zeros(len(c))
+        if not self.has_lyrics_vector[t]:
+            return result
+
+        has_vector = self.has_lyrics_vector[c]
+        has_lyrics = self.has_lyrics[c]
+        if not self.has_lyrics[t]:
+            # 両方とも歌詞が無い場合は 1、片方のみの場合は -1
+            result[has_vector] = np.where(has_lyrics[has_vector], -1.0, 1.0)
+            return result
+
+        result[has_vector & ~has_lyrics] = -1.0
+        both = has_lyrics
+        if manager.max_similarity == manager.min_similarity:
+            result[both] = 0.0
+            return result
+
+        similarity = (self.lyrics[c[both]] @ self.lyrics[t]) / (self.lyrics_norm[c[both]] * self.lyrics_norm[t])
+        result[both] = (
+            2 * (similarity - manager.min_similarity) / (manager.max_similarity - manager.min_similarity) - 1
+        )
+        return result
+
+    def nearest(
+        self,
+        target: int,
+        mask: np.ndarray,
+        songs_stats: SongsStats,
+        limit: int = 10,
+        parameters: Optional[SongsCustomParameters] = None,
+        is_reversed: bool = False,
+    ) -> list[tuple[int, float]]:
+        """マスクで絞り込んだ楽曲のうち、基準の楽曲に曲調の似た楽曲を求める
+
+        Args:
+            target (int): 基準となる楽曲の位置
+            mask (np.ndarray): 候補の楽曲のマスク
+            songs_stats (SongsStats): 標準偏差などの統計
+            limit (int, optional): 楽曲の最大数. Defaults to 10.
+            parameters (Optional[SongsCustomParameters], optional): 類似度の重み. Defaults to None.
+            is_reversed (bool, optional): 似ていない順にする場合True. Defaults to False.
+
+        Returns:
+            list[tuple[int, float]]: (楽曲の位置, 類似度) のリスト
+        """
+        mask = mask & self.calculable
+        mask[target] = False
+        candidates = np.flatnonzero(mask)
+        if len(candidates) == 0 or limit <= 0:
+            return []
+
+        scores = self.match_scores(target, candidates, songs_stats, parameters)
+        keys = scores if is_reversed else -scores
+        if limit < len(candidates):
+            top = np.argpartition(keys, limit - 1)[:limit]
+        else:
+            top = np.arange(len(candidates))
+        top = top[np.argsort(keys[top], kind="stable")]
+        return [(int(candidates[i]), float(scores[i])) for i in top]
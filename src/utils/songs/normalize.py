@@ -0,0 +1,130 @@
+# 検索・入力補完のための文字列の正規化
+# 漢字の読みの変換には辞書が必要なため、漢字は表記のまま扱う
+
+import re
+import unicodedata
+from typing import Optional
+
+# カタカナ（ァ〜ヶ）をひらがなに揃える
+_KATAKANA_TO_HIRAGANA = {code: code - 0x60 for code in range(ord("ァ"), ord("ヶ") + 1)}
+_KATAKANA_TO_HIRAGANA.update({ord("ヽ"): ord("ゝ"), ord("ヾ"): ord("ゞ")})
+
+# 小書きの仮名を通常の仮名に揃える（「ぁ」と「あ」、「っ」と「つ」などの入力の揺れ）
+_SMALL_KANA = str.maketrans("ぁぃぅぇぉっゃゅょゎゕゖ", "あいうえおつやゆよわかけ")
+
+# 仮名の後の長音記号（ー、〜、ハイフンやマイナス記号で代用されたもの）は取り除く
+_LONG_VOWELS = re.compile(r"(?<=[ぁ-ゖ])[ー〜~\-‐‑–—―−]+")
+
+_SPACES = re.compile(r"\s+")
+
+# normalize_text のルールを変更した場合は値を上げる（保存済みの検索用の文字列が作り直される）
+NORMALIZE_RULES_VERSION = 1
+
+# ヘボン式・訓令式のローマ字とひらがなの対応（長いものから優先して変換する）
+_ROMAJI = {
+    "a": "あ", "i": "い", "u": "う", "e": "え", "o": "お",
+    "ka": "か", "ki": "き", "ku": "く", "ke": "け", "ko": "こ",
+    "sa": "さ", "si": "し", "shi": "し", "su": "す", "se": "せ", "so": "そ",
+    "ta": "た", "ti": "ち", "chi": "ち", "tu": "つ", "tsu": "つ", "te": "て", "to": "と",
+    "na": "な", "ni": "に", "nu": "ぬ", "ne": "ね", "no": "の",
+    "ha": "は", "hi": "ひ", "hu": "ふ", "fu": "ふ", "he": "へ", "ho": "ほ",
+    "ma": "ま", "mi": "み", "mu": "む", "me": "め", "mo": "も",
+    "ya": "や", "yu": "ゆ", "yo": "よ",
+    "ra": "ら", "ri": "り", "ru": "る", "re": "れ", "ro": "ろ",
+    "la": "ら", "li": "り", "lu": "る", "le": "れ", "lo": "ろ",
+    "wa": "わ", "wo": "を", "nn": "ん", "n'": "ん",
+    "ga": "が", "gi": "ぎ", "gu": "ぐ", "ge": "げ", "go": "ご",
+    "za": "ざ", "zi": "じ", "ji": "じ", "zu": "ず", "ze": "ぜ", "zo": "ぞ",
+    "da": "だ", "di": "ぢ", "du": "づ", "de": "で", "do": "ど",
+    "ba": "ば", "bi": "び", "bu": "ぶ", "be": "べ", "bo": "ぼ",
+    "pa": "ぱ", "pi": "ぴ", "pu": "ぷ", "pe": "ぺ", "po": "ぽ",
+    "va": "ゔぁ", "vi": "ゔぃ", "vu": "ゔ", "ve": "ゔぇ", "vo": "ゔぉ",
+    "fa": "ふぁ", "fi": "ふぃ", "fe": "ふぇ", "fo": "ふぉ",
+    "kya": "きゃ", "kyu": "きゅ", "kyo": "きょ",
+    "sha": "しゃ", "shu": "しゅ", "sho": "しょ", "she": "しぇ", "sya": "しゃ", "syu": "しゅ", "syo": "しょ",
+    "cha": "ちゃ", "chu": "ちゅ", "cho": "ちょ", "che": "ちぇ", "tya": "ちゃ", "tyu": "ちゅ", "tyo": "ちょ",
+    "nya": "にゃ", "nyu": "にゅ", "nyo": "にょ",
+    "hya": "ひゃ", "hyu": "ひゅ", "hyo": "ひょ",
+    "mya": "みゃ", "myu": "みゅ", "myo": "みょ",
+    "rya": "りゃ", "ryu": "りゅ", "ryo": "りょ",
+    "gya": "ぎゃ", "gyu": "ぎゅ", "gyo": "ぎょ",
+    "ja": "じゃ", "ju": "じゅ", "jo": "じょ", "je": "じぇ", "zya": "じゃ", "zyu": "じゅ", "zyo": "じょ",
+    "bya": "びゃ", "byu": "びゅ", "byo": "びょ",
+    "pya": "ぴゃ", "pyu": "ぴゅ", "pyo": "ぴょ",
+    "thi": "てぃ", "dhi": "でぃ", "twu": "とぅ", "dwu": "どぅ",
+    "xa": "ぁ", "xi": "ぃ", "xu": "ぅ", "xe": "ぇ", "xo": "ぉ", "xtu": "っ", "xya": "ゃ", "xyu": "ゅ", "xyo": "ょ",
+    "-": "ー",
+}  # fmt: skip
+_ROMAJI_MAX_LENGTH = max(len(key) for key in _ROMAJI)
+_ROMAJI_INPUT = re.compile(r"[a-z' -]+")
+_CONSONANTS = set("bcdfghjklmnpqrstvwxyz")
+
+
+def katakana_to_hiragana(text: str) -> str:
+    return text.translate(_KATAKANA_TO_HIRAGANA)
+
+
+def normalize_text(text: str) -> str:
+    """表記の揺れを吸収した、比較用の文字列に変換する
+
+    NFKC で全角英数字・半角カナなどを揃え、英字は小文字、カタカナはひらがなにする。
+    小書きの仮名は通常の仮名にし、仮名の後の長音記号は取り除く。連続する空白は1つにまとめる。
+
+    Args:
+        text (str): 変換する文字列
+
+    Returns:
+        str: 正規化した文字列
+    """
+    text = unicodedata.normalize("NFKC", text).casefold()
+    text = katakana_to_hiragana(text).translate(_SMALL_KANA)
+    text = _LONG_VOWELS.sub("", text)
+    return _SPACES.sub(" ", text).strip()
+
+
+def romaji_to_hiragana(text: str) -> Optional[str]:
+    """ローマ字の入力をひらがなに変換する（入力途中の末尾の子音は取り除く）
+
+    Args:
+        text (str): normalize_text で正規化した文字列
+
+    Returns:
+        Optional[str]: ひらがな。ローマ字として読めない文字を含む場合は None
+    """
+    if not _ROMAJI_INPUT.fullmatch(text):
+        return None
+
+    result = []
+    i = 0
+    while i < len(text):
+        char = text[i]
+        if char == " ":
+            result.append(" ")
+            i += 1
+            continue
+
+        # 同じ子音の連続は促音（kka -> っか）
+        if char in _CONSONANTS and char != "n" and i + 1 < len(text) and text[i + 1] == char:
+            result.append("っ")
+            i += 1
+            continue
+
+        for length in range(_ROMAJI_MAX_LENGTH, 0, -1):
+            kana = _ROMAJI.get(text[i : i + length])
+            if kana is not None:
+                result.append(kana)
+                i += length
+                break
+        else:
+            rest = text[i + 1 :]
+            if char == "n" and rest and rest[0] in _CONSONANTS and rest[0] != "y":
+                # 子音の前の n は「ん」
+                result.append("ん")
+                i += 1
+            elif char in _CONSONANTS and (not rest or not rest.strip("bcdfghjklmnpqrstvwxyz'")):
+                # 入力途中の子音（hanat の t など）は取り除く
+                break
+            else:
+                return None
+
+    return "".join(result).strip() or None
@@ -0,0 +1,321 @@
+import re
+from bisect import bisect_left, bisect_right
+from functools import cached_property
+from typing import Any, Iterable, Optional
+
+import numpy as np
+
+from src.db.search_query import DEFAULT_ORDER, KEYWORD_FIELDS, SCALAR_FIELDS, SORTABLE_COLUMNS, parse_keyword
+from .columnar import SongsColumns
+from .models import Song
+from .normalize import normalize_text
+
+# SQLite の LIKE と同じく、ASCII の英字のみ大文字・小文字を区別しない
+_ASCII_LOWER = str.maketrans({chr(code): chr(code + 32) for code in range(ord("A"), ord("Z") + 1)})
+
+TEXT_FIELDS = ("title", "comment")
+CREATOR_FIELDS = ("vocal", "illustrations", "movie")
+
+
+def _fold(text: str) -> str:
+    return text.translate(_ASCII_LOWER)
+
+
+def _like_pattern(word: str) -> re.Pattern:
+    """LIKE '%word%' と同じ判定をする正規表現（word に含まれる % と _ もワイルドカードとして扱う）"""
+    pattern = "".join(".*" if char == "%" else "." if char == "_" else re.escape(char) for char in word)
+    return re.compile(f".*{pattern}.*", re.DOTALL)
+
+
+def keyword_grams(keyword: str, ngram: int = 2) -> set[str]:
+    """あいまい検索に使う、正規化したキーワードの n-gram"""
+    grams: set[str] = set()
+    for term in parse_keyword(keyword):
+        for word in term.words:
+            word = normalize_text(word)
+            grams.update(word[start : start + ngram] for start in range(len(word) - ngram + 1))
+    return grams
+
+
+class SortedColumn:
+    def __init__(self, values: list[Optional[int]]):
+        """数値の列を値の順に並べたもの。範囲・一致の条件を二分探索で求める
+
+        Args:
+            values (list[Optional[int]]): 楽曲の並び順での値（None は条件に一致しない）
+        """
+        pairs = sorted((value, position) for position, value in enumerate(values) if value is not None)
+        self.values = [value for value, _ in pairs]
+        self.positions = [position for _, position in pairs]
+
+    def between(self, low: Optional[int] = None, high: Optional[int] = None) -> set[int]:
+        """low 以上 high 以下の値を持つ楽曲の位置"""
+        start = 0 if low is None else bisect_left(self.values, low)
+        end = len(self.values) if high is None else bisect_right(self.values, high)
+        return set(self.positions[start:end])
+
+
+class SongsSearchIndex:
+    def __init__(self, songs: list[Song], ngram: int = 2):
+        """楽曲の一覧から作る、メモリ上の検索用の転置インデックス
+
+        SongsDatabase.search_songs と同じ引数・同じ AND/OR の意味で検索し、同じ楽曲を返す。
+        タイトル・コメントは文字 n-gram、クリエイター名は完全一致、数値の条件は値の順に並べた配列で絞り込む。
+
+        Args:
+            songs (list[Song]): 検索対象の全楽曲
+            ngram (int, optional): タイトル・コメントの索引に使う文字数. Defaults to 2.
+        """
+        self.songs = songs
+        self.ngram = ngram
+        self.all_positions = range(len(songs))
+
+        # 列名 -> 正規化したテキスト（None は LIKE に一致しない）
+        self.texts: dict[str, list[Optional[str]]] = {}
+        # 列名 -> n-gram -> 楽曲の位置
+        self.text_postings: dict[str, dict[str, set[int]]] = {}
+        for field in TEXT_FIELDS:
+            texts = [None if getattr(song, field) is None else _fold(getattr(song, field)) for song in songs]
+            self.texts[field] = texts
+            self.text_postings[field] = self._build_ngram_postings(texts)
+
+        # 列名 -> 名前 -> 楽曲の位置
+        self.exact_postings: dict[str, dict[Any, set[int]]] = {
+            field: self._build_exact_postings(getattr(song, field) or [] for song in songs) for field in CREATOR_FIELDS
+        }
+        self.exact_postings["id"] = self._build_exact_postings([song.id] for song in songs)
+        self.exact_postings["mainChord"] = self._build_exact_postings(
+            [] if song.mainChord is None else [song.mainChord] for song in songs
+        )
+
+        # 表記の揺れを吸収した検索用（normalize_text で正規化した文字列の n-gram と、クリエイター名）
+        self.normalized_texts: dict[str, list[Optional[str]]] = {}
+        self.normalized_postings: dict[str, dict[str, set[int]]] = {}
+        for field in TEXT_FIELDS:
+            texts = [None if getattr(song, field) is None else normalize_text(getattr(song, field)) for song in songs]
+            self.normalized_texts[field] = texts
+            self.normalized_postings[field] = self._build_ngram_postings(texts)
+        self.normalized_creators = self._build_exact_postings(
+            {normalize_text(name) for field in CREATOR_FIELDS for name in getattr(song, field) or []} for song in songs
+        )
+        # あいまい検索用に、クリエイター名をつなげた文字列の n-gram も持つ
+        self.normalized_postings["creators"] = self._build_ngram_postings(
+            ["\n".join(sorted(names)) for names in self._names_by_position(self.normalized_creators, len(songs))]
+        )
+
+        self.sorted_columns: dict[str, SortedColumn] = {
+            "mainKey": SortedColumn([song.mainKey for song in songs]),
+            "publishedType": SortedColumn([song.publishedType for song in songs]),
+            "publishedTimestamp": SortedColumn([song.publishedTimestamp for song in songs]),
+        }
+
+    def __len__(self) -> int:
+        return len(self.songs)
+
+    def _build_ngram_postings(self, texts: list[Optional[str]]) -> dict[str, set[int]]:
+        postings: dict[str, set[int]] = {}
+        for position, text in enumerate(texts):
+            if text is None:
+                continue
+            # n 文字未満の語でも検索できるよう、1文字から n 文字までを索引にする
+            for size in range(1, self.ngram + 1):
+                for start in range(len(text) - size + 1):
+                    postings.setdefault(text[start : start + size], set()).add(position)
+        return postings
+
+    @staticmethod
+    def _build_exact_postings(values: Iterable[list]) -> dict[Any, set[int]]:
+        postings: dict[Any, set[int]] = {}
+        for position, names in enumerate(values):
+            for name in names:
+                postings.setdefault(name, set()).add(position)
+        return postings
+
+    @staticmethod
+    def _names_by_position(postings: dict[str, set[int]], size: int) -> list[list[str]]:
+        names: list[list[str]] = [[] for _ in range(size)]
+        for name, positions in postings.items():
+            for position in positions:
+                names[position].append(name)
+        return names
+
+    def _match_text(self, field: str, word: str) -> set[int]:
+        """field LIKE '%word%' に一致する楽曲の位置"""
+        texts = self.texts[field]
+        if "%" in word or "_" in word:
+            pattern = _like_pattern(_fold(word))
+            return {position for position, text in enumerate(texts) if text is not None and pattern.fullmatch(text)}
+        return self._match_substring(texts, self.text_postings[field], _fold(word))
+
+    def _match_normalized(self, field: str, word: str) -> set[int]:
+        """正規化した field が LIKE '%word%' に一致する楽曲の位置（word は正規化したもの）"""
+        texts = self.normalized_texts[field]
+        if "%" in word or "_" in word:
+            pattern = _like_pattern(word)
+            return {position for position, text in enumerate(texts) if text is not None and pattern.fullmatch(text)}
+        return self._match_substring(texts, self.normalized_postings[field], word)
+
+    def _match_substring(self, texts: list[Optional[str]], postings: dict[str, set[int]], word: str) -> set[int]:
+        """word を部分文字列として含む楽曲の位置"""
+        size = min(self.ngram, len(word))
+        grams = {word[start : start + size] for start in range(len(word) - size + 1)}
+
+        lists = sorted((postings.get(gram, set()) for gram in grams), key=len)
+        candidates = set(lists[0]).intersection(*lists[1:])
+        if len(word) <= self.ngram:
+            return candidates
+        # n-gram がすべて含まれていても、連続して含まれているとは限らないため確認する
+        return {position for position in candidates if word in texts[position]}
+
+    def _match_word(self, key: str, word: str) -> set[int]:
+        if key == "q":
+            result = self._match_text("title", word) | self._match_text("comment", word)
+            for field in CREATOR_FIELDS:
+                result |= self.exact_postings[field].get(word, set())
+            return result
+        if key in TEXT_FIELDS:
+            return self._match_text(key, word)
+        return set(self.exact_postings[key].get(word, set()))
+
+    def _match_scalar(self, key: str, value: Any) -> set[int]:
+        if key in ("id", "mainChord"):
+            return set(self.exact_postings[key].get(str(value), set()))
+
+        try:
+            value = int(value)
+        except (TypeError, ValueError):
+            return set()
+        if key == "publishedAfter":
+            return self.sorted_columns["publishedTimestamp"].between(low=value)
+        if key == "publishedBefore":
+            return self.sorted_columns["publishedTimestamp"].between(high=value)
+        return self.sorted_columns[key].between(value, value)
+
+    @cached_property
+    def columns(self) -> SongsColumns:
+        """類似度の計算などに使う、列ごとの配列（初回の参照時に作成）"""
+        return SongsColumns(self.songs)
+
+    def filter_mask(self, **kwargs: Any) -> np.ndarray:
+        """search_songs と同じ条件に一致する楽曲のマスク
+
+        Returns:
+            np.ndarray: 一致する楽曲が True のブール配列（位置は self.songs と同じ）
+        """
+        text_kwargs = {key: kwargs[key] for key in ("q", *TEXT_FIELDS) if kwargs.get(key) is not None}
+        mask = self.columns.filter_mask(**{key: value for key, value in kwargs.items() if key not in text_kwargs})
+        if text_kwargs:
+            matched = self._match(**text_kwargs)
+            if matched is not None:
+                text_mask = np.zeros(len(self.songs), dtype=bool)
+                text_mask[list(matched)] = True
+                mask &= text_mask
+        return mask
+
+    def search_positions(self, **kwargs: Any) -> list[int]:
+        """search_songs と同じ条件で検索し、一致した楽曲の位置を並び替えて返す"""
+        matched = self._match(**kwargs)
+        if matched is not None and not matched:
+            return []
+
+        positions = list(self.all_positions) if matched is None else sorted(matched)
+        return self._sort(positions, kwargs.get("order"), bool(kwargs.get("asc")))
+
+    def _match(self, **kwargs: Any) -> Optional[set[int]]:
+        """条件に一致する楽曲の位置（条件が無い場合は None）"""
+        matched: Optional[set[int]] = None
+
+        # 件数の少ない条件から絞り込むため、条件ごとの候補を先に求める
+        candidate_sets: list[set[int]] = []
+        for key, value in kwargs.items():
+            if value is None:
+                continue
+
+            if key in KEYWORD_FIELDS:
+                for term in parse_keyword(value):
+                    candidates = set()
+                    for word in term.words:
+                        candidates |= self._match_word(key, word)
+                    candidate_sets.append(candidates)
+            elif key in SCALAR_FIELDS:
+                candidate_sets.append(self._match_scalar(key, value))
+
+        for candidates in sorted(candidate_sets, key=len):
+            matched = candidates if matched is None else matched & candidates
+            if not matched:
+                break
+        return matched
+
+    def _sort(self, positions: list[int], order: Optional[str], asc: bool) -> list[int]:
+        if order not in SORTABLE_COLUMNS:
+            order = DEFAULT_ORDER
+
+        # SQLite と同じく、NULL は昇順で先頭・降順で末尾にする
+        def key(position: int):
+            value = getattr(self.songs[position], order)
+            return (value is not None, value if value is not None else 0)
+
+        return sorted(positions, key=key, reverse=not asc)
+
+    def search_normalized(self, keyword: str) -> list[int]:
+        """表記の揺れを吸収して、キーワードがタイトル・コメント・クリエイター名に含まれる楽曲を検索する
+
+        キーワードの AND/OR の意味、% と _ をワイルドカードとして扱うことは search_songs の q と同じ。
+        ひらがな・カタカナ・半角カナ、長音記号などの違いは区別しない。
+
+        Returns:
+            list[int]: 一致した楽曲の位置（公開日時の新しい順）
+        """
+        matched: Optional[set[int]] = None
+        for term in parse_keyword(keyword):
+            candidates: set[int] = set()
+            for word in term.words:
+                word = normalize_text(word)
+                if not word:
+                    continue
+                for field in TEXT_FIELDS:
+                    candidates |= self._match_normalized(field, word)
+                candidates |= self.normalized_creators.get(word, set())
+
+            matched = candidates if matched is None else matched & candidates
+            if not matched:
+                return []
+
+        positions = list(self.all_positions) if matched is None else sorted(matched)
+        return self._sort(positions, None, False)
+
+    def search_similar(self, keyword: str, limit: int = 20, threshold: float = 0.5) -> list[int]:
+        """タイトル・クリエイター名に、キーワードの n-gram を多く含む楽曲を検索する（入力ミスを許容する検索）
+
+        Args:
+            keyword (str): 検索キーワード
+            limit (int, optional): 楽曲の最大数. Defaults to 20.
+            threshold (float, optional): キーワードの n-gram のうち、含まれている割合の下限. Defaults to 0.5.
+
+        Returns:
+            list[int]: 楽曲の位置（含まれている割合の高い順）
+        """
+        grams = keyword_grams(keyword, self.ngram)
+        # 短すぎるキーワードでは、似ている度合いを判断できない
+        if len(grams) < 2:
+            return []
+
+        counts: dict[int, int] = {}
+        for gram in grams:
+            positions = self.normalized_postings["title"].get(gram, set()) | self.normalized_postings["creators"].get(
+                gram, set()
+            )
+            for position in positions:
+                counts[position] = counts.get(position, 0) + 1
+
+        minimum = threshold * len(grams)
+        ranked = sorted((-count, position) for position, count in counts.items() if count >= minimum)
+        return [position for _, position in ranked[:limit]]
+
+    def search(self, **kwargs: Any) -> list[Song]:
+        """条件による楽曲検索（引数は SongsDatabase.search_songs と同じ）
+
+        Returns:
+            list[Song]: 条件に一致する楽曲のリスト
+        """
+        return [self.songs[position] for position in self.search_positions(**kwargs)]
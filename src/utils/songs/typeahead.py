@@ -0,0 +1,136 @@
+import heapq
+import threading
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from typing import Literal, NamedTuple
+
+from .models import Song
+from .normalize import normalize_text, romaji_to_hiragana
+
+SuggestionKind = Literal["title", "vocal", "illustrations", "movie"]
+SUGGESTION_FIELDS: tuple[SuggestionKind, ...] = ("title", "vocal", "illustrations", "movie")
+
+# 前方一致の範囲の終わりを求めるための、どの文字よりも後に並ぶ文字
+_MAX_CHAR = "\U0010ffff"
+
+
+class Suggestion(NamedTuple):
+    text: str
+    kind: SuggestionKind
+    count: int
+
+
+class TypeaheadIndex:
+    def __init__(self, songs: list[Song], cache_size: int = 1024):
+        """曲名・クリエイター名の入力補完用の前方一致インデックス
+
+        正規化した文字列（と、その単語の区切りからの部分）を値の順に並べた配列を持ち、二分探索で前方一致を求める。
+        候補は、その名前を含む曲の数が多い順に並べる。
+
+        Args:
+            songs (list[Song]): 全楽曲
+            cache_size (int, optional): 入力補完の結果をキャッシュする件数. Defaults to 1024.
+        """
+        # (種類, 表記) -> その表記を含む曲の数
+        self.counts: dict[tuple[SuggestionKind, str], int] = {}
+        # (正規化した文字列, 種類, 表記) の値の順の配列
+        self.keys: list[tuple[str, SuggestionKind, str]] = []
+
+        self.cache_size = cache_size
+        self._cache: OrderedDict[tuple[str, int], list[Suggestion]] = OrderedDict()
+        self._lock = threading.Lock()
+
+        for song in songs:
+            for term in self._terms(song):
+                self.counts[term] = self.counts.get(term, 0) + 1
+        self.keys = sorted(key for term in self.counts for key in self._keys(term))
+
+    def __len__(self) -> int:
+        return len(self.counts)
+
+    @staticmethod
+    def _terms(song: Song) -> set[tuple[SuggestionKind, str]]:
+        terms = {("title", song.title)} if song.title else set()
+        for field in SUGGESTION_FIELDS[1:]:
+            for name in getattr(song, field) or []:
+                # "-" は「なし」を表す
+                if name and name != "-":
+                    terms.add((field, name))
+        return terms
+
+    @staticmethod
+    def _keys(term: tuple[SuggestionKind, str]) -> list[tuple[str, SuggestionKind, str]]:
+        kind, text = term
+        normalized = normalize_text(text)
+        # 途中の単語からでも補完できるよう、空白の次の位置からの部分も加える
+        starts = [0] + [i + 1 for i, char in enumerate(normalized) if char == " "]
+        return sorted({(normalized[start:], kind, text) for start in starts if normalized[start:]})
+
+    def add_song(self, song: Song):
+        """楽曲の追加を反映する"""
+        with self._lock:
+            for term in self._terms(song):
+                count = self.counts.get(term, 0)
+                self.counts[term] = count + 1
+                if count == 0:
+                    for key in self._keys(term):
+                        insort(self.keys, key)
+            self._cache.clear()
+
+    def remove_song(self, song: Song):
+        """楽曲の削除を反映する"""
+        with self._lock:
+            for term in self._terms(song):
+                count = self.counts.get(term, 0) - 1
+                if count > 0:
+                    self.counts[term] = count
+                    continue
+
+                self.counts.pop(term, None)
+                for key in self._keys(term):
+                    i = bisect_left(self.keys, key)
+                    if i < len(self.keys) and self.keys[i] == key:
+                        del self.keys[i]
+            self._cache.clear()
+
+    def suggest(self, query: str, limit: int = 10) -> list[Suggestion]:
+        """入力途中の文字列から候補を求める
+
+        Args:
+            query (str): 入力途中の文字列（ローマ字の場合はひらがなでも探す）
+            limit (int, optional): 候補の最大数. Defaults to 10.
+
+        Returns:
+            list[Suggestion]: 含む曲の数が多い順の候補
+        """
+        normalized = normalize_text(query)
+        if not normalized:
+            return []
+
+        cache_key = (normalized, limit)
+        with self._lock:
+            cached = self._cache.get(cache_key)
+            if cached is not None:
+                self._cache.move_to_end(cache_key)
+                return cached
+
+            prefixes = {normalized}
+            hiragana = romaji_to_hiragana(normalized)
+            if hiragana:
+                prefixes.add(normalize_text(hiragana))
+
+            terms: set[tuple[SuggestionKind, str]] = set()
+            for prefix in prefixes:
+                start = bisect_left(self.keys, (prefix,))
+                end = bisect_left(self.keys, (prefix + _MAX_CHAR,), start)
+                terms.update(key[1:] for key in self.keys[start:end])
+
+            # 曲の数が多い順、同じ場合は短い順
+            counts = self.counts
+            ranked = heapq.nsmallest(limit, ((-counts[term], len(term[1]), term) for term in terms))
+            suggestions = [Suggestion(text, kind, -count) for count, _, (kind, text) in ranked]
+
+            self._cache[cache_key] = suggestions
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            return suggestions
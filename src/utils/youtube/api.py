@@ -3,23 +3,44 @@ import httpx
 from datetime import datetime, timedelta
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 
-from src.utils.config import ConfigStore
+from src.utils.config import ConfigSnapshot, shared_config_store
 from src.utils.logger import logger
+from src.utils.metrics import YOUTUBE_API_ERRORS, YOUTUBE_API_SECONDS
 
-config_store = ConfigStore()
+config_store = shared_config_store()
+
+# アクセストークンを定期的に取得し直すジョブのID
+REFRESH_JOB_ID = "youtube_oauth_refresh"
 
 # Refresh Tokenの再発行
 # https://developers.google.com/oauthplayground/
 
 
+async def _request(client: httpx.AsyncClient, endpoint: str, method: str, url: str, **kwargs) -> httpx.Response:
+    """YouTube API へリクエストを送り、応答時間とエラーの件数を記録する"""
+    with YOUTUBE_API_SECONDS.labels(endpoint).time():
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            YOUTUBE_API_ERRORS.labels(endpoint, "network").inc()
+            raise
+
+    if response.status_code != 200:
+        YOUTUBE_API_ERRORS.labels(endpoint, str(response.status_code)).inc()
+    return response
+
+
 async def list_videos(video_ids: list[str]) -> list[dict]:
-    config = await config_store.get_config()
+    config = config_store.snapshot.config
 
     res = []
     async with httpx.AsyncClient() as client:
         for i in range(0, len(video_ids), 50):
-            response = await client.get(
-                f"https://youtube.googleapis.com/youtube/v3/videos",
+            response = await _request(
+                client,
+                "videos.list",
+                "GET",
+                "https://youtube.googleapis.com/youtube/v3/videos",
                 params={
                     "part": "snippet,contentDetails",
                     "id": ",".join(video_ids[i : i + 50]),
@@ -41,6 +62,8 @@ class OAuthClient:
         self.scheduler = AsyncIOScheduler()
         self.access_token = None
         self._started = False
+        self._credentials_used: tuple = ()
+        config_store.subscribe(self.on_config_change)
 
     async def start(self):
         """スケジューラーを起動し、初回のアクセストークンを取得"""
@@ -52,11 +75,26 @@ class OAuthClient:
         self._started = True
         logger.info("OAuthClient started successfully.")
 
+    async def on_config_change(self, snapshot: ConfigSnapshot):
+        """OAuthの認証情報が変更された場合は、新しい認証情報でアクセストークンを取得し直す"""
+        if self._started and self._credentials(snapshot) != self._credentials_used:
+            await self.refresh_access_token()
+
+    @staticmethod
+    def _credentials(snapshot: ConfigSnapshot) -> tuple:
+        config = snapshot.config
+        return config.youtube_oauth_client_id, config.youtube_oauth_client_secret, config.youtube_oauth_refresh_token
+
     async def refresh_access_token(self) -> dict:
-        config = await config_store.get_config()
+        snapshot = config_store.snapshot
+        config = snapshot.config
+        self._credentials_used = self._credentials(snapshot)
 
         async with httpx.AsyncClient() as client:
-            response = await client.post(
+            response = await _request(
+                client,
+                "oauth.token",
+                "POST",
                 "https://oauth2.googleapis.com/token",
                 data={
                     "client_id": config.youtube_oauth_client_id,
@@ -71,10 +109,13 @@ class OAuthClient:
                 return {}
 
         next_run_time = datetime.now() + timedelta(seconds=response.json().get("expires_in", 3600) - 60)
+        # 401 でのリトライなど、予定より前に取得し直した場合も次回の取得は1つだけにする
         self.scheduler.add_job(
             self.refresh_access_token,
             "date",
             run_date=next_run_time,
+            id=REFRESH_JOB_ID,
+            replace_existing=True,
         )
         logger.info(f"Refreshed access token and scheduled next refresh at {next_run_time}.")
         self.access_token = response.json().get("access_token")
@@ -86,7 +127,10 @@ class OAuthClient:
             await self.refresh_access_token()
 
         async with httpx.AsyncClient() as client:
-            response = await client.post(
+            response = await _request(
+                client,
+                "playlists.insert",
+                "POST",
                 "https://youtube.googleapis.com/youtube/v3/playlists",
                 params={"part": "snippet,status"},
                 headers={
@@ -111,38 +155,39 @@ class OAuthClient:
 
             return response.json()
 
-    async def insert_playlist_items(self, playlist_id: str, video_ids: list[str]) -> int:
+    async def insert_playlist_item(self, playlist_id: str, video_id: str) -> int:
         if not self.access_token:
             await self.refresh_access_token()
 
-        url = "https://youtube.googleapis.com/youtube/v3/playlistItems"
-        headers = {
-            "Authorization": f"Bearer {self.access_token}",
-            "Accept": "application/json",
-            "Content-Type": "application/json",
-        }
+        async with httpx.AsyncClient() as client:
+            response = await _request(
+                client,
+                "playlistItems.insert",
+                "POST",
+                "https://youtube.googleapis.com/youtube/v3/playlistItems",
+                params={"part": "snippet"},
+                headers={
+                    "Authorization": f"Bearer {self.access_token}",
+                    "Accept": "application/json",
+                    "Content-Type": "application/json",
+                },
+                json=self._playlist_items_payload(playlist_id, video_id),
+            )
+
+        if response.status_code != 200:
+            logger.error(f"Error adding video to playlist: {response.text}")
+        else:
+            logger.debug(f"Added video {video_id} to playlist {playlist_id}.")
+
+        return response.status_code
 
+    async def insert_playlist_items(self, playlist_id: str, video_ids: list[str]) -> int:
         # 非同期リクエストは409の恐れがあるのでやらない
-        async with httpx.AsyncClient() as client:
-            results = []
-            for video_id in video_ids:
-                results.append(
-                    await client.post(
-                        url,
-                        params={"part": "snippet"},
-                        headers=headers,
-                        json=self._playlist_items_payload(playlist_id, video_id),
-                    )
-                )
-                logger.debug(f"Added video {video_id} to playlist {playlist_id}.")
-
-            # results = await asyncio.gather(*tasks)
-            status = 200
-
-            for res in results:
-                if res.status_code != 200:
-                    logger.error(f"Error adding video to playlist: {res.text}")
-                    status = res.status_code
+        status = 200
+        for video_id in video_ids:
+            item_status = await self.insert_playlist_item(playlist_id, video_id)
+            if item_status != 200:
+                status = item_status
 
         return status
 
@@ -1,73 +1,261 @@
+import asyncio
+import hashlib
+import random
 from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Optional
+
 from fastapi import HTTPException
-from pydantic import BaseModel
+import httpx
 
+from src.db.playlist_database import PlaylistJob, PlaylistsDatabase, YoutubePlaylist
 from src.utils.logger import logger
 from src.utils.youtube.api import OAuthClient
 
+# 時間をおけば成功する可能性があるステータスコード
+RETRYABLE_STATUS = {409, 429, 500, 502, 503, 504}
+
+ERROR_MESSAGES = {
+    403: "Backend service are not able to request YouTube Data API",
+    429: "Rate limit exceeded when requesting YouTube Data API",
+}
+
 
-class YoutubePlaylist(BaseModel):
-    id: str
-    title: str
-    description: str
-    createdAt: datetime
-    videoIDs: list[str]
+def playlist_cache_key(video_ids: list[str]) -> str:
+    """動画IDの組み合わせ（順不同）から、キャッシュ用の固定長のキーを作成"""
+    return hashlib.blake2b("\n".join(sorted(video_ids)).encode("utf-8"), digest_size=16).hexdigest()
 
 
 class PlaylistManager:
-    def __init__(self, oauth_client: OAuthClient, ttl: timedelta = timedelta(days=3)):
+    def __init__(
+        self,
+        oauth_client: OAuthClient,
+        playlists_db: PlaylistsDatabase,
+        ttl: timedelta = timedelta(days=3),
+        max_cache_entries: int = 1000,
+        sweep_interval: timedelta = timedelta(hours=1),
+        max_retries: int = 5,
+        retry_base_delay: float = 1.0,
+        lease_seconds: int = 300,
+    ):
         """曲のプレイリスト管理クラス
 
+        プレイリストの作成はジョブとしてデータベースに保存され、バックグラウンドのワーカーが1件ずつ処理する。
+        作成済みのプレイリストもデータベースにキャッシュされるため、再起動後や他のプロセスからも再利用できる。
+
         Args:
             oauth_client (OAuthClient): YouTube Data APIのクライアント
+            playlists_db (PlaylistsDatabase): ジョブを保存するデータベース
             ttl (timedelta, optional): キャッシュとして同じプレイリストを返す期間. Defaults to timedelta(days=3).
+            max_cache_entries (int, optional): キャッシュの最大件数。超えた分は最終利用時刻の古い順に削除. Defaults to 1000.
+            sweep_interval (timedelta, optional): 期限切れキャッシュの削除と停止したジョブの確認の間隔. Defaults to timedelta(hours=1).
+            max_retries (int, optional): 1回のリクエストあたりの最大リトライ回数. Defaults to 5.
+            retry_base_delay (float, optional): リトライ間隔の基準（秒）。リトライのたびに2倍になる. Defaults to 1.0.
+            lease_seconds (int, optional): ワーカーがジョブを占有する期間（秒）. Defaults to 300.
         """
         self.oauth_client = oauth_client
+        self.playlists_db = playlists_db
         self.ttl = ttl
-        self.playlists: dict[tuple[str], YoutubePlaylist] = {}
-
-    async def create_playlist(self, title: str, description: str, video_ids: list[str]) -> YoutubePlaylist:
-        tuple_video_ids = tuple(sorted(video_ids))
-        if tuple_video_ids in self.playlists:
-            cached_playlist = self.playlists[tuple_video_ids]
-            if datetime.now() - self.ttl < cached_playlist.createdAt:
-                return cached_playlist
-
-        playlist_response = await self.oauth_client.insert_playlist(
-            title,
-            description,
-        )
-        if "id" not in playlist_response:
-            if playlist_response.get("status") == 403:
-                raise HTTPException(status_code=503, detail="Backend service are not able to request YouTube Data API")
+        self.max_cache_entries = max_cache_entries
+        self.sweep_interval = sweep_interval
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.lease_seconds = lease_seconds
+
+        self.queue: asyncio.Queue[str] = asyncio.Queue()
+        self._queued_job_ids: set[str] = set()
+        self._worker_task: Optional[asyncio.Task] = None
+        self._sweep_task: Optional[asyncio.Task] = None
+
+    @property
+    def ttl_seconds(self) -> int:
+        return int(self.ttl.total_seconds())
+
+    async def start(self):
+        """ワーカーを起動し、前回の終了時に未完了だったジョブを再開"""
+        if self._worker_task is not None:
+            return
+
+        job_ids = self.playlists_db.get_resumable_job_ids()
+        for job_id in job_ids:
+            self._enqueue(job_id)
+
+        self._worker_task = asyncio.create_task(self._worker())
+        self._sweep_task = asyncio.create_task(self._sweep())
+        logger.info(f"PlaylistManager started. Resuming {len(job_ids)} playlist jobs.")
 
-            if playlist_response.get("status") == 429:
-                raise HTTPException(status_code=429, detail="Rate limit exceeded when creating YouTube playlist")
+    async def stop(self):
+        """ワーカーを停止（処理中のジョブは次回起動時に再開される）"""
+        for task in (self._worker_task, self._sweep_task):
+            if task is None:
+                continue
 
-            raise HTTPException(status_code=500, detail="Failed to create YouTube playlist")
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
 
-        playlist_id = playlist_response.get("id")
-        status = await self.oauth_client.insert_playlist_items(playlist_id, video_ids)
-        logger.info(f"Insert playlist items status: {status}")
-        if status != 200:
-            if status == 403:
-                raise HTTPException(status_code=503, detail="Backend service are not able to request YouTube Data API")
+        self._worker_task = None
+        self._sweep_task = None
 
-            if status == 429:
-                raise HTTPException(
-                    status_code=429, detail="Rate limit exceeded when adding videos to YouTube playlist"
+    def submit_playlist(
+        self, title: str, description: str, video_ids: list[str], submitted_by: Optional[str] = None
+    ) -> PlaylistJob:
+        """プレイリスト作成ジョブを登録する
+
+        キャッシュに同じ動画のプレイリストがある場合は、完了済みのジョブとして返す。
+        同じユーザーの同じ動画のジョブが処理中の場合は、新しく作成せずにそのジョブを返す。
+
+        Args:
+            submitted_by (Optional[str], optional): ジョブを登録したユーザーのFirebaseのUID. Defaults to None.
+        """
+        cache_key = playlist_cache_key(video_ids)
+
+        # 既存のジョブが完了した直後は、キャッシュの確認からやり直す
+        for _ in range(3):
+            cached_playlist = self.playlists_db.get_cached_playlist(cache_key, self.ttl_seconds)
+            if cached_playlist is not None:
+                job = PlaylistJob(
+                    title=cached_playlist.title,
+                    description=cached_playlist.description,
+                    videoIDs=cached_playlist.videoIDs,
+                    status="completed",
+                    playlistID=cached_playlist.id,
+                    position=len(cached_playlist.videoIDs),
+                    submittedBy=submitted_by,
                 )
+                self.playlists_db.add_job(job)
+                return job
+
+            new_job = PlaylistJob(
+                title=title, description=description, videoIDs=video_ids, submittedBy=submitted_by
+            )
+            job = self.playlists_db.add_job(new_job, cache_key)
+            if job is None:
+                continue
+
+            if job.id == new_job.id:
+                self._enqueue(job.id)
+            else:
+                logger.info(f"Playlist request coalesced into existing job {job.id}.")
+            return job
+
+        raise HTTPException(status_code=503, detail="Failed to register playlist job")
+
+    def get_job(self, job_id: str) -> Optional[PlaylistJob]:
+        return self.playlists_db.get_job(job_id)
 
-            raise HTTPException(status_code=500, detail="Failed to add videos to YouTube playlist")
+    def _enqueue(self, job_id: str):
+        if job_id in self._queued_job_ids:
+            return
 
-        playlist = YoutubePlaylist(
-            id=playlist_id,
-            title=title,
-            description=description,
-            createdAt=datetime.now(),
-            videoIDs=video_ids,
+        self._queued_job_ids.add(job_id)
+        self.queue.put_nowait(job_id)
+
+    async def _worker(self):
+        while True:
+            job_id = await self.queue.get()
+            try:
+                await self._run_job(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Unexpected error in playlist job {job_id}: {e}")
+                self.playlists_db.finish_job(job_id, "failed", "Failed to create YouTube playlist")
+            finally:
+                self._queued_job_ids.discard(job_id)
+                self.queue.task_done()
+
+    async def _sweep(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval.total_seconds())
+
+            deleted = self.playlists_db.delete_expired_playlists(self.ttl_seconds)
+            if deleted > 0:
+                logger.info(f"Deleted {deleted} expired playlists from cache.")
+
+            # 他のプロセスが処理途中で停止したジョブを引き継ぐ
+            for job_id in self.playlists_db.get_resumable_job_ids():
+                self._enqueue(job_id)
+
+    async def _run_job(self, job_id: str):
+        if not self.playlists_db.claim_job(job_id, self.lease_seconds):
+            # 他のプロセスが処理中、または完了済み
+            return
+
+        job = self.playlists_db.get_job(job_id)
+        playlist_id = job.playlistID
+
+        if playlist_id is None:
+            playlist_response = {}
+
+            async def request_playlist() -> int:
+                nonlocal playlist_response
+                playlist_response = await self.oauth_client.insert_playlist(job.title, job.description)
+                return 200 if "id" in playlist_response else playlist_response.get("status", 500)
+
+            status = await self._request_with_retry(job_id, request_playlist)
+            if status != 200:
+                self._fail(job_id, status, "Failed to create YouTube playlist")
+                return
+
+            playlist_id = playlist_response["id"]
+            self.playlists_db.update_progress(job_id, playlist_id, job.position, self.lease_seconds)
+
+        for position in range(job.position, len(job.videoIDs)):
+            video_id = job.videoIDs[position]
+            status = await self._request_with_retry(
+                job_id, lambda: self.oauth_client.insert_playlist_item(playlist_id, video_id)
+            )
+            if status != 200:
+                self._fail(job_id, status, "Failed to add videos to YouTube playlist")
+                return
+
+            self.playlists_db.update_progress(job_id, playlist_id, position + 1, self.lease_seconds)
+
+        # 同じ動画の新しいジョブが作られないよう、ジョブの完了前にキャッシュへ保存する
+        self.playlists_db.put_cached_playlist(
+            playlist_cache_key(job.videoIDs),
+            YoutubePlaylist(
+                id=playlist_id,
+                title=job.title,
+                description=job.description,
+                createdAt=datetime.now(),
+                videoIDs=job.videoIDs,
+            ),
+            self.max_cache_entries,
         )
+        self.playlists_db.finish_job(job_id, "completed")
+        logger.info(f"Playlist job {job_id} completed with {len(job.videoIDs)} videos.")
+
+    async def _request_with_retry(self, job_id: str, request: Callable[[], Awaitable[int]]) -> int:
+        """リクエストを指数バックオフでリトライし、最終的なステータスコードを返す"""
+        status = 503
+        for attempt in range(self.max_retries + 1):
+            try:
+                status = await request()
+            except httpx.TransportError as e:
+                logger.warning(f"Network error in playlist job {job_id}: {e}")
+                status = 503
+
+            if status == 200:
+                return status
+
+            if status == 401:
+                # アクセストークンの期限切れ
+                await self.oauth_client.refresh_access_token()
+            elif status not in RETRYABLE_STATUS:
+                return status
+
+            if attempt == self.max_retries:
+                break
+
+            self.playlists_db.record_retry(job_id, f"YouTube Data API returned {status}", self.lease_seconds)
+            delay = self.retry_base_delay * 2**attempt + random.uniform(0, self.retry_base_delay)
+            await asyncio.sleep(min(delay, 60))
 
-        self.playlists[tuple_video_ids] = playlist
+        return status
 
-        return playlist
+    def _fail(self, job_id: str, status: int, default_message: str):
+        logger.warning(f"Playlist job {job_id} failed with status {status}.")
+        self.playlists_db.finish_job(job_id, "failed", ERROR_MESSAGES.get(status, default_message))
@@ -0,0 +1,149 @@
+"""
+IDトークンのキャッシュのテストスクリプト
+"""
+
+import sys
+import os
+import threading
+import time
+from types import SimpleNamespace
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+from firebase_admin import auth
+
+from src.utils.auth import FirebaseUserDirectory, VerifiedTokenCache
+
+
+def fake_verify_id_token(calls: list[str]):
+    def verify(token: str) -> dict:
+        calls.append(token)
+        if token.startswith("invalid"):
+            raise auth.InvalidIdTokenError("invalid token")
+
+        expired = token.startswith("expired")
+        return {"uid": token, "iat": time.time(), "exp": time.time() + (-1 if expired else 3600)}
+
+    return verify
+
+
+def test_token_cache(monkeypatch):
+    calls = []
+    monkeypatch.setattr(auth, "verify_id_token", fake_verify_id_token(calls))
+    cache = VerifiedTokenCache(max_size=2)
+
+    print("1. 2回目以降はキャッシュから返す")
+    assert cache.verify("token-a")["uid"] == "token-a"
+    assert cache.verify("token-a")["uid"] == "token-a"
+    assert calls == ["token-a"]
+    assert cache.hits == 1
+
+    print("2. 無効なトークンはキャッシュせずに拒否する")
+    for _ in range(2):
+        with pytest.raises(auth.InvalidIdTokenError):
+            cache.verify("invalid-token")
+    assert calls.count("invalid-token") == 2
+
+    print("3. 有効期限切れのトークンは再検証する")
+    cache.verify("expired-token")
+    cache.verify("expired-token")
+    assert calls.count("expired-token") == 2
+
+    print("4. 上限を超えると最後に使われた時刻の古い順に削除する")
+    calls.clear()
+    cache.clear()
+    for token in ["token-a", "token-b", "token-a", "token-c", "token-a", "token-b"]:
+        cache.verify(token)
+    assert calls == ["token-a", "token-b", "token-c", "token-b"]
+
+
+def test_token_revocation(monkeypatch):
+    calls = []
+    monkeypatch.setattr(auth, "verify_id_token", fake_verify_id_token(calls))
+    revoked_after = time.time() + 10
+    get_users_threads = []
+
+    def get_users(identifiers):
+        get_users_threads.append(threading.current_thread().name)
+        return SimpleNamespace(
+            users=[
+                SimpleNamespace(
+                    uid=identifier.uid,
+                    disabled=False,
+                    # token-revoked は全てのトークンが失効している
+                    tokens_valid_after_timestamp=revoked_after * 1000 if identifier.uid == "token-revoked" else 0,
+                )
+                for identifier in identifiers
+            ]
+        )
+
+    monkeypatch.setattr(auth, "get_users", get_users)
+    cache = VerifiedTokenCache(revocation_check_interval=0)
+
+    print("5. 失効の確認はバックグラウンドで行い、失効したトークンはキャッシュから削除する")
+    cache.verify("token-a")
+    cache.verify("token-revoked")
+    cache.verify("token-a")
+    cache._revocation_task.result(timeout=5)
+    assert get_users_threads and all(name.startswith("token-revocation") for name in get_users_threads)
+
+    cache.verify("token-a")
+    cache.verify("token-revoked")
+    assert calls == ["token-a", "token-revoked", "token-revoked"]
+    # 次のテストに影響しないよう、実行中の確認の終了を待つ
+    cache._revocation_task.result(timeout=5)
+
+
+def fake_get_users(requests: list[list[str]], existing: set[str]):
+    def get_users(identifiers):
+        uids = [identifier.uid for identifier in identifiers]
+        requests.append(uids)
+        return SimpleNamespace(
+            users=[
+                SimpleNamespace(uid=uid, photo_url=f"https://example.com/{uid}.png", provider_data=[None])
+                for uid in uids
+                if uid in existing
+            ]
+        )
+
+    return get_users
+
+
+def test_firebase_user_directory(monkeypatch):
+    requests: list[list[str]] = []
+    monkeypatch.setattr(auth, "get_users", fake_get_users(requests, {"u1", "u2", "u3"}))
+    directory = FirebaseUserDirectory(ttl=60, batch_size=2, max_size=3)
+
+    print("6. キャッシュに無いユーザーは batch_size ずつまとめて取得する")
+    users = directory.get_many(["u1", "u2", "u3"])
+    assert set(users) == {"u1", "u2", "u3"}
+    assert sorted(len(uids) for uids in requests) == [1, 2]
+
+    print("7. 有効期限内は Firebase に問い合わせない")
+    requests.clear()
+    assert directory.get("u1").firebaseUID == "u1"
+    assert requests == [] and directory.hits == 1
+
+    print("8. 存在しないUIDも記録し、再度問い合わせない")
+    assert directory.get("missing") is None
+    assert directory.get("missing") is None
+    assert requests == [["missing"]]
+
+    print("9. 上限を超えると最後に使われた時刻の古い順に削除する")
+    # u1 は直前に使ったため残り、u2・u3 のどちらかが削除される
+    assert len(directory._entries) == 3
+    assert "u1" in directory._entries and "missing" in directory._entries
+
+    print("10. 有効期限切れのユーザーはキャッシュの値を返し、バックグラウンドで取得し直す")
+    requests.clear()
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 120)
+    assert directory.get("u1").firebaseUID == "u1"
+    directory._executor.submit(lambda: None).result(timeout=5)
+    assert requests == [["u1"]]
+    assert directory._entries["u1"][1] == now + 120
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
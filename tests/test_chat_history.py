@@ -0,0 +1,44 @@
+"""
+共有チャットの履歴のテストスクリプト
+"""
+
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from src.db.chat_database import ChatDatabase
+from src.utils.chat import ChatHistory
+
+
+def make_message(i: int) -> dict:
+    return {"type": "post", "timestamp": 1694000000 + i, "chatID": f"chat{i}", "content": f"メッセージ{i}"}
+
+
+def test_chat_history(tmp_path):
+    db_path = str(tmp_path / "test_chat.db")
+    history = ChatHistory(ChatDatabase(db_path), capacity=3)
+
+    print("1. メモリ上には新しい順に capacity 件だけ保持する")
+    for i in range(5):
+        history.append(make_message(i))
+    assert len(history) == 3
+    assert [message["chatID"] for message in history.recent(20)] == ["chat2", "chat3", "chat4"]
+
+    print("2. 削除したメッセージは履歴から消える")
+    history.delete("chat3")
+    assert [message["chatID"] for message in history.recent(20)] == ["chat2", "chat4"]
+
+    print("3. メモリ上に無い古い履歴はデータベースから取得する")
+    assert [message["chatID"] for message in history.page("chat4", 1)] == ["chat2"]
+    assert [message["chatID"] for message in history.page("chat4", 3)] == ["chat0", "chat1", "chat2"]
+
+    print("4. 再起動後もデータベースから履歴を復元する")
+    restored = ChatHistory(ChatDatabase(db_path), capacity=3)
+    assert [message["chatID"] for message in restored.recent(20)] == ["chat1", "chat2", "chat4"]
+
+
+if __name__ == "__main__":
+    import pytest
+
+    pytest.main([__file__])
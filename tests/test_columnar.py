@@ -0,0 +1,105 @@
+"""
+列ごとの配列での絞り込み・類似度の計算のテストスクリプト（SongsMatchScore と結果が一致するか）
+"""
+
+import sys
+import os
+import random
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from src.db.songs_database import SongsDatabase
+from src.utils.songs import Song, SongsCustomParameters, SongsMatchScore
+
+NAMES = ["初音ミク", "可不", "重音テトSV", "GUMI", "鏡音リン"]
+
+
+def make_songs(count: int) -> list[Song]:
+    rng = random.Random(1)
+    songs = []
+    for i in range(count):
+        lyrics = rng.choice([None, [0.0, 0.0, 0.0], [rng.uniform(-1, 1) for _ in range(3)]])
+        songs.append(
+            Song(
+                id=f"song{i:04d}",
+                title=f"テスト楽曲{i}",
+                publishedTimestamp=1600000000 + i * 3600,
+                publishedType=rng.choice([-1, 0, 1]),
+                vocal=rng.choice([["初音ミク"], ["可不"], ["初音ミク", "可不"], ["GUMI"], ["-"]]),
+                illustrations=rng.choice([["まころん"], ["みふる"], []]),
+                movie=rng.choice([["瀬戸わらび"], ["よろ"]]),
+                bpm=rng.randint(80, 200),
+                mainKey=rng.choice([60, 61, 62, 63, 65, 66, -57, -69]),
+                chordRate6451=rng.random(),
+                chordRate4561=rng.random(),
+                mainChord=rng.choice(["6451", "61451", "4561", "1564", ""]),
+                pianoRate=rng.random(),
+                modulationTimes=rng.randint(0, 5),
+                lyricsVector=lyrics,
+            )
+        )
+    # スコアを計算できない楽曲
+    songs.append(Song(id="incomplete", title="未解析", publishedTimestamp=1500000000, publishedType=0))
+    return songs
+
+
+def test_search_nearest_songs(tmp_path):
+    db_path = str(tmp_path / "test_columnar.db")
+    SongsDatabase(db_path).add_songs_batch(make_songs(200))
+    db = SongsDatabase(db_path)
+
+    parameters = SongsCustomParameters(vocal=3, bpm=5, mainKey=2, mainChord=2, lyricsVector=4)
+    cases = [
+        ("song0000", {}, None, False),
+        ("song0001", {"vocal": "初音ミク | 可不"}, None, False),
+        ("song0002", {"mainChord": "6451", "publishedAfter": 1600100000}, parameters, False),
+        ("song0003", {"mainKey": 62, "illustrations": "まころん"}, None, True),
+        ("song0004", {"title": "楽曲1", "publishedType": 0}, parameters, True),
+    ]
+    for target, filters, params, is_reversed in cases:
+        expected = db.find_nearest_song(
+            target, songs=db.search_songs(**filters), limit=20, parameters=params, is_reversed=is_reversed
+        )
+        actual = db.search_nearest_songs(target, limit=20, parameters=params, is_reversed=is_reversed, **filters)
+        print(f"   {target} {filters}: {len(actual)}件")
+
+        assert len(actual) == len(expected)
+        for song, expected_song in zip(actual, expected):
+            assert abs(song.score - expected_song.score) < 1e-9
+
+        # 全ての候補の類似度が SongsMatchScore と一致する
+        columns = db.search_index().columns
+        mask = db.search_index().filter_mask(**filters)
+        for position, score in columns.nearest(columns.positions[target], mask, db.std, 1000, params):
+            song = db.search_index().songs[position]
+            target_song = db.get_song_by_id(target)
+            assert abs(score - SongsMatchScore(song, target_song, db.std, params).get_score()) < 1e-9
+
+
+def test_search_facets(tmp_path):
+    db_path = str(tmp_path / "test_columnar.db")
+    songs = make_songs(200)
+    SongsDatabase(db_path).add_songs_batch(songs)
+    db = SongsDatabase(db_path)
+
+    print("1. 項目ごとの曲の数が、条件に一致する曲を数えた結果と一致する")
+    filters = {"vocal": "初音ミク | 可不", "publishedType": 0}
+    total, facets = db.search_facets(top=100, **filters)
+    matched = db.search_songs(**filters)
+    assert total == len(matched)
+
+    vocal_counts = {}
+    for song in matched:
+        for name in set(song.vocal):
+            vocal_counts[name] = vocal_counts.get(name, 0) + 1
+    assert dict(facets["vocal"]) == vocal_counts
+    assert sum(count for _, count in facets["mainChord"]) == len(matched)
+    assert [count for _, count in facets["mainKey"]] == sorted((count for _, count in facets["mainKey"]), reverse=True)
+
+    print("2. 同じ条件はキャッシュを使い、楽曲データが変更されると集計し直す")
+    assert db.search_facets(top=100, publishedType=0, vocal="初音ミク｜可不") == (total, facets)
+    assert db.facets_cache_hits == 1
+
+    db.delete_song(matched[0].id)
+    assert db.search_facets(top=100, **filters)[0] == total - 1
+    assert db.facets_cache_misses == 2
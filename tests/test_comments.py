@@ -0,0 +1,78 @@
+"""
+コメントのデータベースのテストスクリプト
+"""
+
+import sys
+import os
+import sqlite3
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+from src.db.comment_database import Comment, CommentsDatabase
+from src.db.songs_database import SongsDatabase
+from src.utils.songs import Song
+from src.utils.user_models import User, UserFromDB
+
+
+def make_song(song_id: str) -> Song:
+    return Song(id=song_id, title=song_id, publishedTimestamp=1694000000, publishedType=1, vocal=["初音ミク"])
+
+
+def test_delete_song_removes_stats(tmp_path):
+    db_path = str(tmp_path / "test_comments.db")
+    songs_db = SongsDatabase(db_path)
+    comments_db = CommentsDatabase(db_path)
+    user = UserFromDB(firebaseUID="uid")
+    comments_db.user_db.add_user(user)
+
+    songs_db.add_song(make_song("a"))
+    songs_db.add_song(make_song("b"))
+    for song_id in ("a", "a", "b"):
+        comments_db.add_comment(Comment(songID=song_id, user=User(id=user.id), content="いい曲"), is_guest=False)
+
+    print("1. 曲を削除すると、その曲のコメントと集計も削除される")
+    songs_db.delete_song("a")
+    assert [stats.songID for stats in comments_db.get_comment_stats()] == ["b"]
+    assert comments_db.get_comment_stats(["a"])[0].commentCount == 0
+    assert comments_db.get_comments_by_song("a") == []
+    assert len(comments_db.get_comments_by_song("b")) == 1
+
+    print("2. トリガーの追加前に削除された曲の集計は、起動時に取り除く")
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("DROP TRIGGER songs_delete_comments")
+        conn.commit()
+    songs_db.delete_song("b")
+    assert [stats.songID for stats in comments_db.get_comment_stats()] == ["b"]
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("DELETE FROM comments WHERE songID = 'b'")
+        conn.commit()
+    comments_db = CommentsDatabase(db_path)
+    assert comments_db.get_comment_stats() == []
+
+
+def test_before_cursor(tmp_path):
+    db_path = str(tmp_path / "test_comments.db")
+    comments_db = CommentsDatabase(db_path)
+    user = UserFromDB(firebaseUID="uid")
+    comments_db.user_db.add_user(user)
+    comments = [
+        Comment(songID="a", user=User(id=user.id), content=str(i), createdAt=1700000000 + i) for i in range(3)
+    ]
+    for comment in comments:
+        comments_db.add_comment(comment, is_guest=False)
+
+    print("3. before に指定したコメントより古いコメントを取得する")
+    page = comments_db.get_comments_by_song("a", before=comments[2].id)
+    assert [comment.id for comment in page] == [comments[1].id, comments[0].id]
+    assert comments_db.get_comments_by_song("a", before=comments[0].id) == []
+
+    print("4. 存在しないコメントを before に指定した場合はエラーにする")
+    for get in (
+        lambda: comments_db.get_comments_by_song("a", before="missing"),
+        lambda: comments_db.get_comments_by_user(user.id, before="missing"),
+        lambda: comments_db.get_recent_comments(before="missing"),
+    ):
+        with pytest.raises(ValueError):
+            get()
@@ -0,0 +1,69 @@
+"""
+Discordへのログ送信ハンドラのテストスクリプト
+"""
+
+import sys
+import os
+import asyncio
+import logging
+import queue
+from types import SimpleNamespace
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from src.discordbot.discord_handler import _FLUSH, DiscordHandler, DiscordQueueListener
+
+
+def test_stop_with_full_queue():
+    handler = SimpleNamespace(rate_limit=5, rate_period=5.0)
+    log_queue = queue.Queue(maxsize=3)
+    listener = DiscordQueueListener(log_queue, handler)
+    listener.sentinel_timeout = 0.01
+
+    print("1. キューが満杯でも停止の合図を入れられる（残りのログは破棄した件数に数える）")
+    log_queue.put_nowait(logging.makeLogRecord({"msg": "a"}))
+    log_queue.put_nowait(logging.makeLogRecord({"msg": "b"}))
+    log_queue.put_nowait(_FLUSH)
+    listener.enqueue_sentinel()
+    assert log_queue.get_nowait() is listener._sentinel
+    assert log_queue.empty()
+    assert listener.dropped == 2
+
+    print("2. 空きがあればログを残したまま停止の合図を入れる")
+    log_queue.put_nowait(logging.makeLogRecord({"msg": "c"}))
+    listener.enqueue_sentinel()
+    assert log_queue.get_nowait().msg == "c"
+    assert log_queue.get_nowait() is listener._sentinel
+    assert listener.dropped == 2
+
+
+class FakeBot:
+    def __init__(self, channels: dict):
+        self.channels = channels
+        self.listeners = {}
+
+    def listen(self, name: str):
+        def decorator(func):
+            self.listeners[name] = func
+            return func
+
+        return decorator
+
+    def get_channel(self, channel_id: int):
+        return self.channels.get(channel_id)
+
+    def is_ready(self) -> bool:
+        return False
+
+
+def test_channel_changed_before_ready():
+    channel = SimpleNamespace(id=2)
+    bot = FakeBot({1: SimpleNamespace(id=1), 2: channel})
+    handler = DiscordHandler(1, bot=bot)
+    try:
+        print("3. Botの起動前に送信先のチャンネルIDが変わった場合は、新しいチャンネルに送信する")
+        handler.send_channel = 2
+        asyncio.run(bot.listeners["on_ready"]())
+        assert handler.send_channel is channel
+    finally:
+        handler.close()
@@ -0,0 +1,104 @@
+"""
+表記の揺れ・入力ミスを許容したキーワード検索のテストスクリプト
+"""
+
+import sys
+import os
+import sqlite3
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+from benchmarks.catalog import CatalogGenerator
+from src.db.songs_database import SongsDatabase
+from src.utils.songs import Song
+from src.utils.songs.normalize import normalize_text
+
+
+def make_song(song_id: str, title: str, vocal: list[str], timestamp: int) -> Song:
+    return Song(id=song_id, title=title, publishedTimestamp=timestamp, publishedType=1, vocal=vocal, comment="良き")
+
+
+def test_normalize_variants():
+    print("1. 長音記号・小書きの仮名の違いを揃える")
+    assert normalize_text("ルルージュ") == normalize_text("ﾙﾙｰｼﾞｭ") == normalize_text("ルル〜ジュ")
+    assert normalize_text("チョコレート") == normalize_text("ちよこれと")
+    assert normalize_text("A-B") == "a-b"
+
+
+@pytest.mark.parametrize("backend", ["sqlite", "index"])
+def test_search_songs_fuzzy(tmp_path, backend):
+    db = SongsDatabase(str(tmp_path / "test_fuzzy_search.db"), search_backend=backend)
+    db.add_songs_batch(
+        [
+            make_song("a", "ハナタバ", ["初音ミク"], 1694000000),
+            make_song("b", "ルルージュ", ["可不"], 1694000100),
+            make_song("c", "ゆめまぼろし", ["重音テトSV"], 1694000200),
+        ]
+    )
+
+    def ids(keyword: str) -> list[str]:
+        return [song.id for song in db.search_songs_fuzzy(keyword)]
+
+    print("1. ひらがな・カタカナ・半角カナの違いを区別しない")
+    assert ids("はなたば") == ids("ﾊﾅﾀﾊﾞ") == ids("ハナタバ") == ["a"]
+    assert ids("ルル-ジュ") == ["b"]
+    assert ids("はつねみく") == []
+    assert ids("ハナタバ | ユメ") == ["c", "a"]
+    assert ids("ハナタバ 初音ミク") == ["a"]
+
+    print("2. 一致する曲が無い場合は、似た曲名の曲を返す")
+    assert ids("はなたべ") == ["a"]
+    assert ids("ゆめまぼろい") == ["c"]
+    assert ids("まったく関係ない語") == []
+
+    print("3. search_songs の q と同じく、% と _ はワイルドカードとして扱う")
+    assert ids("はな%ば") == ["a"]
+    assert ids("ゆめ_ぼろし") == ["c"]
+    assert ids("はな_ば") == ["a"]
+    assert ids("はな__ば") == []
+
+    print("4. 検索方法が sqlite の場合は、メモリ上のインデックスを作らない")
+    assert (db._search_index is None) == (backend == "sqlite")
+
+
+def test_search_text_is_kept_current(tmp_path):
+    db_path = str(tmp_path / "test_fuzzy_search.db")
+    db = SongsDatabase(db_path)
+    db.add_songs_batch([make_song("a", "ハナタバ", ["初音ミク"], 1694000000)])
+
+    def ids(keyword: str) -> list[str]:
+        return [song.id for song in db.search_songs_fuzzy(keyword)]
+
+    print("5. 楽曲の追加・更新・削除のたびに、検索用の文字列を作り直す")
+    db.add_song(make_song("b", "ルルージュ", ["可不"], 1694000100))
+    assert ids("るるじゅ") == ["b"]
+    db.update_song(make_song("b2", "ゆめまぼろし", ["可不"], 1694000100), song_id="b")
+    assert ids("るるじゅ") == []
+    assert ids("ユメマボロシ") == ["b2"]
+    db.delete_song("b2")
+    assert ids("ユメマボロシ") == []
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM song_search_terms WHERE songID = 'b2'").fetchone()[0] == 0
+
+    print("6. 検索用の文字列が無い楽曲は、起動時に作る")
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("DELETE FROM song_search_text")
+        conn.execute("DELETE FROM song_search_terms")
+        conn.commit()
+    assert ids("はなたば") == []
+    db.init_database()
+    assert ids("はなたば") == ["a"]
+
+
+def test_backends_return_same_songs(tmp_path):
+    db = SongsDatabase(str(tmp_path / "test_fuzzy_search.db"))
+    db.add_songs_batch(CatalogGenerator(seed=0).songs(300))
+
+    print("7. sqlite とメモリ上のインデックスで、同じ楽曲を返す")
+    for keyword in ("夜", "はーと", "ﾈｵﾝ", "ねおん よる", "love | star", "いらすとれーたー1", "しんでれら%", "めらんこりい", "ない語"):
+        db.search_backend = "sqlite"
+        expected = [song.id for song in db.search_songs_fuzzy(keyword)]
+        db.search_backend = "index"
+        assert [song.id for song in db.search_songs_fuzzy(keyword)] == expected, keyword
@@ -0,0 +1,99 @@
+"""
+メトリクスのテストスクリプト
+"""
+
+import sys
+import os
+from types import SimpleNamespace
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from src.routers import general
+from src.utils.metrics import Counter, Histogram, MetricsMiddleware, Registry, timed_methods
+
+
+def test_render():
+    registry = Registry()
+    counter = Counter("test_errors_total", "エラーの件数", ("endpoint",), registry=registry)
+    histogram = Histogram("test_seconds", "処理時間", buckets=(0.1, 1.0), registry=registry)
+
+    print("1. カウンターとヒストグラムをテキスト形式で出力する")
+    counter.labels('a"b').inc()
+    counter.labels('a"b').inc(2)
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+    histogram.observe(5)
+    text = registry.render()
+    assert 'test_errors_total{endpoint="a\\"b"} 3' in text
+    assert 'test_seconds_bucket{le="0.1"} 1' in text
+    assert 'test_seconds_bucket{le="1"} 2' in text
+    assert 'test_seconds_bucket{le="+Inf"} 3' in text
+    assert "test_seconds_count 3" in text
+    assert "# TYPE test_seconds histogram" in text
+
+    print("2. 取得時に関数を呼んで値を求める")
+    counter.set_function(lambda: 7, "b")
+    assert 'test_errors_total{endpoint="b"} 7' in registry.render()
+
+
+def test_timed_methods():
+    registry = Registry()
+    histogram = Histogram("test_method_seconds", "処理時間", ("database", "method"), registry=registry)
+
+    @timed_methods(histogram, "get")
+    class Database:
+        def get(self, value: int) -> int:
+            return value * 2
+
+        def get_twice(self, value: int) -> int:
+            return self.get(value) + self.get(value)
+
+    print("3. 指定したメソッドだけを計測する")
+    assert Database().get_twice(2) == 8
+    text = registry.render()
+    assert 'test_method_seconds_count{database="Database",method="get"} 2' in text
+    assert "get_twice" not in text
+
+    with pytest.raises(AttributeError):
+        timed_methods(histogram, "missing")(Database)
+
+
+def test_middleware():
+    registry = Registry()
+    histogram = Histogram("test_http_seconds", "処理時間", ("method", "route", "status"), registry=registry)
+
+    app = FastAPI()
+    app.include_router(general.router)
+    config = SimpleNamespace(metrics_token=None)
+    app.state.config_store = SimpleNamespace(snapshot=SimpleNamespace(config=config))
+
+    @app.get("/items/{item_id}")
+    async def item(item_id: int):
+        return {"id": item_id}
+
+    app.add_middleware(MetricsMiddleware, histogram=histogram)
+    client = TestClient(app)
+
+    print("4. パスのテンプレートをルートのラベルにする")
+    client.get("/items/1")
+    client.get("/items/2")
+    client.get("/not-found")
+    text = registry.render()
+    assert 'test_http_seconds_count{method="GET",route="/items/{item_id}",status="200"} 2' in text
+    assert 'test_http_seconds_count{method="GET",route="unmatched",status="404"} 1' in text
+
+    print("5. /metrics でメトリクスを取得する")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "db_query_duration_seconds" in response.text
+
+    print("6. metrics_token を設定した場合は、トークンが一致する場合のみ取得できる")
+    config.metrics_token = "secret"
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer secret"}).status_code == 200
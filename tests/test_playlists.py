@@ -0,0 +1,197 @@
+"""
+プレイリスト作成ジョブのテストスクリプト（YouTube Data API の代わりに FakeOAuthClient を使う）
+"""
+
+import sys
+import os
+import asyncio
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import httpx
+
+from src.db.playlist_database import PlaylistJob, PlaylistsDatabase
+from src.utils.youtube import api
+from src.utils.youtube.api import REFRESH_JOB_ID, OAuthClient
+from src.utils.youtube.playlists import PlaylistManager
+
+
+class FakeOAuthClient:
+    def __init__(self, item_statuses: list[int] | None = None):
+        # insert_playlist_item が順に返すステータス（空になった後は 200）
+        self.item_statuses = list(item_statuses or [])
+        self.playlists: list[str] = []
+        self.items: list[tuple[str, str]] = []
+        self.refresh_count = 0
+
+    async def insert_playlist(self, title: str, description: str) -> dict:
+        playlist_id = f"PL{len(self.playlists)}"
+        self.playlists.append(title)
+        return {"id": playlist_id}
+
+    async def insert_playlist_item(self, playlist_id: str, video_id: str) -> int:
+        status = self.item_statuses.pop(0) if self.item_statuses else 200
+        if status == 200:
+            self.items.append((playlist_id, video_id))
+        return status
+
+    async def refresh_access_token(self) -> dict:
+        self.refresh_count += 1
+        return {}
+
+
+def make_manager(tmp_path, oauth_client: FakeOAuthClient) -> PlaylistManager:
+    return PlaylistManager(
+        oauth_client, PlaylistsDatabase(str(tmp_path / "test_playlists.db")), retry_base_delay=0.001, max_retries=3
+    )
+
+
+async def wait_for_job(manager: PlaylistManager, job_id: str) -> PlaylistJob:
+    for _ in range(500):
+        job = manager.get_job(job_id)
+        if job.status in ("completed", "failed"):
+            return job
+        await asyncio.sleep(0.01)
+    raise TimeoutError(job_id)
+
+
+def test_worker(tmp_path):
+    async def run():
+        oauth_client = FakeOAuthClient()
+        manager = make_manager(tmp_path, oauth_client)
+        await manager.start()
+        try:
+            print("1. ワーカーがジョブを処理し、作成したプレイリストをキャッシュする")
+            job = manager.submit_playlist("テスト", "説明", ["a", "b", "c"])
+            job = await wait_for_job(manager, job.id)
+            assert job.status == "completed"
+            assert oauth_client.items == [("PL0", "a"), ("PL0", "b"), ("PL0", "c")]
+
+            cached = manager.submit_playlist("テスト", "説明", ["c", "b", "a"])
+            assert cached.status == "completed" and cached.playlistID == "PL0"
+            assert len(oauth_client.playlists) == 1
+        finally:
+            await manager.stop()
+
+    asyncio.run(run())
+
+
+def test_resume_after_restart(tmp_path):
+    async def run():
+        oauth_client = FakeOAuthClient()
+        manager = make_manager(tmp_path, oauth_client)
+
+        print("2. 途中まで処理したジョブを、起動時に続きから再開する")
+        job = PlaylistJob(title="再開", description="", videoIDs=["a", "b", "c"], playlistID="PL9", position=2)
+        manager.playlists_db.add_job(job)
+        await manager.start()
+        try:
+            job = await wait_for_job(manager, job.id)
+            assert job.status == "completed"
+            assert oauth_client.playlists == []
+            assert oauth_client.items == [("PL9", "c")]
+        finally:
+            await manager.stop()
+
+    asyncio.run(run())
+
+
+def test_retry(tmp_path):
+    async def run():
+        print("3. 一時的なエラーと 401 はリトライし、401 ではアクセストークンを取得し直す")
+        oauth_client = FakeOAuthClient(item_statuses=[503, 401, 429])
+        manager = make_manager(tmp_path, oauth_client)
+        await manager.start()
+        try:
+            job = manager.submit_playlist("リトライ", "", ["a"])
+            job = await wait_for_job(manager, job.id)
+            assert job.status == "completed"
+            assert job.attempts == 3
+            assert oauth_client.refresh_count == 1
+        finally:
+            await manager.stop()
+
+        print("4. リトライしないエラーはすぐに失敗にする")
+        oauth_client = FakeOAuthClient(item_statuses=[403])
+        manager = make_manager(tmp_path, oauth_client)
+        await manager.start()
+        try:
+            job = manager.submit_playlist("失敗", "", ["x"])
+            job = await wait_for_job(manager, job.id)
+            assert job.status == "failed"
+            assert job.attempts == 0
+            assert "not able to request" in job.error
+        finally:
+            await manager.stop()
+
+        print("5. リトライの上限に達したら失敗にする")
+        oauth_client = FakeOAuthClient(item_statuses=[503] * 10)
+        manager = make_manager(tmp_path, oauth_client)
+        await manager.start()
+        try:
+            job = manager.submit_playlist("上限", "", ["y"])
+            job = await wait_for_job(manager, job.id)
+            assert job.status == "failed"
+            assert job.attempts == manager.max_retries
+        finally:
+            await manager.stop()
+
+    asyncio.run(run())
+
+
+def test_submitter(tmp_path):
+    print("8. ジョブには登録したユーザーを保存し、同じ動画でも他のユーザーのジョブにはまとめない")
+    manager = make_manager(tmp_path, FakeOAuthClient())
+    job_a = manager.submit_playlist("A", "", ["a", "b"], submitted_by="uid-a")
+    assert manager.get_job(job_a.id).submittedBy == "uid-a"
+    assert manager.submit_playlist("A", "", ["b", "a"], submitted_by="uid-a").id == job_a.id
+
+    job_b = manager.submit_playlist("B", "", ["a", "b"], submitted_by="uid-b")
+    assert job_b.id != job_a.id
+    assert manager.get_job(job_b.id).submittedBy == "uid-b"
+
+    print("9. 登録したユーザーはレスポンスに含めない")
+    assert "submittedBy" not in job_a.model_dump()
+
+
+def test_refresh_schedule(monkeypatch):
+    async def fake_request(client, endpoint, method, url, **kwargs):
+        return httpx.Response(200, json={"access_token": "token", "expires_in": 3600})
+
+    monkeypatch.setattr(api, "_request", fake_request)
+
+    async def run():
+        print("6. 何度アクセストークンを取得し直しても、次回の取得の予定は1つだけ")
+        client = OAuthClient()
+        await client.start()
+        try:
+            for _ in range(3):
+                await client.refresh_access_token()
+            jobs = client.scheduler.get_jobs()
+            assert [job.id for job in jobs] == [REFRESH_JOB_ID]
+        finally:
+            client.scheduler.shutdown(wait=False)
+
+    asyncio.run(run())
+
+
+def test_refresh_on_config_change(monkeypatch):
+    async def fake_request(client, endpoint, method, url, **kwargs):
+        return httpx.Response(200, json={"access_token": "token", "expires_in": 3600})
+
+    monkeypatch.setattr(api, "_request", fake_request)
+
+    async def run():
+        print("7. 認証情報が変わるたびに取得し直しても、次回の取得の予定は1つだけ")
+        client = OAuthClient()
+        await client.start()
+        try:
+            for i in range(3):
+                # 前回とは異なる認証情報で取得したことにする
+                client._credentials_used = ("old", str(i), "")
+                await client.on_config_change(api.config_store.snapshot)
+            assert [job.id for job in client.scheduler.get_jobs()] == [REFRESH_JOB_ID]
+        finally:
+            client.scheduler.shutdown(wait=False)
+
+    asyncio.run(run())
@@ -0,0 +1,87 @@
+"""
+メモリ上の検索用インデックスのテストスクリプト（SQLでの検索と結果が一致するか）
+"""
+
+import sys
+import os
+import random
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from src.db.songs_database import SongsDatabase
+from src.utils.songs import Song
+
+NAMES = ["初音ミク", "可不", "重音テト", "GUMI", "鏡音リン", "熊谷 芙美子"]
+WORDS = ["ハナタバ", "ルルージュ", "ゆめまぼろし", "Love", "LOVE song", "疾走感", "ノリが良い", "良き", "6251"]
+
+
+def make_songs(count: int) -> list[Song]:
+    rng = random.Random(0)
+    songs = []
+    for i in range(count):
+        songs.append(
+            Song(
+                id=f"song{i:04d}",
+                title=" ".join(rng.sample(WORDS, 2)),
+                publishedTimestamp=1600000000 + i * 3600,
+                publishedType=rng.choice([-1, 0, 1]),
+                vocal=rng.sample(NAMES, rng.randint(1, 2)),
+                illustrations=rng.sample(NAMES, 1),
+                movie=[] if i % 5 == 0 else rng.sample(NAMES, 1),
+                bpm=rng.choice([None, 120, 150, 180]),
+                mainKey=rng.choice([60, 62, 63, -67]),
+                mainChord=rng.choice(["6451", "4561", "61451", None]),
+                comment=None if i % 4 == 0 else " ".join(rng.sample(WORDS, 3)),
+            )
+        )
+    return songs
+
+
+def test_search_index_matches_sql(tmp_path):
+    db = SongsDatabase(str(tmp_path / "test_search_index.db"))
+    db.add_songs_batch(make_songs(300))
+    index = db.search_index()
+
+    cases = [
+        {"q": "初音ミク"},
+        {"q": "love"},
+        {"q": "ハナタバ ミク"},
+        {"q": "ハナタバ | ルルージュ 良"},
+        {"q": '"熊谷 芙美子" | GUMI'},
+        {"q": "ノリ_良"},
+        {"q": "存在しない語"},
+        {"title": "LOVE　song", "publishedType": 1},
+        {"comment": "疾走感 6251"},
+        {"vocal": "初音ミク 可不"},
+        {"illustrations": "可不 | 重音テト", "mainKey": 62},
+        {"movie": "GUMI", "mainChord": "6451"},
+        {"publishedAfter": 1600100000, "publishedBefore": 1600500000},
+        {"id": "song0042"},
+        {},
+    ]
+    for case in cases:
+        for order, asc in [(None, False), ("id", True), ("bpm", True), ("bpm", False), ("title", False)]:
+            expected = db.search_songs(**case, order=order, asc=asc)
+            actual = index.search(**case, order=order, asc=asc)
+            print(f"   {case} order={order} asc={asc}: {len(actual)}件")
+
+            assert {song.id for song in actual} == {song.id for song in expected}
+            # 並び替えの基準の値が同じ曲同士の順序は決まらないため、基準の値の並びのみを比べる
+            key = order or "publishedTimestamp"
+            assert [getattr(song, key) for song in actual] == [getattr(song, key) for song in expected]
+
+
+def test_search_index_rebuild(tmp_path):
+    db = SongsDatabase(str(tmp_path / "test_search_index.db"), search_backend="index")
+    songs = make_songs(10)
+    db.add_songs_batch(songs[:5])
+    assert len(db.search_songs()) == 5
+
+    print("1. 楽曲データが変更されるとインデックスを作り直す")
+    db.add_songs_batch(songs[5:])
+    assert len(db.search_songs()) == 10
+    index = db.search_index()
+    assert db.search_index() is index
+
+    db.delete_song(songs[0].id)
+    assert songs[0].id not in {song.id for song in db.search_songs()}
@@ -0,0 +1,66 @@
+"""
+検索キーワードの構文解析とSQLの組み立てのテストスクリプト
+"""
+
+import sys
+import os
+import sqlite3
+import threading
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+from src.db.search_query import OrTerm, build_search, keyword_to_query, parse_keyword
+from src.db.songs_database import SongsDatabase
+
+
+def test_parse_keyword():
+    print("1. スペースでAND、| と OR でOR")
+    assert parse_keyword("初音ミク 可不") == (OrTerm(("初音ミク",)), OrTerm(("可不",)))
+    assert parse_keyword("にんじん | saewool OR 可不") == (OrTerm(("にんじん", "saewool", "可不")),)
+
+    print("2. 全角の空白・記号は半角と同じに扱う")
+    assert parse_keyword("初音ミク　可不｜GUMI") == parse_keyword("初音ミク 可不|GUMI")
+
+    print("3. 引用符で囲んだ語は空白や | を含められる")
+    assert parse_keyword('"熊谷 芙美子" "a|b"') == (OrTerm(("熊谷 芙美子",)), OrTerm(("a|b",)))
+
+    print("4. 閉じられていない引用符は普通の文字として扱う")
+    assert parse_keyword("Don't stop") == (OrTerm(("Don't",)), OrTerm(("stop",)))
+
+    print("5. 空のキーワードには条件が無い")
+    assert parse_keyword("  ") == ()
+    assert keyword_to_query("x|y z", "title LIKE ?", "%{}%") == (
+        ["(title LIKE ? OR title LIKE ?)", "(title LIKE ?)"],
+        ["%x%", "%y%", "%z%"],
+    )
+
+
+def test_build_search():
+    print("1. 同じ形の検索は同じSQLになる")
+    sql1, params1 = build_search(vocal="初音ミク 可不", mainChord="6451", order="bpm")
+    sql2, params2 = build_search(mainChord="4561", vocal="GUMI 重音テト", order="bpm")
+    assert sql1 == sql2
+    assert params1 == ["6451", "初音ミク", "可不"]
+    assert params2 == ["4561", "GUMI", "重音テト"]
+
+    print("2. 列に無い並び順は既定の並び順にする")
+    sql, _ = build_search(q="ミク", order="similarityScore", asc=True)
+    assert sql.endswith("ORDER BY publishedTimestamp ASC")
+
+
+def test_close_read_connections(tmp_path):
+    db = SongsDatabase(str(tmp_path / "test_search_query.db"))
+    db.search_songs(q="ミク")
+    thread = threading.Thread(target=lambda: db.search_songs(vocal="可不"))
+    thread.start()
+    thread.join()
+
+    print("3. close() でスレッドごとの検索用の接続を全て閉じる")
+    connections = list(db._read_connections)
+    assert len(connections) == 2
+    db.close()
+    for conn in connections:
+        with pytest.raises(sqlite3.ProgrammingError):
+            conn.execute("SELECT 1")
@@ -0,0 +1,86 @@
+"""
+入力補完のテストスクリプト
+"""
+
+import sys
+import os
+import threading
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from src.db.songs_database import SongsDatabase
+from src.utils.songs import Song, TypeaheadIndex
+from src.utils.songs.normalize import normalize_text, romaji_to_hiragana
+
+
+def make_song(song_id: str, title: str, vocal: list[str]) -> Song:
+    return Song(id=song_id, title=title, publishedTimestamp=1694000000, publishedType=1, vocal=vocal)
+
+
+def test_normalize():
+    print("1. 全角・半角、カタカナ・ひらがなの違いを揃える")
+    assert normalize_text("ﾊﾅﾀﾊﾞ") == normalize_text("ハナタバ") == "はなたば"
+    assert normalize_text("ＧＵＭＩ　さん") == "gumi さん"
+
+    print("2. ローマ字をひらがなにする（入力途中の子音は取り除く）")
+    assert romaji_to_hiragana("hanataba") == "はなたば"
+    assert romaji_to_hiragana("shinsekai") == "しんせかい"
+    assert romaji_to_hiragana("hanat") == "はな"
+    assert romaji_to_hiragana("初音") is None
+
+
+def test_typeahead(tmp_path):
+    index = TypeaheadIndex(
+        [
+            make_song("a", "ハナタバ", ["初音ミク"]),
+            make_song("b", "はなび", ["初音ミク", "可不"]),
+            make_song("c", "ルルージュ feat. 初音ミク", ["可不"]),
+        ]
+    )
+
+    print("1. 曲の数が多い順に候補を返す")
+    assert [s.text for s in index.suggest("初音")] == ["初音ミク", "ルルージュ feat. 初音ミク"]
+    assert index.suggest("初音")[0].count == 2
+
+    print("2. ひらがな・カタカナ・ローマ字のどれでも補完できる")
+    assert {s.text for s in index.suggest("hana")} == {"ハナタバ", "はなび"}
+    assert {s.text for s in index.suggest("ﾊﾅ")} == {"ハナタバ", "はなび"}
+    assert [s.text for s in index.suggest("feat")] == ["ルルージュ feat. 初音ミク"]
+
+    print("3. 楽曲の追加・更新・削除を差分で反映する")
+    db = SongsDatabase(str(tmp_path / "test_typeahead.db"))
+    db.add_song(make_song("a", "ハナタバ", ["初音ミク"]))
+    typeahead = db.typeahead()
+
+    db.add_song(make_song("b", "ハナミズキ", ["可不"]))
+    assert {s.text for s in typeahead.suggest("hana")} == {"ハナタバ", "ハナミズキ"}
+
+    db.update_song(make_song("b", "はなうた", ["可不"]))
+    assert {s.text for s in typeahead.suggest("hana")} == {"ハナタバ", "はなうた"}
+
+    db.delete_song("a")
+    assert [s.text for s in typeahead.suggest("hana")] == ["はなうた"]
+    assert db.typeahead() is typeahead
+
+
+def test_typeahead_external_writes(tmp_path):
+    db_path = str(tmp_path / "test_typeahead_external.db")
+    db = SongsDatabase(db_path)
+    other = SongsDatabase(db_path)
+    db.add_song(make_song("a", "ハナタバ", ["初音ミク"]))
+    db.typeahead()
+
+    print("4. 他のインスタンスからの書き込みの後に、このインスタンスで書き込んでも両方を反映する")
+    other.add_song(make_song("b", "ハナミズキ", ["可不"]))
+    db.add_song(make_song("c", "はなうた", ["GUMI"]))
+    assert {s.text for s in db.typeahead().suggest("hana")} == {"ハナタバ", "ハナミズキ", "はなうた"}
+
+    print("5. 同時に書き込んでも、全ての楽曲を反映する")
+    threads = [
+        threading.Thread(target=db.add_song, args=(make_song(f"t{i}", f"はなことば{i}", ["可不"]),)) for i in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(db.typeahead().suggest("はなことば", limit=20)) == 8